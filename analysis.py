@@ -1,29 +1,264 @@
-from pandas import read_csv,DataFrame,options,Series
+import io
+import os
+import numpy as np
+from typing import Iterable
+from pandas import read_csv,concat,factorize,DataFrame,options,Series
 options.display.float_format = '{:,.4f}'.format
+# Results are read in pieces of about this many bytes (CSV) or one store chunk at a time, so memory stays bounded
+DEFAULT_PART_BYTES:int = 64*1024*1024
+DEFAULT_CHUNK_ROWS:int = 1_000_000
 
-def analyze_national_data():
-    df:DataFrame = read_csv("National_Results - Copy.csv")
-    
-    df_states_mean:DataFrame = DataFrame(df.mean()).T
-    df_states_mean.drop("Round",axis=1).to_csv("analysis/National_Results_Means.csv",index=False)
-    df_states_mean.drop("Round",axis=1).to_html("analysis/National_Results_Means.html",index=False)
-    
-    df[(df["Republican Votes"] > df["Democrat Votes"])&(df["Republican Electoral Votes"] < df["Democrat Electoral Votes"])].to_html("analysis/Republican_Popular_Democrat_Electoral.html",index=False)
-    df[(df["Republican Votes"] < df["Democrat Votes"])&(df["Republican Electoral Votes"] > df["Democrat Electoral Votes"])].to_html("analysis/Democrat_Popular_Republican_Electoral.html",index=False)
+def load_national_results(source:str,nrows:int|None=None) -> DataFrame:
+    # source is either a results CSV or a result_store directory written by simulator.main(output="store")
+    if os.path.isdir(source):
+        from result_store import read_national_results
+        return read_national_results(source)
+    return read_csv(source,nrows=nrows)
 
+def load_state_results(source:str,nrows:int|None=None) -> DataFrame:
+    if os.path.isdir(source):
+        from result_store import read_state_results
+        return read_state_results(source)
+    return read_csv(source,nrows=nrows)
 
-def analyze_state_data():
-    df:DataFrame = read_csv("State_Results - Copy.csv")
-    df_states_mean:DataFrame = df.groupby("State").mean(numeric_only=True)
-    df_states_mean.insert(0, "State", sorted(df["State"].unique()))
-    df_states_mean.drop(["Round","Electoral Votes"],axis=1).to_csv("analysis/State_Results_Means.csv",index=False)
-    df_states_mean.drop(["Round","Electoral Votes"],axis=1).to_html("analysis/State_Results_Means.html",index=False)
+def write_national_outputs(df_national_mean:DataFrame,df_rep_popular_dem_electoral:DataFrame,df_dem_popular_rep_electoral:DataFrame):
+    df_national_mean.to_csv("analysis/National_Results_Means.csv",index=False)
+    df_national_mean.to_html("analysis/National_Results_Means.html",index=False)
+    df_rep_popular_dem_electoral.to_html("analysis/Republican_Popular_Democrat_Electoral.html",index=False)
+    df_dem_popular_rep_electoral.to_html("analysis/Democrat_Popular_Republican_Electoral.html",index=False)
 
-    df.groupby(["State","Winner"]).count().reset_index(drop=False).to_html("analysis/State_Winners.html",index=True)
+def write_state_outputs(df_states_mean:DataFrame,df_state_winners:DataFrame):
+    df_states_mean.to_csv("analysis/State_Results_Means.csv",index=False)
+    df_states_mean.to_html("analysis/State_Results_Means.html",index=False)
+    df_state_winners.to_html("analysis/State_Winners.html",index=True)
 
-def main():
-    analyze_national_data()
-    analyze_state_data()
+def csv_parts(file_name:str,part_bytes:int=DEFAULT_PART_BYTES,limit_bytes:int|None=None) -> tuple[list[str],list[tuple[int,int]]]:
+    # Splits a results CSV into byte ranges that start and end on row boundaries, so each can be parsed on its own
+    end_of_data:int = os.path.getsize(file_name) if limit_bytes is None else min(limit_bytes,os.path.getsize(file_name))
+    with open(file_name,'rb') as file:
+        header:bytes = file.readline()
+        if not header:
+            return [],[]
+        columns:list[str] = read_csv(io.BytesIO(header)).columns.tolist()
+        starts:list[int] = [file.tell()]
+        while starts[-1]+part_bytes < end_of_data:
+            file.seek(starts[-1]+part_bytes)
+            file.readline()
+            if file.tell() >= end_of_data:
+                break
+            starts.append(file.tell())
+    return columns,[(start,end) for start,end in zip(starts,starts[1:]+[end_of_data]) if end > start]
+
+def _read_csv_part(file_name:str,columns:list[str],start:int,end:int) -> DataFrame:
+    with open(file_name,'rb') as file:
+        file.seek(start)
+        data:bytes = file.read(end-start)
+    return read_csv(io.BytesIO(data),header=None,names=columns)
+
+def _read_part(source:str,table:str,part) -> DataFrame:
+    # part is a store chunk entry for a directory source, or (columns, start, end) for a CSV
+    if os.path.isdir(source):
+        from result_store import read_manifest,read_chunk,national_frame,state_frame
+        columns:dict[str,np.ndarray] = read_chunk(source,part,table,mmap=True)
+        return national_frame(columns) if table=="national" else state_frame(columns,read_manifest(source))
+    return _read_csv_part(source,*part)
+
+def kahan_sums(values:np.ndarray,lengths:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    # The per-group Kahan summation of pandas' group_mean over one part, returned as (sums, compensations) per
+    # [state, column]. values is [row, state, column], padded past each state's length; every state is stepped at once.
+    sums:np.ndarray = np.zeros(values.shape[1:],dtype=np.float64)
+    compensations:np.ndarray = np.zeros(values.shape[1:],dtype=np.float64)
+    for row in range(values.shape[0]):
+        active:np.ndarray = (row < lengths)[:,None]
+        y:np.ndarray = values[row]-compensations
+        t:np.ndarray = sums+y
+        # Same steps as pandas' group_mean, including resetting a NaN compensation
+        np.copyto(compensations,np.nan_to_num((t-sums)-y,nan=0.0,posinf=np.inf,neginf=-np.inf),where=active)
+        np.copyto(sums,t,where=active)
+    return sums,compensations
+
+def neumaier_add(total:np.ndarray,correction:np.ndarray,sums:np.ndarray,compensations:np.ndarray) -> None:
+    # Folds one part's Kahan (sums, compensations) into the running (total, correction) in place; the result is
+    # total+correction. Kahan's compensation is the negative of the low-order part its sum lost.
+    t:np.ndarray = total+sums
+    correction += np.where(np.abs(total) >= np.abs(sums),(total-t)+sums,(sums-t)+total)-compensations
+    total[...] = t
+
+def national_partial(df:DataFrame) -> dict:
+    split_rep:Series = (df["Republican Votes"] > df["Democrat Votes"])&(df["Republican Electoral Votes"] < df["Democrat Electoral Votes"])
+    split_dem:Series = (df["Republican Votes"] < df["Democrat Votes"])&(df["Republican Electoral Votes"] > df["Democrat Electoral Votes"])
+    # DataFrame.mean() sums each float column with numpy's pairwise sum, which only the whole column reproduces. The
+    # national table has one row per round (1/51 of the state rows), so its float columns are kept whole.
+    return {
+            "count": len(df),
+            "sums": {column: int(df[column].sum()) for column in df.columns if df[column].dtype.kind in "iu"},
+            "float_columns": {column: df[column].to_numpy(dtype=np.float64) for column in df.columns if df[column].dtype.kind not in "iu"},
+            "rep_popular_dem_electoral": df[split_rep],
+            "dem_popular_rep_electoral": df[split_dem]
+        }
+
+def state_partial(df:DataFrame) -> dict:
+    # Per-state row counts, exact integer column sums, Kahan sums of the float columns with their compensations and
+    # (state, winner) tallies; rows without a winner are left out of the tallies, as groupby(["State","Winner"]) drops them
+    codes,states = factorize(df["State"].astype(str),sort=True)
+    numeric:DataFrame = df.drop(columns=["State","Winner"])
+    integer_columns:list[str] = [column for column in numeric.columns if numeric[column].dtype.kind in "iu"]
+    float_columns:list[str] = [column for column in numeric.columns if column not in integer_columns]
+    order:np.ndarray = np.argsort(codes,kind="stable")
+    bounds:np.ndarray = np.searchsorted(codes[order],np.arange(len(states)+1))
+    lengths:np.ndarray = np.diff(bounds)
+    float_data:np.ndarray = numeric[float_columns].to_numpy(dtype=np.float64)
+    float_values:np.ndarray = np.zeros((int(lengths.max(initial=0)),len(states),len(float_columns)),dtype=np.float64)
+    sums:dict[str,dict[str,int]] = {}
+    for index,state in enumerate(states):
+        rows:np.ndarray = order[bounds[index]:bounds[index+1]]
+        sums[state] = {column: int(numeric[column].iloc[rows].sum()) for column in integer_columns}
+        float_values[:len(rows),index] = float_data[rows]
+    float_sums,float_compensations = kahan_sums(float_values,lengths)
+    winners:dict[tuple[str,str],int] = df.dropna(subset=["Winner"]).groupby(["State","Winner"],observed=True).size().to_dict()
+    return {
+            "columns": numeric.columns.tolist(),
+            "all_columns": df.columns.tolist(),
+            "counts": {state: int(length) for state,length in zip(states,lengths)},
+            "sums": sums,
+            "float_columns": float_columns,
+            "float_states": states.tolist(),
+            "float_sums": float_sums,
+            "float_compensations": float_compensations,
+            "winners": {(str(state),str(winner)):int(count) for (state,winner),count in winners.items()}
+        }
+
+def _map_parts(function,source:str,table:str,parts:list,workers:int) -> Iterable[dict]:
+    # Parts are reduced on a process pool and come back in file order, so the split-round tables keep their row order.
+    # At most two parts per worker are in flight, so memory stays bounded by the part size however many parts there are.
+    if workers <= 1:
+        yield from (function(_read_part(source,table,part)) for part in parts)
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor,Future
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending:deque[Future] = deque()
+        for part in parts:
+            pending.append(executor.submit(_reduce_part,function,source,table,part))
+            if len(pending) >= 2*workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _reduce_part(function,source:str,table:str,part) -> dict:
+    return function(_read_part(source,table,part))
+
+def _source_parts(source:str,table:str,limit_bytes:int|None,part_bytes:int) -> list:
+    if os.path.isdir(source):
+        from result_store import read_manifest
+        return read_manifest(source)["chunks"]
+    columns,ranges = csv_parts(source,part_bytes,limit_bytes)
+    return [(columns,start,end) for start,end in ranges]
+
+def _partials(function,source:str,table:str,nrows:int|None,limit_bytes:int|None,workers:int,part_bytes:int) -> Iterable[dict]:
+    if nrows is not None and not os.path.isdir(source):
+        # A row limit cannot be turned into byte ranges up front, so these are read in order in row chunks
+        return (function(df) for df in read_csv(source,nrows=nrows,chunksize=DEFAULT_CHUNK_ROWS))
+    return _map_parts(function,source,table,_source_parts(source,table,limit_bytes,part_bytes),workers)
+
+def _warn_no_rows(source:str) -> None:
+    # An empty or header-only results file (e.g. a simulation that was stopped before its first flush) has nothing to
+    # summarize; the existing analysis/ outputs are left as they are
+    from xml_logging import XML_Logger
+    logger:XML_Logger = XML_Logger("analysis_logger","archive",log_retention_days=7,base_dir=os.getcwd())
+    logger.log_to_xml(message=f"{source} holds no result rows. Skipping its analysis.",basepath=logger.base_dir,status="WARN")
+
+def analyze_national_data(source:str="National_Results.csv",nrows:int|None=None,limit_bytes:int|None=None,workers:int=1,part_bytes:int=DEFAULT_PART_BYTES):
+    count:int = 0
+    sums:dict[str,int] = {}
+    float_columns:dict[str,list[np.ndarray]] = {}
+    rep_popular_dem_electoral:list[DataFrame] = []
+    dem_popular_rep_electoral:list[DataFrame] = []
+    for partial in _partials(national_partial,source,"national",nrows,limit_bytes,workers,part_bytes):
+        count += partial["count"]
+        for column,value in partial["sums"].items():
+            sums[column] = sums.get(column,0)+value
+        for column,values in partial["float_columns"].items():
+            float_columns.setdefault(column,[]).append(values)
+        rep_popular_dem_electoral.append(partial["rep_popular_dem_electoral"])
+        dem_popular_rep_electoral.append(partial["dem_popular_rep_electoral"])
+    if count == 0:
+        _warn_no_rows(source)
+        return
+
+    means:dict[str,float] = {column: sums[column]/count for column in sums}
+    means.update({column: float(np.sum(np.concatenate(values)))/count for column,values in float_columns.items()})
+    df_national_mean:DataFrame = DataFrame([{column: means[column] for column in rep_popular_dem_electoral[0].columns}])
+    write_national_outputs(
+            df_national_mean.drop("Round",axis=1),
+            concat(rep_popular_dem_electoral),
+            concat(dem_popular_rep_electoral)
+        )
+
+def analyze_state_data(source:str="State_Results.csv",nrows:int|None=None,limit_bytes:int|None=None,workers:int=1,part_bytes:int=DEFAULT_PART_BYTES):
+    counts:dict[str,int] = {}
+    sums:dict[str,dict[str,int]] = {}
+    # Per state: the float column totals of the parts so far and their Neumaier corrections
+    float_sums:dict[str,tuple[np.ndarray,np.ndarray]] = {}
+    winners:dict[tuple[str,str],int] = {}
+    columns:list[str] = []
+    all_columns:list[str] = []
+    float_columns:list[str] = []
+    for partial in _partials(state_partial,source,"state",nrows,limit_bytes,workers,part_bytes):
+        columns,all_columns,float_columns = partial["columns"],partial["all_columns"],partial["float_columns"]
+        for state,count in partial["counts"].items():
+            counts[state] = counts.get(state,0)+count
+            state_sums:dict[str,int] = sums.setdefault(state,{})
+            for column,value in partial["sums"][state].items():
+                state_sums[column] = state_sums.get(column,0)+value
+        # One (sums, compensations) pair per state and part; the rows were summed in the worker
+        for index,state in enumerate(partial["float_states"]):
+            total,correction = float_sums.setdefault(state,(np.zeros(len(float_columns)),np.zeros(len(float_columns))))
+            neumaier_add(total,correction,partial["float_sums"][index],partial["float_compensations"][index])
+        for key,count in partial["winners"].items():
+            winners[key] = winners.get(key,0)+count
+    if not counts:
+        _warn_no_rows(source)
+        return
+
+    states:list[str] = sorted(counts)
+    df_states_mean:DataFrame = DataFrame([{column: (sum(float_sums[state])[float_columns.index(column)] if column in float_columns else sums[state][column])/counts[state] for column in columns} for state in states])
+    df_states_mean.insert(0,"State",states)
+    # Same table as groupby(["State","Winner"]).count(): every other column holds the tally
+    tally_columns:list[str] = [column for column in all_columns if column not in ("State","Winner")]
+    df_state_winners:DataFrame = DataFrame([[state,winner]+[winners[(state,winner)]]*len(tally_columns) for state,winner in sorted(winners)],columns=["State","Winner"]+tally_columns)
+    write_state_outputs(
+            df_states_mean.drop(["Round","Electoral Votes"],axis=1),
+            df_state_winners
+        )
+
+def main(store_dir:str|None=None,checkpoint_path:str="simulator_checkpoint.json",aggregate_path:str|None=None,workers:int=1):
+    if aggregate_path is not None:
+        # Running totals saved by simulator.main(aggregate=True); independent of how many rounds were run
+        from online_aggregator import Online_Aggregator
+        Online_Aggregator.load(aggregate_path).emit()
+        return
+    if store_dir is not None:
+        analyze_national_data(store_dir,workers=workers)
+        analyze_state_data(store_dir,workers=workers)
+        return
+    from checkpoint import read_checkpoint
+    checkpoint:dict|None = read_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint["output"] == "csv":
+        # Read the live CSVs only up to the last checkpoint, which is a consistent snapshot of a running simulation
+        csv_bytes:dict[str,int] = checkpoint["offsets"]["csv_bytes"]
+        analyze_national_data("National_Results.csv",limit_bytes=csv_bytes["National_Results.csv"],workers=workers)
+        analyze_state_data("State_Results.csv",limit_bytes=csv_bytes["State_Results.csv"],workers=workers)
+        return
+    # No checkpoint to bound the read: take the CSVs as they are
+    analyze_national_data(workers=workers)
+    analyze_state_data(workers=workers)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Write the analysis/ summaries from simulation results")
+    parser.add_argument("--store-dir",default=None)
+    parser.add_argument("--aggregate",default=None,help="Running totals saved by simulator.py --aggregate")
+    parser.add_argument("--workers",type=int,default=os.cpu_count() or 1)
+    args:argparse.Namespace = parser.parse_args()
+    main(store_dir=args.store_dir,aggregate_path=args.aggregate,workers=args.workers)
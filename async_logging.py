@@ -0,0 +1,101 @@
+import sys
+import time
+import queue
+import threading
+from datetime import datetime,timedelta
+from xml_logging import XML_Logger
+
+STATUS_LEVELS:dict[str,int] = {"DEBUG": 10,"INFO": 20,"SUCCESS": 25,"WARN": 30,"ERROR": 40,"CRITICAL": 50}
+
+class Async_XML_Logger:
+    # Drop-in wrapper for XML_Logger: log_to_xml only enqueues, and a writer thread hands records to the
+    # wrapped logger in batches. Records below min_status are discarded before they reach the queue.
+    def __init__(self,logger:XML_Logger,min_status:str="WARN",batch_size:int=256,flush_interval:float=1.0):
+        self.logger:XML_Logger = logger
+        self.base_dir:str = logger.base_dir
+        self.min_level:int = STATUS_LEVELS[min_status]
+        self.batch_size:int = batch_size
+        self.flush_interval:float = flush_interval
+        self.records:queue.Queue = queue.Queue()
+        self.closed:threading.Event = threading.Event()
+        self.writer:threading.Thread = threading.Thread(target=self._write_batches,name="xml-log-writer",daemon=True)
+        self.writer.start()
+
+    def log_to_xml(self,message:str,basepath:str,status:str="INFO") -> None:
+        if STATUS_LEVELS.get(status,STATUS_LEVELS["CRITICAL"]) >= self.min_level:
+            self.enqueue(message,status)
+
+    def enqueue(self,message:str,status:str="INFO") -> None:
+        # Bypasses the status filter; used for rate-limited summaries such as Progress_Reporter
+        self.records.put((message,status))
+
+    def _drain(self,first:tuple[str,str]|None) -> list[tuple[str,str]]:
+        batch:list[tuple[str,str]] = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batches(self) -> None:
+        while not (self.closed.is_set() and self.records.empty()):
+            try:
+                first:tuple[str,str]|None = self.records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            for message,status in self._drain(first):
+                try:
+                    self.logger.log_to_xml(message=message,basepath=self.base_dir,status=status)
+                except Exception as e:
+                    # The wrapped logger cannot record its own failure, and letting it escape would kill the writer
+                    # and leave flush() and close() waiting on records nobody will take
+                    print(f"Failed to write a {status} log record ({message!r}). Official error: {e!r}",file=sys.stderr)
+                finally:
+                    self.records.task_done()
+
+    def flush(self) -> None:
+        self.records.join()
+
+    def close(self) -> None:
+        self.flush()
+        self.closed.set()
+        self.writer.join()
+
+    def save_variable_info(self,locals_dict:dict,variable_save_path:str) -> None:
+        self.flush()
+        self.logger.save_variable_info(locals_dict=locals_dict,variable_save_path=variable_save_path)
+
+class Progress_Reporter:
+    def __init__(self,logger:Async_XML_Logger|XML_Logger,max_round:int,start_round:int=1,every_rounds:int|None=None,every_seconds:float|None=10.0,print_progress:bool=True):
+        self.logger:Async_XML_Logger|XML_Logger = logger
+        self.max_round:int = max_round
+        self.start_round:int = start_round
+        self.every_rounds:int|None = every_rounds
+        self.every_seconds:float|None = every_seconds
+        self.print_progress:bool = print_progress
+        self.started_at:float = time.perf_counter()
+        self.last_report_round:int = start_round-1
+        self.last_report_time:float = self.started_at
+
+    def update(self,current_round:int) -> None:
+        # Cheap enough to call every round: it only formats a message once a round or time threshold passes
+        due_by_rounds:bool = self.every_rounds is not None and current_round-self.last_report_round >= self.every_rounds
+        due_by_time:bool = self.every_seconds is not None and time.perf_counter()-self.last_report_time >= self.every_seconds
+        if due_by_rounds or due_by_time or current_round == self.max_round:
+            self.report(current_round)
+
+    def report(self,current_round:int) -> None:
+        now:float = time.perf_counter()
+        rounds_done:int = current_round-self.start_round+1
+        rounds_per_second:float = rounds_done/max(now-self.started_at,1e-9)
+        eta:timedelta = timedelta(seconds=round((self.max_round-current_round)/max(rounds_per_second,1e-9)))
+        message:str = f"Completed election round {current_round:,.0f}/{self.max_round:,.0f} ({rounds_per_second:,.1f} rounds/sec, ETA {eta})"
+        if isinstance(self.logger,Async_XML_Logger):
+            self.logger.enqueue(message,"INFO")
+        else:
+            self.logger.log_to_xml(message=message,basepath=self.logger.base_dir,status="INFO")
+        if self.print_progress:
+            print(f"{message} at {datetime.now()}")
+        self.last_report_round = current_round
+        self.last_report_time = now
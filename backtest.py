@@ -0,0 +1,330 @@
+import os
+import json
+import argparse
+import itertools
+import traceback
+import numpy as np
+from datetime import datetime
+from pandas import read_csv,DataFrame
+from xml_logging import XML_Logger
+from state_model import State_Model,state_key
+from input_cache import load_cached_state_model
+from batch_simulation import PARTIES,SWING_NAMES,simulate_rounds,state_winner_codes
+from parallel_simulation import DEFAULT_BLOCK_SIZE,block_ranges,block_seed,ordered_results
+from scenario_sweep import Scenario,read_scenario_file
+CURRENT_DIRECTORY:str = os.getcwd()
+BACKTEST_YEARS:tuple[int,...] = (2016,2020,2024)
+HISTORICAL_RESULTS_FILE:str = "data/Historical_Results.csv"
+BACKTEST_MANIFEST:str = "backtest_manifest.json"
+DEFAULT_BACKTEST_ROUNDS:int = 20_000
+OBJECTIVES:tuple[str,...] = ("log_loss","brier","electoral_error")
+CALIBRATION_KEYS:tuple[str,...] = ("swing_scale","swing_ranges","turnout_range")
+# Searched when no calibration file is given: every transfer range scaled together, crossed with turnout windows
+DEFAULT_CALIBRATION_GRID:dict[str,list] = {
+        "swing_scale": [0.25,0.5,1.0,1.5,2.0],
+        "turnout_range": [[0.5,0.7],[0.55,0.75],[0.6,0.8],[0.6,0.9]]
+    }
+_worker_inputs:dict = {}
+
+class Backtest_Inputs:
+    # The states of every backtest year stacked into one set of arrays, so one batch simulates all years at once. Each
+    # round shares its national swing and turnout across the years; every score only uses per-year marginals, which
+    # sharing the draws leaves unchanged.
+    def __init__(self,years:tuple[int,...],states:np.ndarray,row_years:np.ndarray,registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,actual_shares:np.ndarray,input_dirs:list[str]):
+        self.years:tuple[int,...] = years
+        self.states:np.ndarray = states
+        self.row_years:np.ndarray = row_years
+        self.registered:np.ndarray = registered
+        self.baseline:np.ndarray = baseline
+        self.electoral:np.ndarray = electoral
+        # Actual Republican, Democrat and Independent shares of every state in its year, in PARTIES order
+        self.actual_shares:np.ndarray = actual_shares
+        self.actual_winners:np.ndarray = np.argmax(actual_shares,axis=1)
+        self.input_dirs:list[str] = input_dirs
+        self.year_rows:list[np.ndarray] = [np.flatnonzero(row_years==year) for year in years]
+        # Totals under electoral_votes.py's apportionment, which the simulator uses for every year
+        self.electoral_totals:np.ndarray = np.array([int(electoral[rows].sum()) for rows in self.year_rows],dtype=np.int64)
+        self.actual_rep_electoral:np.ndarray = np.array([int(electoral[rows][self.actual_winners[rows]==0].sum()) for rows in self.year_rows],dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+def read_historical_results(path:str) -> DataFrame:
+    # Written by party_popularity_history.main; one row per state and election
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No historical results at {path}. Write them with `python cli.py scrape-baseline --results-file {path}` first.")
+    results:DataFrame = read_csv(path)
+    missing:list[str] = sorted({"State","Year","Republican","Democrat"}-set(results.columns))
+    if missing:
+        raise ValueError(f"{path} is missing columns {missing}")
+    return results
+
+def baseline_before(results:DataFrame,year:int) -> DataFrame:
+    # Baseline popularity as party_popularity_history computes it, from elections before year only, so no forecast
+    # is built from the outcome it is scored against
+    past:DataFrame = results[results["Year"]<year]
+    if past.empty:
+        raise ValueError(f"No elections before {year} in the historical results")
+    means:DataFrame = past.groupby("State",sort=False)[["Republican","Democrat"]].mean()
+    return DataFrame({
+            "State": means.index,
+            "Republican": means["Republican"].round(10).to_numpy(),
+            "Democrat": means["Democrat"].round(10).to_numpy(),
+            "Independent": (1-(means["Republican"]+means["Democrat"])).round(10).to_numpy()
+        })
+
+def load_backtest_inputs(years:tuple[int,...]=BACKTEST_YEARS,voter_file:str="data/Combined_Data.csv",results_file:str=HISTORICAL_RESULTS_FILE,cache_root:str=os.path.join("cache","backtest")) -> Backtest_Inputs:
+    results:DataFrame = read_historical_results(results_file)
+    os.makedirs(cache_root,exist_ok=True)
+    models:list[State_Model] = []
+    shares:list[np.ndarray] = []
+    input_dirs:list[str] = []
+    for year in years:
+        baseline_file:str = os.path.join(cache_root,f"Baseline_Before_{year}.csv")
+        baseline_before(results,year).to_csv(baseline_file,index=False)
+        # Cached the same way as the simulator's inputs, keyed by file contents, so a calibration after the first only
+        # maps arrays from disk
+        model,input_dir = load_cached_state_model(voter_file,baseline_file,year,cache_root=cache_root)
+        actual:DataFrame = results[results["Year"]==year]
+        outcomes:dict[str,tuple[float,float]] = {state_key(state):(rep,dem) for state,rep,dem in zip(actual["State"],actual["Republican"],actual["Democrat"])}
+        missing:list[str] = [str(state) for state in model.states if state_key(state) not in outcomes]
+        if missing:
+            raise ValueError(f"No {year} results for {missing} in {results_file}")
+        rep_dem:np.ndarray = np.array([outcomes[state_key(state)] for state in model.states],dtype=np.float64)
+        shares.append(np.column_stack([rep_dem,1-rep_dem.sum(axis=1)]))
+        models.append(model)
+        input_dirs.append(input_dir)
+    return Backtest_Inputs(
+            years=tuple(years),
+            states=np.concatenate([model.states for model in models]),
+            row_years=np.concatenate([np.full(len(model),year,dtype=np.int64) for model,year in zip(models,years)]),
+            registered=np.concatenate([model.registered for model in models]),
+            baseline=np.concatenate([model.baseline for model in models]),
+            electoral=np.concatenate([model.electoral for model in models]),
+            actual_shares=np.concatenate(shares),
+            input_dirs=input_dirs
+        )
+
+class Backtest_Score:
+    # Running tallies for one parameter set, merged from the per-block partials that score_block returns
+    def __init__(self,inputs:Backtest_Inputs):
+        self.inputs:Backtest_Inputs = inputs
+        self.rounds:int = 0
+        self.wins:np.ndarray = np.zeros((len(inputs),len(PARTIES)),dtype=np.int64)
+        self.rep_electoral_sum:np.ndarray = np.zeros(len(inputs.years),dtype=np.int64)
+        self.rep_electoral_abs_error_sum:np.ndarray = np.zeros(len(inputs.years),dtype=np.int64)
+        self.rep_national_wins:np.ndarray = np.zeros(len(inputs.years),dtype=np.int64)
+
+    def update(self,partial:dict) -> None:
+        self.rounds += partial["rounds"]
+        self.wins += partial["wins"]
+        self.rep_electoral_sum += partial["rep_electoral_sum"]
+        self.rep_electoral_abs_error_sum += partial["rep_electoral_abs_error_sum"]
+        self.rep_national_wins += partial["rep_national_wins"]
+
+    def state_scores(self) -> dict[str,np.ndarray]:
+        rounds:int = max(self.rounds,1)
+        probabilities:np.ndarray = self.wins/rounds
+        outcomes:np.ndarray = np.eye(len(PARTIES))[self.inputs.actual_winners]
+        # An outcome that never came up in the rounds is scored as if it came up half a time, so one surprise does
+        # not make the log loss infinite
+        actual_probability:np.ndarray = np.clip(probabilities[np.arange(len(self.inputs)),self.inputs.actual_winners],0.5/rounds,1)
+        return {
+                "probabilities": probabilities,
+                "brier": ((probabilities-outcomes)**2).sum(axis=1),
+                "log_loss": np.log(1/actual_probability),
+                # Expected minus actual Republican electoral votes from the state
+                "electoral_error": self.inputs.electoral*(probabilities[:,0]-outcomes[:,0])
+            }
+
+    def scores(self) -> dict[str,float]:
+        states:dict[str,np.ndarray] = self.state_scores()
+        return {
+                "brier": float(states["brier"].mean()),
+                "log_loss": float(states["log_loss"].mean()),
+                # Mean over years of the average absolute miss of the Republican electoral vote total per round
+                "electoral_error": float((self.rep_electoral_abs_error_sum/max(self.rounds,1)).mean())
+            }
+
+    def state_frame(self) -> DataFrame:
+        states:dict[str,np.ndarray] = self.state_scores()
+        return DataFrame({
+                "Year": self.inputs.row_years,
+                "State": self.inputs.states,
+                **{f"{party} Win Probability": states["probabilities"][:,code] for code,party in enumerate(PARTIES)},
+                "Actual Winner": np.array(PARTIES,dtype=object)[self.inputs.actual_winners],
+                "Electoral Votes": self.inputs.electoral,
+                "Brier Score": states["brier"],
+                "Log Loss": states["log_loss"],
+                "Electoral Vote Error": states["electoral_error"]
+            })
+
+    def year_frame(self) -> DataFrame:
+        states:dict[str,np.ndarray] = self.state_scores()
+        rounds:int = max(self.rounds,1)
+        return DataFrame({
+                "Year": list(self.inputs.years),
+                "Republican Win Probability": self.rep_national_wins/rounds,
+                "Expected Republican Electoral Votes": self.rep_electoral_sum/rounds,
+                "Actual Republican Electoral Votes": self.inputs.actual_rep_electoral,
+                "Electoral Vote Error": self.rep_electoral_sum/rounds-self.inputs.actual_rep_electoral,
+                "Mean Absolute Electoral Vote Error": self.rep_electoral_abs_error_sum/rounds,
+                "Brier Score": [float(states["brier"][rows].mean()) for rows in self.inputs.year_rows],
+                "Log Loss": [float(states["log_loss"][rows].mean()) for rows in self.inputs.year_rows]
+            })
+
+def _init_backtest_worker(inputs:Backtest_Inputs) -> None:
+    _worker_inputs["inputs"] = inputs
+
+def score_block(master_seed:int,block_index:int,start:int,end:int,swing_highs:np.ndarray,swing_lows:np.ndarray,turnout_range:tuple[float,float]) -> dict:
+    # Reduced in the worker, so only a few small arrays per block come back instead of every simulated vote count
+    inputs:Backtest_Inputs = _worker_inputs["inputs"]
+    rng:np.random.Generator = np.random.default_rng(block_seed(master_seed,block_index))
+    n_rounds:int = end-start+1
+    batch = next(simulate_rounds(inputs.registered,inputs.baseline,inputs.electoral,n_rounds,rng,chunk_size=n_rounds,first_round=start,swing_highs=swing_highs,swing_lows=swing_lows,turnout_range=turnout_range))
+    codes:np.ndarray = state_winner_codes(batch)
+    rep_electoral:np.ndarray = np.stack([np.where(codes[:,rows]==0,inputs.electoral[rows],0).sum(axis=1) for rows in inputs.year_rows],axis=1)
+    return {
+            "rounds": n_rounds,
+            "wins": np.stack([(codes==code).sum(axis=0) for code in range(len(PARTIES))],axis=1),
+            "rep_electoral_sum": rep_electoral.sum(axis=0),
+            "rep_electoral_abs_error_sum": np.abs(rep_electoral-inputs.actual_rep_electoral).sum(axis=0),
+            "rep_national_wins": (2*rep_electoral > inputs.electoral_totals).sum(axis=0)
+        }
+
+def expand_candidates(spec:dict[str,list]) -> list[dict]:
+    # spec maps each of CALIBRATION_KEYS to the values it is searched over; every combination is one candidate
+    unknown:list[str] = sorted(set(spec)-set(CALIBRATION_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown calibration parameters {unknown}. Expected some of {CALIBRATION_KEYS}")
+    candidates:list[dict] = [dict(zip(spec,values)) for values in itertools.product(*spec.values())]
+    for candidate in candidates:
+        candidate_bounds(candidate)
+    return candidates
+
+def candidate_bounds(candidate:dict) -> tuple[np.ndarray,np.ndarray,tuple[float,float]]:
+    # swing_ranges replaces individual transfer bounds as in a sweep Scenario, then swing_scale widens or narrows them all
+    scenario:Scenario = Scenario(name="candidate",swing_ranges=candidate.get("swing_ranges"),turnout_range=candidate.get("turnout_range"))
+    scale:float = float(candidate.get("swing_scale",1.0))
+    if scale < 0:
+        raise ValueError(f"swing_scale must be non-negative, got {scale}")
+    return scenario.swing_highs*scale,scenario.swing_lows*scale,scenario.turnout_range
+
+def evaluate_candidates(inputs:Backtest_Inputs,candidates:list[dict],rounds:int,seed:int,workers:int=1,block_size:int=DEFAULT_BLOCK_SIZE) -> list[Backtest_Score]:
+    # Every candidate uses the same block seeds (common random numbers), so two candidates differ by their parameters
+    # rather than by sampling noise
+    bounds:list[tuple] = [candidate_bounds(candidate) for candidate in candidates]
+    owners:list[int] = []
+    def queued_tasks():
+        for index,(swing_highs,swing_lows,turnout_range) in enumerate(bounds):
+            for block_index,start,end in block_ranges(rounds,block_size):
+                owners.append(index)
+                yield (seed,block_index,start,end,swing_highs,swing_lows,turnout_range)
+
+    scores:list[Backtest_Score] = [Backtest_Score(inputs) for _ in candidates]
+    if workers <= 1:
+        _init_backtest_worker(inputs)
+        partials = (score_block(*task) for task in queued_tasks())
+        executor = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        # The stacked inputs are a few kilobytes, so each worker gets its own copy once through the initializer
+        executor = ProcessPoolExecutor(max_workers=workers,initializer=_init_backtest_worker,initargs=(inputs,))
+        partials = ordered_results(executor,score_block,queued_tasks(),window=2*workers)
+    try:
+        for position,partial in enumerate(partials):
+            scores[owners[position]].update(partial)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return scores
+
+def calibrate(inputs:Backtest_Inputs,candidates:list[dict],rounds:int,seed:int,logger:XML_Logger,workers:int=1,objective:str="log_loss",screen_rounds:int|None=None,keep:int=5,block_size:int=DEFAULT_BLOCK_SIZE) -> list[dict]:
+    # With screen_rounds, every candidate is first scored on that many rounds and only the best keep are run to the
+    # full rounds. Returns one record per candidate, best first.
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}. Expected one of {OBJECTIVES}")
+    finalists:list[int] = list(range(len(candidates)))
+    records:dict[int,dict] = {}
+    if screen_rounds is not None and screen_rounds < rounds and len(candidates) > keep:
+        screened:list[Backtest_Score] = evaluate_candidates(inputs,candidates,screen_rounds,seed,workers=workers,block_size=block_size)
+        for index,score in enumerate(screened):
+            records[index] = {"candidate": candidates[index],"rounds": score.rounds,**score.scores()}
+        finalists = sorted(finalists,key=lambda index: records[index][objective])[:keep]
+        logger.log_to_xml(message=f"Screened {len(candidates):,.0f} candidates on {screen_rounds:,.0f} rounds; running the best {len(finalists):,.0f} to {rounds:,.0f}",basepath=logger.base_dir,status="INFO")
+    final:list[Backtest_Score] = evaluate_candidates(inputs,[candidates[index] for index in finalists],rounds,seed,workers=workers,block_size=block_size)
+    for index,score in zip(finalists,final):
+        records[index] = {"candidate": candidates[index],"rounds": score.rounds,**score.scores(),"score": score}
+    # Fully run candidates rank ahead of screened-out ones
+    return sorted(records.values(),key=lambda record: (record["rounds"] < rounds,record[objective]))
+
+def calibration_frame(records:list[dict]) -> DataFrame:
+    rows:list[dict] = []
+    for rank,record in enumerate(records,start=1):
+        swing_highs,swing_lows,turnout_range = candidate_bounds(record["candidate"])
+        rows.append({
+                "Rank": rank,
+                "Rounds": record["rounds"],
+                "Swing Scale": float(record["candidate"].get("swing_scale",1.0)),
+                "Turnout Low": turnout_range[0],
+                "Turnout High": turnout_range[1],
+                **{f"{name} Low": float(low) for name,low in zip(SWING_NAMES,swing_lows)},
+                **{f"{name} High": float(high) for name,high in zip(SWING_NAMES,swing_highs)},
+                "Brier Score": record["brier"],
+                "Log Loss": record["log_loss"],
+                "Electoral Vote Error": record["electoral_error"]
+            })
+    return DataFrame.from_records(rows)
+
+def write_backtest(score:Backtest_Score,output_dir:str) -> None:
+    score.state_frame().to_csv(os.path.join(output_dir,"Backtest_States.csv"),index=False)
+    score.year_frame().to_csv(os.path.join(output_dir,"Backtest_Years.csv"),index=False)
+
+def main(calibrate_parameters:bool=False,calibration_file:str|None=None,years:tuple[int,...]=BACKTEST_YEARS,rounds:int=DEFAULT_BACKTEST_ROUNDS,seed:int|None=None,workers:int=1,objective:str="log_loss",screen_rounds:int|None=None,keep:int=5,output_dir:str="backtest",voter_file:str="data/Combined_Data.csv",results_file:str=HISTORICAL_RESULTS_FILE):
+    try:
+        logger:XML_Logger = XML_Logger("backtest_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        inputs:Backtest_Inputs = load_backtest_inputs(tuple(years),voter_file=voter_file,results_file=results_file)
+        os.makedirs(output_dir,exist_ok=True)
+        manifest:dict = {"seed": seed,"years": list(inputs.years),"rounds": rounds,"results_file": os.path.abspath(results_file)}
+        if calibrate_parameters:
+            candidates:list[dict] = expand_candidates(read_scenario_file(calibration_file) if calibration_file is not None else DEFAULT_CALIBRATION_GRID)
+            logger.log_to_xml(message=f"Calibrating {len(candidates):,.0f} candidates against {list(inputs.years)} with seed {seed}",basepath=logger.base_dir,status="INFO")
+            records:list[dict] = calibrate(inputs,candidates,rounds,seed,logger,workers=workers,objective=objective,screen_rounds=screen_rounds,keep=keep)
+            calibration_frame(records).to_csv(os.path.join(output_dir,"Calibration.csv"),index=False)
+            best:dict = records[0]
+            write_backtest(best["score"],output_dir)
+            manifest.update({"objective": objective,"candidates": len(candidates),"best": {"candidate": best["candidate"],**{name: best[name] for name in OBJECTIVES}}})
+            print(f"Best of {len(candidates)} candidates by {objective}: {best['candidate']} ({best[objective]:.4f}) at {datetime.now()}")
+        else:
+            score:Backtest_Score = evaluate_candidates(inputs,[{}],rounds,seed,workers=workers)[0]
+            write_backtest(score,output_dir)
+            manifest["scores"] = score.scores()
+            print(f"Backtest of {list(inputs.years)}: {score.scores()} at {datetime.now()}")
+        with open(os.path.join(output_dir,BACKTEST_MANIFEST),'w') as file:
+            json.dump(manifest,file,indent=2)
+        logger.log_to_xml(message=f"Finished backtest of {list(inputs.years)}. Results are in {output_dir}",basepath=logger.base_dir,status="SUCCESS")
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Backtest failed. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Backtest failed. Terminating program. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Score the batch engine against past elections and calibrate its swing and turnout ranges")
+    parser.add_argument("--calibrate",action="store_true",help="Search the calibration grid instead of scoring the current ranges")
+    parser.add_argument("--calibration-file",default=None,help="JSON/TOML/YAML mapping swing_scale, swing_ranges and turnout_range to the values to search")
+    parser.add_argument("--years",type=int,nargs="+",default=list(BACKTEST_YEARS))
+    parser.add_argument("--rounds",type=int,default=DEFAULT_BACKTEST_ROUNDS)
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--workers",type=int,default=1)
+    parser.add_argument("--objective",choices=OBJECTIVES,default="log_loss")
+    parser.add_argument("--screen-rounds",type=int,default=None,help="Score every candidate on this many rounds first and run only the best --keep to --rounds")
+    parser.add_argument("--keep",type=int,default=5)
+    parser.add_argument("--output-dir",default="backtest")
+    parser.add_argument("--voter-file",default="data/Combined_Data.csv")
+    parser.add_argument("--results-file",default=HISTORICAL_RESULTS_FILE)
+    args:argparse.Namespace = parser.parse_args()
+    main(calibrate_parameters=args.calibrate,calibration_file=args.calibration_file,years=tuple(args.years),rounds=args.rounds,seed=args.seed,workers=args.workers,objective=args.objective,screen_rounds=args.screen_rounds,keep=args.keep,output_dir=args.output_dir,voter_file=args.voter_file,results_file=args.results_file)
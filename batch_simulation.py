@@ -0,0 +1,191 @@
+import numpy as np
+from typing import Generator,TYPE_CHECKING
+from simulator import ABSTAIN_RATE
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+PARTIES:tuple[str,...] = ("Republican","Democrat","Independent")
+# The uniform transfers drawn in get_popularity_changes, in the same order, and their bounds
+SWING_NAMES:tuple[str,...] = ("rep_to_ind","rep_to_dem","dem_to_ind","dem_to_rep","ind_to_dem","ind_to_rep")
+SWING_HIGHS:np.ndarray = np.array([0.1,0.05,0.1,0.05,0.1,0.1])
+SWING_LOWS:np.ndarray = np.zeros(len(SWING_HIGHS))
+TURNOUT_RANGE:tuple[float,float] = (0.6,0.9)
+DEFAULT_CHUNK_SIZE:int = 10_000
+
+class Round_Batch:
+    def __init__(self,rounds:np.ndarray,turnout:np.ndarray,popularity_changes:np.ndarray,total_votes:np.ndarray,rep_votes:np.ndarray,dem_votes:np.ndarray,ind_votes:np.ndarray,electoral:np.ndarray):
+        self.rounds:np.ndarray = rounds
+        self.turnout:np.ndarray = turnout
+        self.popularity_changes:np.ndarray = popularity_changes
+        self.total_votes:np.ndarray = total_votes
+        self.rep_votes:np.ndarray = rep_votes
+        self.dem_votes:np.ndarray = dem_votes
+        self.ind_votes:np.ndarray = ind_votes
+        # Same tie-breaking as Federal_Election_Simulation._get_electoral_votes: Republican, then Democrat, then Independent
+        self.winners:np.ndarray = np.argmax(np.stack([rep_votes,dem_votes,ind_votes],axis=-1),axis=-1).astype(np.int8)
+        self.rep_electoral_votes:np.ndarray = np.where(self.winners==0,electoral,0).sum(axis=1)
+        self.dem_electoral_votes:np.ndarray = np.where(self.winners==1,electoral,0).sum(axis=1)
+        self.ind_electoral_votes:np.ndarray = np.where(self.winners==2,electoral,0).sum(axis=1)
+
+    def __len__(self) -> int:
+        return len(self.rounds)
+
+def draw_popularity_changes(rng:np.random.Generator,n_rounds:int,swing_highs:np.ndarray=SWING_HIGHS,swing_lows:np.ndarray=SWING_LOWS) -> np.ndarray:
+    return net_popularity_changes(rng.uniform(swing_lows,swing_highs,size=(n_rounds,len(swing_highs))))
+
+def net_popularity_changes(transfers:np.ndarray) -> np.ndarray:
+    # transfers: rounds x SWING_NAMES, returns rounds x (net_rep, net_dem, net_ind) as in get_popularity_changes
+    rep_to_ind,rep_to_dem,dem_to_ind,dem_to_rep,ind_to_dem,ind_to_rep = transfers.T
+    net_rep_change:np.ndarray = -(rep_to_dem+rep_to_ind)+dem_to_rep+ind_to_rep
+    net_dem_change:np.ndarray = rep_to_dem-(dem_to_ind+dem_to_rep)+ind_to_dem
+    net_ind_change:np.ndarray = rep_to_ind+dem_to_ind-(ind_to_dem+ind_to_rep)
+    return np.stack([net_rep_change,net_dem_change,net_ind_change],axis=1)
+
+def draw_turnout(rng:np.random.Generator,n_rounds:int,turnout_range:tuple[float,float]=TURNOUT_RANGE) -> np.ndarray:
+    return rng.uniform(*turnout_range,size=n_rounds)
+
+def adjust_party_popularity(rep:np.ndarray,dem:np.ndarray,ind:np.ndarray) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    # Vectorized State_Election_Simulation._adjusted_party_popularity, one mask per branch
+    rep_ok:np.ndarray = rep >= 0
+    dem_ok:np.ndarray = dem >= 0
+    ind_ok:np.ndarray = ind >= 0
+    new_rep:np.ndarray = rep.copy()
+    new_dem:np.ndarray = dem.copy()
+    new_ind:np.ndarray = ind.copy()
+
+    mask:np.ndarray = rep_ok & dem_ok & ~ind_ok
+    rep_increase:np.ndarray = -ind*rep
+    new_rep[mask] = (rep-rep_increase)[mask]
+    new_dem[mask] = (dem+ind+rep_increase)[mask]
+    new_ind[mask] = 0
+
+    mask = rep_ok & ~dem_ok & ind_ok
+    rep_increase = -dem*rep
+    new_rep[mask] = (rep-rep_increase)[mask]
+    new_ind[mask] = (ind+dem+rep_increase)[mask]
+    new_dem[mask] = 0
+
+    mask = ~rep_ok & dem_ok & ind_ok
+    dem_increase:np.ndarray = -rep*dem
+    new_dem[mask] = (dem-dem_increase)[mask]
+    new_ind[mask] = (ind+rep+dem_increase)[mask]
+    new_rep[mask] = 0
+
+    for mask,winner in ((rep_ok & ~dem_ok & ~ind_ok,0),(~rep_ok & dem_ok & ~ind_ok,1),(~rep_ok & ~dem_ok & ind_ok,2)):
+        new_rep[mask] = 1 if winner==0 else 0
+        new_dem[mask] = 1 if winner==1 else 0
+        new_ind[mask] = 1 if winner==2 else 0
+    return new_rep,new_dem,new_ind
+
+def vote_probabilities(rep:np.ndarray,dem:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    # Same cut points as State_Election_Simulation.cast_vote, returned as P(rep) and P(dem)
+    rep_cutoff:np.ndarray = np.clip(rep,0,1)
+    dem_cutoff:np.ndarray = np.clip(np.maximum(rep+dem,rep_cutoff),0,1)
+    return rep_cutoff,dem_cutoff-rep_cutoff
+
+def sample_votes(rng:np.random.Generator,registered:np.ndarray,turnout:np.ndarray,rep_probability:np.ndarray,dem_probability:np.ndarray) -> tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+    votes_to_cast:np.ndarray = rng.binomial(registered,turnout)
+    total_votes:np.ndarray = rng.binomial(votes_to_cast,1-ABSTAIN_RATE)
+    rep_votes:np.ndarray = rng.binomial(total_votes,rep_probability)
+    # Multinomial split drawn as conditional binomials so every state can carry its own probabilities
+    remaining_probability:np.ndarray = 1-rep_probability
+    dem_share:np.ndarray = np.divide(dem_probability,remaining_probability,out=np.zeros_like(dem_probability),where=remaining_probability>0)
+    dem_votes:np.ndarray = rng.binomial(total_votes-rep_votes,np.clip(dem_share,0,1))
+    ind_votes:np.ndarray = total_votes-rep_votes-dem_votes
+    return total_votes,rep_votes,dem_votes,ind_votes
+
+def simulate_batch(registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,popularity_changes:np.ndarray,turnout:np.ndarray,rng:np.random.Generator,first_round:int=1,state_shifts:np.ndarray|None=None) -> Round_Batch:
+    popularity:np.ndarray = baseline[None,:,:]+popularity_changes[:,None,:]
+    if state_shifts is not None:
+        # rounds x states Republican-minus-Democrat margin shifts from regional_swing.py, split evenly between the two
+        popularity[...,0] += state_shifts/2
+        popularity[...,1] -= state_shifts/2
+    rep,dem,ind = adjust_party_popularity(popularity[...,0],popularity[...,1],popularity[...,2])
+    rep_probability,dem_probability = vote_probabilities(rep,dem)
+    total_votes,rep_votes,dem_votes,ind_votes = sample_votes(rng,registered[None,:],turnout[:,None],rep_probability,dem_probability)
+    rounds:np.ndarray = np.arange(first_round,first_round+len(turnout),dtype=np.int64)
+    return Round_Batch(rounds,turnout,popularity_changes,total_votes,rep_votes,dem_votes,ind_votes,electoral)
+
+def simulate_rounds(registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,n_rounds:int,rng:np.random.Generator,chunk_size:int=DEFAULT_CHUNK_SIZE,first_round:int=1,swing_highs:np.ndarray=SWING_HIGHS,swing_lows:np.ndarray=SWING_LOWS,turnout_range:tuple[float,float]=TURNOUT_RANGE,swing_model=None) -> Generator[Round_Batch,None,None]:
+    # Memory is bounded by chunk_size x number of states regardless of n_rounds
+    for start in range(0,n_rounds,chunk_size):
+        size:int = min(chunk_size,n_rounds-start)
+        popularity_changes:np.ndarray = draw_popularity_changes(rng,size,swing_highs,swing_lows)
+        turnout:np.ndarray = draw_turnout(rng,size,turnout_range)
+        # Drawn after the national inputs, so runs without a swing model keep their random streams
+        state_shifts:np.ndarray|None = swing_model.draw(rng,size) if swing_model is not None else None
+        yield simulate_batch(registered,baseline,electoral,popularity_changes,turnout,rng,first_round=first_round+start,state_shifts=state_shifts)
+
+def concatenate_batches(batches:list[Round_Batch],electoral:np.ndarray) -> Round_Batch:
+    return Round_Batch(
+            np.concatenate([batch.rounds for batch in batches]),
+            np.concatenate([batch.turnout for batch in batches]),
+            np.concatenate([batch.popularity_changes for batch in batches]),
+            np.concatenate([batch.total_votes for batch in batches]),
+            np.concatenate([batch.rep_votes for batch in batches]),
+            np.concatenate([batch.dem_votes for batch in batches]),
+            np.concatenate([batch.ind_votes for batch in batches]),
+            electoral
+        )
+
+def slice_batch(batch:Round_Batch,start:int,stop:int,electoral:np.ndarray) -> Round_Batch:
+    # Rows [start, stop) of the batch, by position
+    return Round_Batch(
+            batch.rounds[start:stop],
+            batch.turnout[start:stop],
+            batch.popularity_changes[start:stop],
+            batch.total_votes[start:stop],
+            batch.rep_votes[start:stop],
+            batch.dem_votes[start:stop],
+            batch.ind_votes[start:stop],
+            electoral
+        )
+
+def state_winner_codes(batch:Round_Batch) -> np.ndarray:
+    # State_Election_Simulation._get_winner reports no winner (-1 here) on a tie for first place
+    votes:np.ndarray = np.stack([batch.rep_votes,batch.dem_votes,batch.ind_votes],axis=-1)
+    top:np.ndarray = votes.max(axis=-1,keepdims=True)
+    unique_winner:np.ndarray = (votes==top).sum(axis=-1)==1
+    return np.where(unique_winner,batch.winners,-1).astype(np.int8)
+
+def winner_names(winner_codes:np.ndarray) -> np.ndarray:
+    return np.where(winner_codes>=0,np.array(PARTIES,dtype=object)[np.maximum(winner_codes,0)],None)
+
+def state_results_frame(batch:Round_Batch,states:np.ndarray,electoral:np.ndarray) -> "DataFrame":
+    from pandas import DataFrame
+    n_rounds,n_states = batch.total_votes.shape
+    total_votes:np.ndarray = batch.total_votes.astype(np.float64)
+    return DataFrame({
+            "Round": np.repeat(batch.rounds,n_states),
+            "State": np.tile(states,n_rounds),
+            "Electoral Votes": np.tile(electoral,n_rounds),
+            "Winner": winner_names(state_winner_codes(batch)).ravel(),
+            "Total Votes": batch.total_votes.ravel(),
+            "Republican Votes": batch.rep_votes.ravel(),
+            "Republican Vote Percent": (batch.rep_votes/total_votes).ravel(),
+            "Democrat Votes": batch.dem_votes.ravel(),
+            "Democrat Vote Percent": (batch.dem_votes/total_votes).ravel(),
+            "Independent Votes": batch.ind_votes.ravel(),
+            "Independent Vote Percent": (batch.ind_votes/total_votes).ravel()
+        })
+
+def national_results_frame(batch:Round_Batch) -> "DataFrame":
+    from pandas import DataFrame
+    total_votes:np.ndarray = batch.total_votes.sum(axis=1)
+    rep_votes:np.ndarray = batch.rep_votes.sum(axis=1)
+    dem_votes:np.ndarray = batch.dem_votes.sum(axis=1)
+    ind_votes:np.ndarray = batch.ind_votes.sum(axis=1)
+    return DataFrame({
+            "Round": batch.rounds,
+            "Turnout Percent": batch.turnout,
+            "Total Votes": total_votes,
+            "Republican Votes": rep_votes,
+            "Republican Electoral Votes": batch.rep_electoral_votes,
+            "Republican Vote Percent": rep_votes/total_votes,
+            "Democrat Votes": dem_votes,
+            "Democrat Electoral Votes": batch.dem_electoral_votes,
+            "Democrat Vote Percent": dem_votes/total_votes,
+            "Independent Votes": ind_votes,
+            "Independent Electoral Votes": batch.ind_electoral_votes,
+            "Independent Vote Percent": ind_votes/total_votes
+        })
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import numpy as np
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+CURRENT_DIRECTORY:str = os.path.dirname(os.path.abspath(__file__))
+DATA_FILES:tuple[str,...] = ("data/Combined_Data.csv","data/Baseline_Popularity.csv")
+
+def _directory_bytes(path:str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root,name)) for root,_,names in os.walk(path) for name in names)
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss is in kilobytes on Linux; worker pools show up under RUSAGE_CHILDREN
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def _load_inputs(work_dir:str) -> tuple[np.ndarray,np.ndarray]:
+    # The same cached, aligned inputs simulator.main() starts from
+    from input_cache import load_cached_state_model
+    from simulator import per_round_inputs
+    state_model,_ = load_cached_state_model(*(os.path.join(work_dir,file_name) for file_name in DATA_FILES),year=2028,cache_root=os.path.join(work_dir,"cache","inputs"))
+    return per_round_inputs(state_model,2028)
+
+def bench_state_scalar(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    # The per-voter loop is far too slow for real state sizes, so one state is scaled down to 100,000 voters
+    from simulator import State_Election_Simulation
+    state_voter_data:np.ndarray = voter_data[0].copy()
+    state_voter_data[1] = 100_000
+    voters:int = 0
+    started:float = time.perf_counter()
+    for current_round in range(1,rounds+1):
+        state:State_Election_Simulation = State_Election_Simulation(state_voter_data,party_popularity_data[0],[0,0,0],random.uniform(0.6,0.9),current_round,engine="scalar")
+        state.simulate_election()
+        voters += int(state_voter_data[1])
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"state_elections_per_sec": rounds/seconds,"voters_per_sec": voters/seconds}
+
+def bench_state_numpy(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    from simulator import simulate_states,get_popularity_changes
+    rng:np.random.Generator = np.random.default_rng(0)
+    started:float = time.perf_counter()
+    for current_round in range(1,rounds+1):
+        list(simulate_states(voter_data,party_popularity_data,get_popularity_changes(),random.uniform(0.6,0.9),current_round,engine="numpy",rng=rng))
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds,"voters_per_sec": rounds*int(voter_data[:,1].sum())/seconds}
+
+def bench_federal(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    from simulator import simulate_states,Federal_Election_Simulation
+    states:list = list(simulate_states(voter_data,party_popularity_data,[0,0,0],0.75,1,engine="numpy",rng=np.random.default_rng(0)))
+    started:float = time.perf_counter()
+    for current_round in range(1,rounds+1):
+        Federal_Election_Simulation(states,current_round=current_round,turnout=0.75)
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds}
+
+def bench_csv_writer(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    # Same per-round appends as simulator.main with output="csv"
+    from pandas import DataFrame
+    from simulator import simulate_states,Federal_Election_Simulation
+    states:list = list(simulate_states(voter_data,party_popularity_data,[0,0,0],0.75,1,engine="numpy",rng=np.random.default_rng(0)))
+    started:float = time.perf_counter()
+    for current_round in range(1,rounds+1):
+        for state in states:
+            state.current_round = current_round
+        DataFrame.from_records([state.save_to_csv() for state in states]).to_csv("State_Results.csv",mode="w" if current_round==1 else "a",encoding='utf-8',index=False,header=current_round==1,float_format='{:,.4f}'.format)
+        Federal_Election_Simulation(states,current_round=current_round,turnout=0.75).save_to_csv()
+    seconds:float = time.perf_counter()-started
+    output_bytes:int = _directory_bytes("State_Results.csv")+_directory_bytes("National_Results.csv")
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds,"output_bytes_per_round": output_bytes/rounds}
+
+def bench_batch(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    from state_model import State_Model
+    from parallel_simulation import run_parallel
+    model:State_Model = State_Model.from_data(voter_data,party_popularity_data)
+    states,registered,baseline,electoral = model.states,model.registered,model.baseline,model.electoral
+    started:float = time.perf_counter()
+    for batch in run_parallel(registered,baseline,electoral,rounds,0,workers=workers):
+        pass
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds,"voters_per_sec": rounds*int(registered.sum())/seconds}
+
+def bench_store_writer(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    from state_model import State_Model
+    from batch_simulation import simulate_rounds
+    from result_store import Result_Sink
+    model:State_Model = State_Model.from_data(voter_data,party_popularity_data)
+    states,registered,baseline,electoral = model.states,model.registered,model.baseline,model.electoral
+    batches:list = list(simulate_rounds(registered,baseline,electoral,rounds,np.random.default_rng(0)))
+    started:float = time.perf_counter()
+    sink:Result_Sink = Result_Sink("results",states,electoral)
+    for batch in batches:
+        sink.append_batch(batch)
+    sink.close()
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds,"output_bytes_per_round": _directory_bytes("results")/rounds}
+
+def bench_analysis(voter_data:np.ndarray,party_popularity_data:np.ndarray,rounds:int,workers:int) -> dict:
+    import analysis
+    from state_model import State_Model
+    from batch_simulation import simulate_rounds,state_results_frame,national_results_frame
+    model:State_Model = State_Model.from_data(voter_data,party_popularity_data)
+    states,registered,baseline,electoral = model.states,model.registered,model.baseline,model.electoral
+    for index,batch in enumerate(simulate_rounds(registered,baseline,electoral,rounds,np.random.default_rng(0))):
+        state_results_frame(batch,states,electoral).to_csv("State_Results.csv",mode="w" if index==0 else "a",index=False,header=index==0,float_format='{:,.4f}'.format)
+        national_results_frame(batch).to_csv("National_Results.csv",mode="w" if index==0 else "a",index=False,header=index==0,float_format='{:,.4f}'.format)
+    os.makedirs("analysis",exist_ok=True)
+    started:float = time.perf_counter()
+    analysis.analyze_national_data()
+    analysis.analyze_state_data()
+    seconds:float = time.perf_counter()-started
+    return {"seconds": seconds,"rounds_per_sec": rounds/seconds}
+
+BENCHMARKS:dict[str,Callable[...,dict]] = {
+        "state_scalar": bench_state_scalar,
+        "state_numpy": bench_state_numpy,
+        "federal": bench_federal,
+        "csv_writer": bench_csv_writer,
+        "batch": bench_batch,
+        "store_writer": bench_store_writer,
+        "analysis": bench_analysis
+    }
+# Benchmarks that depend on the worker count; the rest are single-process and run once per size
+PARALLEL_BENCHMARKS:tuple[str,...] = ("batch",)
+# Run sizes are scaled per benchmark so the slow paths finish in seconds
+SIZE_SCALE:dict[str,float] = {"state_scalar": 0.001,"state_numpy": 0.01,"federal": 1,"csv_writer": 0.01,"batch": 1,"store_writer": 1,"analysis": 0.1}
+
+def _run_case(name:str,rounds:int,workers:int) -> dict:
+    # Each case runs in a fresh process inside a scratch copy of data/, so peak RSS and output files are its own
+    work_dir:str = tempfile.mkdtemp(prefix=f"benchmark_{name}_")
+    try:
+        os.makedirs(os.path.join(work_dir,"data"))
+        for file_name in DATA_FILES:
+            shutil.copyfile(os.path.join(CURRENT_DIRECTORY,file_name),os.path.join(work_dir,file_name))
+        os.chdir(work_dir)
+        random.seed(0)
+        voter_data,party_popularity_data = _load_inputs(work_dir)
+        result:dict = BENCHMARKS[name](voter_data,party_popularity_data,rounds,workers)
+        result.update({"benchmark": name,"rounds": rounds,"workers": workers,"peak_rss_kb": _peak_rss_kb()})
+        return result
+    finally:
+        os.chdir(CURRENT_DIRECTORY)
+        shutil.rmtree(work_dir,ignore_errors=True)
+
+def _git_commit() -> str|None:
+    try:
+        return subprocess.run(["git","rev-parse","HEAD"],cwd=CURRENT_DIRECTORY,capture_output=True,text=True,check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(names:list[str],sizes:list[int],worker_counts:list[int]) -> dict:
+    results:list[dict] = []
+    for name in names:
+        for size in sizes:
+            rounds:int = max(1,int(size*SIZE_SCALE[name]))
+            for workers in (worker_counts if name in PARALLEL_BENCHMARKS else [1]):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result:dict = executor.submit(_run_case,name,rounds,workers).result()
+                print(json.dumps(result))
+                results.append(result)
+    return {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "results": results
+        }
+
+def compare(baseline:dict,current:dict) -> None:
+    # Prints the throughput ratio current/baseline for every case present in both runs
+    def key(result:dict) -> tuple:
+        return (result["benchmark"],result["rounds"],result["workers"])
+    previous:dict[tuple,dict] = {key(result):result for result in baseline["results"]}
+    for result in current["results"]:
+        old:dict|None = previous.get(key(result))
+        if old is None:
+            continue
+        ratio:float = old["seconds"]/result["seconds"] if result["seconds"] > 0 else float("inf")
+        print(f"{result['benchmark']:>14} rounds={result['rounds']:<9,} workers={result['workers']:<3} speedup x{ratio:.2f} peak_rss {old['peak_rss_kb']:,}KB -> {result['peak_rss_kb']:,}KB")
+
+def main():
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Throughput benchmarks for the election simulator")
+    parser.add_argument("--benchmarks",nargs="+",choices=list(BENCHMARKS),default=list(BENCHMARKS))
+    parser.add_argument("--sizes",nargs="+",type=int,default=[1_000,10_000,100_000],help="Base run sizes in rounds, scaled down per benchmark by SIZE_SCALE")
+    parser.add_argument("--workers",nargs="+",type=int,default=[1,2,4])
+    parser.add_argument("--output",default="benchmark_results.json")
+    parser.add_argument("--compare",default=None,help="Earlier benchmark JSON to compare against")
+    args:argparse.Namespace = parser.parse_args()
+    report:dict = run_benchmarks(args.benchmarks,args.sizes,args.workers)
+    with open(args.output,'w') as file:
+        json.dump(report,file,indent=2)
+    if args.compare is not None:
+        with open(args.compare,'r') as file:
+            compare(json.load(file),report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import json
+import random
+import numpy as np
+
+CHECKPOINT_FILE:str = "simulator_checkpoint.json"
+RESULT_FILES:tuple[str,...] = ("State_Results.csv","National_Results.csv")
+
+def write_checkpoint(path:str,checkpoint:dict) -> None:
+    # Write-then-rename so a crash leaves either the previous checkpoint or the new one, never a partial file
+    temp_path:str = f"{path}.tmp"
+    with open(temp_path,'w') as file:
+        json.dump(checkpoint,file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path,path)
+
+def read_checkpoint(path:str) -> dict|None:
+    if not os.path.exists(path):
+        return None
+    with open(path,'r') as file:
+        return json.load(file)
+
+def capture_rng_state(rng:np.random.Generator) -> dict:
+    version,internal_state,gauss_next = random.getstate()
+    return {"numpy": rng.bit_generator.state,"random": [version,list(internal_state),gauss_next]}
+
+def restore_rng_state(rng:np.random.Generator,rng_state:dict) -> None:
+    rng.bit_generator.state = rng_state["numpy"]
+    version,internal_state,gauss_next = rng_state["random"]
+    random.setstate((version,tuple(internal_state),gauss_next))
+
+def capture_output_offsets(sink=None) -> dict:
+    if sink is not None:
+        sink.flush()
+        return {"store_chunks": len(sink.manifest["chunks"])}
+    return {"csv_bytes": {file_name: os.path.getsize(file_name) if os.path.exists(file_name) else 0 for file_name in RESULT_FILES}}
+
+def restore_output_offsets(offsets:dict,sink=None) -> None:
+    # Drop anything written after the checkpoint so resumed rounds are neither duplicated nor missing
+    if sink is not None:
+        sink.truncate(offsets["store_chunks"])
+        return
+    for file_name,size in offsets["csv_bytes"].items():
+        if os.path.exists(file_name):
+            with open(file_name,'r+b') as file:
+                file.truncate(size)
+
+def save_run_checkpoint(path:str,seed:int,engine:str,output:str,last_round:int,n_states:int,rng:np.random.Generator,sink=None) -> None:
+    write_checkpoint(path,{
+            "seed": seed,
+            "engine": engine,
+            "output": output,
+            "last_round": last_round,
+            "national_rows": last_round,
+            "state_rows": last_round*n_states,
+            "rng_state": capture_rng_state(rng),
+            "offsets": capture_output_offsets(sink)
+        })
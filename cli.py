@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+# Taken before anything else is imported, so --timings can report everything the command cost after interpreter start
+CLI_STARTED:float = time.perf_counter()
+# Packages worth reporting in --timings; each subcommand should only pull in the ones it needs
+HEAVY_MODULES:tuple[str,...] = ("numpy","pandas","requests","bs4","urllib3")
+# Subcommand -> the module that implements it. Nothing below is imported until its subcommand runs.
+SUBCOMMAND_MODULES:dict[str,str] = {
+        "simulate": "simulator",
+        "analyze": "analysis",
+        "merge-kff": "voter_registration_kff_merge",
+        "scrape-baseline": "party_popularity_history",
+        "backtest": "backtest"
+    }
+
+def run_simulate(module,args:argparse.Namespace) -> None:
+    module.main(engine=args.engine,seed=args.seed,workers=args.workers,output=args.output,store_dir=args.store_dir,max_round=args.rounds,resume=args.resume,aggregate=args.aggregate,log_mode=args.log_mode,progress_every_seconds=args.progress_seconds,stop_on_convergence=args.stop_on_convergence,probability_tolerance=args.probability_tolerance,electoral_tolerance=args.electoral_tolerance,metrics_path=args.metrics,metrics_every_seconds=args.metrics_seconds,profile_rounds=args.profile_rounds,profile_path=args.profile_path,profiler=args.profiler,swing_model_path=args.swing_model,voter_file=args.voter_file,party_file=args.party_file,year=args.year)
+
+def run_analyze(module,args:argparse.Namespace) -> None:
+    # analysis.py writes into analysis/ under the working directory and expects it to exist
+    os.makedirs("analysis",exist_ok=True)
+    module.main(store_dir=args.store_dir,checkpoint_path=args.checkpoint,aggregate_path=args.aggregate,workers=args.workers)
+
+def run_merge_kff(module,args:argparse.Namespace) -> None:
+    module.main(data_folder=os.path.abspath(args.data_folder),output_file=args.output_file,last_year=args.last_year)
+
+def run_scrape_baseline(module,args:argparse.Namespace) -> None:
+    module.main(replay=args.replay,cache_dir=os.path.abspath(args.cache_dir),max_age_days=args.max_age_days,max_workers=args.workers,output_file=args.output_file,results_file=args.results_file)
+
+def run_backtest(module,args:argparse.Namespace) -> None:
+    module.main(calibrate_parameters=args.calibrate,calibration_file=args.calibration_file,years=tuple(args.years),rounds=args.rounds,seed=args.seed,workers=args.workers,objective=args.objective,screen_rounds=args.screen_rounds,keep=args.keep,output_dir=args.output_dir,voter_file=args.voter_file,results_file=args.results_file)
+
+RUNNERS:dict = {
+        "simulate": run_simulate,
+        "analyze": run_analyze,
+        "merge-kff": run_merge_kff,
+        "scrape-baseline": run_scrape_baseline,
+        "backtest": run_backtest
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    # Choices are spelled out here rather than read from the modules, so building the parser imports nothing
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Election simulator command line")
+    parser.add_argument("--workdir",default=None,help="Run as if started in this directory; relative paths and logs resolve there")
+    parser.add_argument("--timings",action="store_true",help="Print import, run and total seconds and which heavy packages were loaded")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+
+    simulate:argparse.ArgumentParser = subparsers.add_parser("simulate",help="Run the Monte Carlo simulation")
+    # Mirrors simulator.add_arguments, which is not called here because importing simulator pulls in numpy
+    simulate.add_argument("--engine",choices=["scalar","numpy","batch"],default="numpy")
+    simulate.add_argument("--seed",type=int,default=None)
+    simulate.add_argument("--workers",type=int,default=1)
+    simulate.add_argument("--output",choices=["csv","store","compact"],default="csv")
+    simulate.add_argument("--store-dir",default="results")
+    simulate.add_argument("--rounds",type=int,default=1_000_000)
+    simulate.add_argument("--resume",action="store_true",help="Continue from the last checkpoint instead of starting over")
+    simulate.add_argument("--aggregate",action="store_true",help="Keep running analysis totals and write analysis/ at the end of the run")
+    simulate.add_argument("--log-mode",choices=["sync","async"],default="sync",help="async logs WARN and above per round and reports progress every --progress-seconds")
+    simulate.add_argument("--progress-seconds",type=float,default=10.0)
+    simulate.add_argument("--stop-on-convergence",action="store_true",help="Stop once every tracked estimate is within tolerance; --rounds becomes an upper bound")
+    simulate.add_argument("--probability-tolerance",type=float,default=0.005,help="Confidence interval half-width for win probabilities and state win rates")
+    simulate.add_argument("--electoral-tolerance",type=float,default=0.5,help="Confidence interval half-width for expected electoral votes")
+    simulate.add_argument("--metrics",default=None,help="Append per-stage timing summaries (JSON lines) here and keep the latest as a Prometheus .prom file beside it")
+    simulate.add_argument("--metrics-seconds",type=float,default=30.0)
+    simulate.add_argument("--profile-rounds",type=int,nargs=2,default=None,metavar=("FIRST","LAST"),help="Profile rounds FIRST-LAST inclusive")
+    simulate.add_argument("--profile-path",default="simulator_profile.pstats")
+    simulate.add_argument("--profiler",choices=["cprofile","sampling"],default="cprofile",help="sampling writes collapsed stacks instead of pstats")
+    simulate.add_argument("--swing-model",default=None,help="JSON covariance spec for correlated per-state swings (batch engine only)")
+    simulate.add_argument("--voter-file",default="data/Combined_Data.csv")
+    simulate.add_argument("--party-file",default="data/Baseline_Popularity.csv")
+    simulate.add_argument("--year",type=int,default=2028)
+
+    analyze:argparse.ArgumentParser = subparsers.add_parser("analyze",help="Write the analysis/ summaries from simulation results")
+    analyze.add_argument("--store-dir",default=None)
+    analyze.add_argument("--checkpoint",default="simulator_checkpoint.json")
+    analyze.add_argument("--aggregate",default=None)
+    analyze.add_argument("--workers",type=int,default=1)
+
+    merge_kff:argparse.ArgumentParser = subparsers.add_parser("merge-kff",help="Merge the KFF registration CSVs and project future years")
+    merge_kff.add_argument("--data-folder",default="data")
+    merge_kff.add_argument("--output-file",default="data/Combined_Data.csv")
+    merge_kff.add_argument("--last-year",type=int,default=2032,help="Project registration through this year")
+
+    scrape_baseline:argparse.ArgumentParser = subparsers.add_parser("scrape-baseline",help="Rebuild the baseline party popularity from 270towin")
+    scrape_baseline.add_argument("--output-file",default="data/Baseline_Popularity.csv")
+    scrape_baseline.add_argument("--results-file",default="data/Historical_Results.csv")
+    scrape_baseline.add_argument("--cache-dir",default=os.path.join("cache","270towin"))
+    scrape_baseline.add_argument("--replay",action="store_true")
+    scrape_baseline.add_argument("--max-age-days",type=float,default=30)
+    scrape_baseline.add_argument("--workers",type=int,default=8)
+
+    backtest:argparse.ArgumentParser = subparsers.add_parser("backtest",help="Score forecasts for past elections and optionally calibrate the swing and turnout ranges")
+    backtest.add_argument("--calibrate",action="store_true")
+    backtest.add_argument("--calibration-file",default=None)
+    backtest.add_argument("--years",type=int,nargs="+",default=[2016,2020,2024])
+    backtest.add_argument("--rounds",type=int,default=20_000)
+    backtest.add_argument("--seed",type=int,default=None)
+    backtest.add_argument("--workers",type=int,default=1)
+    backtest.add_argument("--objective",choices=["log_loss","brier","electoral_error"],default="log_loss")
+    backtest.add_argument("--screen-rounds",type=int,default=None)
+    backtest.add_argument("--keep",type=int,default=5)
+    backtest.add_argument("--output-dir",default="backtest")
+    backtest.add_argument("--voter-file",default="data/Combined_Data.csv")
+    backtest.add_argument("--results-file",default="data/Historical_Results.csv")
+    return parser
+
+def main(argv:list[str]|None=None) -> dict[str,float]:
+    args:argparse.Namespace = build_parser().parse_args(argv)
+    if args.workdir is not None:
+        # Before the subcommand module is imported, since modules capture CURRENT_DIRECTORY at import time
+        os.chdir(args.workdir)
+    module_name:str = SUBCOMMAND_MODULES[args.command]
+    started:float = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported:float = time.perf_counter()
+    RUNNERS[args.command](module,args)
+    finished:float = time.perf_counter()
+    timings:dict[str,float] = {"import_seconds": imported-started,"run_seconds": finished-imported,"total_seconds": finished-CLI_STARTED}
+    if args.timings:
+        loaded:list[str] = [name for name in HEAVY_MODULES if name in sys.modules]
+        print(f"{args.command}: import {module_name} {timings['import_seconds']:.3f}s, run {timings['run_seconds']:.3f}s, total {timings['total_seconds']:.3f}s")
+        print(f"{args.command}: heavy packages loaded: {', '.join(loaded) if loaded else 'none'}")
+    return timings
+
+if __name__ == "__main__":
+    main()
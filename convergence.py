@@ -0,0 +1,76 @@
+import numpy as np
+from batch_simulation import PARTIES,Round_Batch,state_winner_codes
+from online_aggregator import Running_Moments
+
+Z_SCORES:dict[float,float] = {0.90: 1.6449,0.95: 1.9600,0.99: 2.5758}
+
+def wilson_half_width(successes:np.ndarray,trials:int,z:float) -> np.ndarray:
+    # Wilson score interval: stays sensible for win rates at or near 0 and 1, unlike the normal approximation
+    if trials == 0:
+        return np.full(np.shape(successes),np.inf)
+    p:np.ndarray = np.asarray(successes)/trials
+    return z/(1+z**2/trials)*np.sqrt(p*(1-p)/trials+z**2/(4*trials**2))
+
+class Convergence_Monitor:
+    def __init__(self,electoral:np.ndarray,probability_tolerance:float=0.005,electoral_tolerance:float=0.5,confidence:float=0.95,min_rounds:int=1_000):
+        self.electoral:np.ndarray = np.asarray(electoral,dtype=np.int64)
+        self.majority:int = int(self.electoral.sum())//2+1
+        self.probability_tolerance:float = probability_tolerance
+        self.electoral_tolerance:float = electoral_tolerance
+        self.z:float = Z_SCORES[confidence]
+        self.confidence:float = confidence
+        self.min_rounds:int = min_rounds
+        self.national_wins:np.ndarray = np.zeros(len(PARTIES),dtype=np.int64)
+        self.state_wins:np.ndarray = np.zeros((len(self.electoral),len(PARTIES)),dtype=np.int64)
+        self.electoral_votes:Running_Moments = Running_Moments((len(PARTIES),))
+
+    @property
+    def rounds(self) -> int:
+        return self.electoral_votes.count
+
+    def update(self,party_electoral_votes:np.ndarray,winner_codes:np.ndarray) -> None:
+        # party_electoral_votes: rounds x parties, winner_codes: rounds x states
+        self.electoral_votes.update(party_electoral_votes.astype(np.float64))
+        self.national_wins += (party_electoral_votes >= self.majority).sum(axis=0)
+        for code in range(len(PARTIES)):
+            self.state_wins[:,code] += (winner_codes==code).sum(axis=0)
+
+    def update_batch(self,batch:Round_Batch) -> None:
+        self.update(np.column_stack([batch.rep_electoral_votes,batch.dem_electoral_votes,batch.ind_electoral_votes]),state_winner_codes(batch))
+
+    def update_round(self,state_results:list[dict[str,int|float]],national_results:dict[str,list[int|float]]) -> None:
+        party_electoral_votes:np.ndarray = np.array([[national_results[f"{party} Electoral Votes"][0] for party in PARTIES]])
+        winner_codes:np.ndarray = np.array([[PARTIES.index(row["Winner"]) if row["Winner"] in PARTIES else -1 for row in state_results]])
+        self.update(party_electoral_votes,winner_codes)
+
+    def precision(self) -> dict[str,float]:
+        n:int = self.rounds
+        electoral_half_width:np.ndarray = self.z*np.sqrt(self.electoral_votes.variance/max(n,1)) if n > 1 else np.full(len(PARTIES),np.inf)
+        return {
+                "national_win_probability": float(wilson_half_width(self.national_wins,n,self.z).max()),
+                "expected_electoral_votes": float(electoral_half_width.max()),
+                "state_win_rate": float(wilson_half_width(self.state_wins,n,self.z).max())
+            }
+
+    def converged(self) -> bool:
+        if self.rounds < self.min_rounds:
+            return False
+        precision:dict[str,float] = self.precision()
+        return (
+                precision["national_win_probability"] <= self.probability_tolerance and
+                precision["state_win_rate"] <= self.probability_tolerance and
+                precision["expected_electoral_votes"] <= self.electoral_tolerance
+            )
+
+    def report(self) -> dict:
+        n:int = max(self.rounds,1)
+        return {
+                "rounds": self.rounds,
+                "confidence": self.confidence,
+                "probability_tolerance": self.probability_tolerance,
+                "electoral_tolerance": self.electoral_tolerance,
+                "converged": self.converged(),
+                "achieved_half_width": self.precision(),
+                "national_win_probability": {party: float(self.national_wins[code]/n) for code,party in enumerate(PARTIES)},
+                "expected_electoral_votes": {party: float(self.electoral_votes.mean[code]) for code,party in enumerate(PARTIES)}
+            }
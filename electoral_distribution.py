@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import argparse
+import traceback
+import numpy as np
+from pandas import DataFrame
+from xml_logging import XML_Logger
+from simulator import ABSTAIN_RATE
+from state_model import State_Model
+from batch_simulation import PARTIES,SWING_HIGHS,TURNOUT_RANGE,adjust_party_popularity,vote_probabilities
+CURRENT_DIRECTORY:str = os.getcwd()
+# Lattice spacing of the net swing, in popularity points (0.002 = a fifth of a point)
+DEFAULT_RESOLUTION:float = 0.002
+DEFAULT_TURNOUT_NODES:int = 3
+DEFAULT_CHUNK_SIZE:int = 512
+
+def normal_cdf(z:np.ndarray) -> np.ndarray:
+    # Abramowitz and Stegun 7.1.26 for erfc (absolute error below 1.5e-7), so no scipy is needed
+    x:np.ndarray = np.abs(np.asarray(z,dtype=np.float64))/np.sqrt(2)
+    t:np.ndarray = 1/(1+0.3275911*x)
+    erfc:np.ndarray = t*(0.254829592+t*(-0.284496736+t*(1.421413741+t*(-1.453152027+t*1.061405429))))*np.exp(-x**2)
+    return np.where(np.asarray(z) >= 0,1-0.5*erfc,0.5*erfc)
+
+def uniform_difference_pmf(high:float,low:float,resolution:float) -> tuple[np.ndarray,np.ndarray]:
+    # U(0,high)-U(0,low) on a lattice: each uniform is binned exactly, then the two are convolved
+    def binned(width:float) -> np.ndarray:
+        edges:np.ndarray = (np.arange(int(np.ceil(width/resolution))+2)-0.5)*resolution
+        return np.diff(np.clip(edges,0,width))/width
+    high_pmf:np.ndarray = binned(high)
+    low_pmf:np.ndarray = binned(low)
+    pmf:np.ndarray = np.convolve(high_pmf,low_pmf[::-1])
+    return (np.arange(len(pmf))-(len(low_pmf)-1))*resolution,pmf
+
+def swing_lattice(resolution:float=DEFAULT_RESOLUTION,swing_highs:np.ndarray=SWING_HIGHS) -> tuple[np.ndarray,np.ndarray]:
+    # The six transfers in get_popularity_changes only move two free quantities, since the net changes sum to zero:
+    #   net_rep = (ind_to_rep-rep_to_ind) + (dem_to_rep-rep_to_dem),  net_dem = (ind_to_dem-dem_to_ind) - (dem_to_rep-rep_to_dem)
+    # Returns every lattice point of (net_rep, net_dem, net_ind) with its probability.
+    rep_to_ind,rep_to_dem,dem_to_ind,dem_to_rep,ind_to_dem,ind_to_rep = swing_highs
+    u_values,u_pmf = uniform_difference_pmf(ind_to_rep,rep_to_ind,resolution)
+    v_values,v_pmf = uniform_difference_pmf(ind_to_dem,dem_to_ind,resolution)
+    s_values,s_pmf = uniform_difference_pmf(dem_to_rep,rep_to_dem,resolution)
+    steps:np.ndarray = np.rint(s_values/resolution).astype(np.int64)
+    u_offset:int = int(np.rint(u_values[0]/resolution))
+    v_offset:int = int(np.rint(v_values[0]/resolution))
+    s_offset:int = int(steps[0])
+    joint:np.ndarray = np.zeros((len(u_pmf)+len(s_pmf)-1,len(v_pmf)+len(s_pmf)-1))
+    # net_rep index = u + s, net_dem index = v - s, so each swing step s adds one shifted outer product
+    for index,mass in enumerate(s_pmf):
+        if mass > 0:
+            joint[index:index+len(u_pmf),len(s_pmf)-1-index:len(s_pmf)-1-index+len(v_pmf)] += mass*np.outer(u_pmf,v_pmf)
+    rep_index,dem_index = np.nonzero(joint)
+    net_rep:np.ndarray = (rep_index+u_offset+s_offset)*resolution
+    net_dem:np.ndarray = (dem_index+v_offset-(s_offset+len(s_pmf)-1))*resolution
+    return np.column_stack([net_rep,net_dem,-net_rep-net_dem]),joint[rep_index,dem_index]
+
+def turnout_nodes(nodes:int=DEFAULT_TURNOUT_NODES,turnout_range:tuple[float,float]=TURNOUT_RANGE) -> np.ndarray:
+    # Midpoints of equal-probability slices of the uniform turnout draw. Turnout only sets how many votes are cast,
+    # which changes how sharp each state's win probability is, so a few nodes are plenty.
+    low,high = turnout_range
+    return low+(np.arange(nodes)+0.5)/nodes*(high-low)
+
+def _lead_probability(votes:np.ndarray,leader:np.ndarray,trailer:np.ndarray,wins_tie:bool,spread:float=0.0) -> np.ndarray:
+    # Normal approximation of P(leader >= trailer) (or >, without the tie) for multinomial counts, with a continuity correction.
+    # spread is the standard deviation of the share margin across the lattice cell the point stands for.
+    mean:np.ndarray = votes*(leader-trailer)+(0.5 if wins_tie else -0.5)
+    sd:np.ndarray = np.sqrt(votes*np.maximum(leader+trailer-(leader-trailer)**2,0)+(votes*spread)**2)
+    z:np.ndarray = np.divide(mean,sd,out=np.where(mean>=0,np.inf,-np.inf),where=sd>0)
+    return normal_cdf(z)
+
+def state_win_probabilities(registered:np.ndarray,baseline:np.ndarray,popularity_changes:np.ndarray,turnout:np.ndarray,resolution:float=0.0) -> np.ndarray:
+    # draws x states x parties, for the same clamping and cut points as simulate_batch. The vote count is its expected
+    # value given turnout; its own spread barely moves the winner next to the vote shares.
+    # Each lattice point stands for a whole cell of swings. Every pairwise margin (rep-dem moves with net_rep-net_dem,
+    # rep-ind with 2*net_rep+net_dem, ...) varies across the cell with variance resolution**2/2, which is folded into
+    # the margin's normal approximation so that a state whose threshold falls inside a cell is split, not rounded.
+    spread:float = resolution/np.sqrt(2)
+    popularity:np.ndarray = baseline[None,:,:]+popularity_changes[:,None,:]
+    rep,dem,ind = adjust_party_popularity(popularity[...,0],popularity[...,1],popularity[...,2])
+    rep_probability,dem_probability = vote_probabilities(rep,dem)
+    ind_probability:np.ndarray = np.maximum(1-rep_probability-dem_probability,0)
+    votes:np.ndarray = registered[None,:]*turnout[:,None]*(1-ABSTAIN_RATE)
+    # Ties go Republican, then Democrat, as in Federal_Election_Simulation._get_electoral_votes. The two pairwise
+    # margins are treated as independent, which only matters when three parties are within a few votes of each other.
+    wins:np.ndarray = np.stack([
+            _lead_probability(votes,rep_probability,dem_probability,True,spread)*_lead_probability(votes,rep_probability,ind_probability,True,spread),
+            _lead_probability(votes,dem_probability,rep_probability,False,spread)*_lead_probability(votes,dem_probability,ind_probability,True,spread),
+            _lead_probability(votes,ind_probability,rep_probability,False,spread)*_lead_probability(votes,ind_probability,dem_probability,False,spread)
+        ],axis=-1)
+    return wins/wins.sum(axis=-1,keepdims=True)
+
+def convolve_electoral_votes(win_probabilities:np.ndarray,electoral:np.ndarray) -> np.ndarray:
+    # win_probabilities: draws x states. Returns draws x (total+1), P(party holds exactly k electoral votes) for each draw.
+    n_draws:int = win_probabilities.shape[0]
+    distribution:np.ndarray = np.zeros((n_draws,int(electoral.sum())+1))
+    distribution[:,0] = 1
+    # Only the first reach+1 totals can be non-zero after the states seen so far
+    reach:int = 0
+    for state,votes in enumerate(electoral):
+        p:np.ndarray = win_probabilities[:,state,None]
+        shifted:np.ndarray = distribution[:,:reach+1]*p
+        distribution[:,:reach+1] *= 1-p
+        distribution[:,votes:votes+reach+1] += shifted
+        reach += int(votes)
+    return distribution
+
+class Electoral_Distribution:
+    # Exact electoral-vote distribution for each swing/turnout point, accumulated with the point's probability
+    def __init__(self,electoral:np.ndarray):
+        self.electoral:np.ndarray = np.asarray(electoral,dtype=np.int64)
+        self.total:int = int(self.electoral.sum())
+        self.majority:int = self.total//2+1
+        self.points:int = 0
+        self.weight:float = 0.0
+        self.histogram:np.ndarray = np.zeros((len(PARTIES),self.total+1))
+        self.win_probability:np.ndarray = np.zeros(len(PARTIES))
+        self.tie_probability:float = 0.0
+        self.state_wins:np.ndarray = np.zeros((len(self.electoral),len(PARTIES)))
+
+    def update(self,win_probabilities:np.ndarray,weights:np.ndarray) -> None:
+        # Most lattice points call every state with certainty, so identical rows are convolved once
+        rows,inverse = np.unique(np.round(win_probabilities.reshape(len(weights),-1),9),axis=0,return_inverse=True)
+        rows = rows.reshape(-1,*win_probabilities.shape[1:])
+        row_weights:np.ndarray = np.bincount(inverse.ravel(),weights=weights,minlength=len(rows))
+        self.points += len(weights)
+        self.weight += float(weights.sum())
+        self.state_wins += np.einsum("i,ijk->jk",weights,win_probabilities)
+        if rows[...,2].max() <= 1e-12:
+            # The Independent carries nothing anywhere, so every state goes Republican or Democrat and one convolution
+            # gives all three parties: the Democrat total is the mirror image of the Republican one
+            rep:np.ndarray = convolve_electoral_votes(rows[...,0],self.electoral)
+            ind:np.ndarray = np.zeros_like(rep)
+            ind[:,0] = 1
+            distributions:list[np.ndarray] = [rep,rep[:,::-1],ind]
+            ties:np.ndarray = rep[:,self.total//2]
+        else:
+            distributions = [convolve_electoral_votes(rows[...,code],self.electoral) for code in range(len(PARTIES))]
+            # A 269-269 tie needs the Independent to carry nothing, so it is the Republican count in the two-party split
+            two_party:np.ndarray = rows[...,0]/np.maximum(rows[...,0]+rows[...,1],np.finfo(np.float64).tiny)
+            no_ind:np.ndarray = np.prod(1-rows[...,2],axis=1)
+            ties = convolve_electoral_votes(two_party,self.electoral)[:,self.total//2]*no_ind
+        for code,distribution in enumerate(distributions):
+            self.histogram[code] += row_weights@distribution
+            self.win_probability[code] += row_weights@distribution[:,self.majority:].sum(axis=1)
+        if self.total%2 == 0:
+            self.tie_probability += float(row_weights@ties)
+
+    def report(self) -> dict:
+        weight:float = self.weight if self.weight > 0 else 1.0
+        win_probability:np.ndarray = self.win_probability/weight
+        histogram:np.ndarray = self.histogram/weight
+        return {
+                "points": self.points,
+                "majority": self.majority,
+                "national_win_probability": {party: float(win_probability[code]) for code,party in enumerate(PARTIES)},
+                "tie_probability": self.tie_probability/weight,
+                "no_majority_probability": float(max(1-win_probability.sum(),0)),
+                "expected_electoral_votes": {party: float(histogram[code]@np.arange(self.total+1)) for code,party in enumerate(PARTIES)}
+            }
+
+    def histogram_frame(self) -> DataFrame:
+        histogram:np.ndarray = self.histogram/(self.weight if self.weight > 0 else 1.0)
+        return DataFrame({"Electoral Votes": np.arange(self.total+1),**{party: histogram[code] for code,party in enumerate(PARTIES)}})
+
+    def state_frame(self,states:np.ndarray) -> DataFrame:
+        state_wins:np.ndarray = self.state_wins/(self.weight if self.weight > 0 else 1.0)
+        return DataFrame({"State": states,"Electoral Votes": self.electoral,**{f"{party} Win Probability": state_wins[:,code] for code,party in enumerate(PARTIES)}})
+
+def electoral_distribution(state_model:State_Model,resolution:float=DEFAULT_RESOLUTION,nodes:int=DEFAULT_TURNOUT_NODES,chunk_size:int=DEFAULT_CHUNK_SIZE) -> Electoral_Distribution:
+    # Integrates over the same swing/turnout distribution simulate_rounds samples from, on a lattice instead of by sampling
+    popularity_changes,weights = swing_lattice(resolution)
+    distribution:Electoral_Distribution = Electoral_Distribution(state_model.electoral)
+    for turnout in turnout_nodes(nodes):
+        for start in range(0,len(weights),chunk_size):
+            changes:np.ndarray = popularity_changes[start:start+chunk_size]
+            distribution.update(state_win_probabilities(state_model.registered,state_model.baseline,changes,np.full(len(changes),turnout),resolution),weights[start:start+chunk_size]/nodes)
+    return distribution
+
+def main(resolution:float=DEFAULT_RESOLUTION,nodes:int=DEFAULT_TURNOUT_NODES,report_path:str="electoral_distribution.json"):
+    try:
+        from input_cache import load_cached_state_model
+        logger:XML_Logger = XML_Logger("electoral_distribution_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        started:float = time.perf_counter()
+        state_model,_ = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root=os.path.join(CURRENT_DIRECTORY,"cache","inputs"))
+        distribution:Electoral_Distribution = electoral_distribution(state_model,resolution=resolution,nodes=nodes)
+        report:dict = distribution.report()
+        # The same integral on a lattice twice as coarse; the gap bounds the discretization error of the fine one
+        coarse:dict = electoral_distribution(state_model,resolution=2*resolution,nodes=nodes).report()
+        report["discretization_error_bound"] = max(abs(report["national_win_probability"][party]-coarse["national_win_probability"][party]) for party in PARTIES)
+        report["seconds"] = time.perf_counter()-started
+        with open(os.path.join(CURRENT_DIRECTORY,report_path),'w') as file:
+            json.dump(report,file,indent=2)
+        os.makedirs("analysis",exist_ok=True)
+        distribution.histogram_frame().to_csv("analysis/Electoral_Vote_Distribution.csv",index=False)
+        distribution.state_frame(state_model.states).to_csv("analysis/State_Win_Probabilities.csv",index=False)
+        message:str = f"Electoral distribution in {report['seconds']:.1f}s: "+", ".join(f"{party} {p:.4f}" for party,p in report["national_win_probability"].items())+f", 269-269 tie {report['tie_probability']:.4f} (discretization error below {report['discretization_error_bound']:.1e})"
+        logger.log_to_xml(message=message,basepath=logger.base_dir,status="SUCCESS")
+        print(message)
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Failed to compute the electoral vote distribution. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Failed to compute the electoral vote distribution. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Exact electoral-vote distribution by convolving per-state win probabilities")
+    parser.add_argument("--resolution",type=float,default=DEFAULT_RESOLUTION,help="Lattice spacing of the net popularity swing")
+    parser.add_argument("--turnout-nodes",type=int,default=DEFAULT_TURNOUT_NODES)
+    parser.add_argument("--report",default="electoral_distribution.json")
+    args:argparse.Namespace = parser.parse_args()
+    main(resolution=args.resolution,nodes=args.turnout_nodes,report_path=args.report)
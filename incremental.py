@@ -0,0 +1,228 @@
+import os
+import json
+import zlib
+import time
+import shutil
+import argparse
+import traceback
+import numpy as np
+from datetime import datetime
+from xml_logging import XML_Logger
+from state_model import State_Model,state_key
+from batch_simulation import PARTIES,Round_Batch,draw_popularity_changes,draw_turnout,adjust_party_popularity,vote_probabilities,sample_votes
+from parallel_simulation import DEFAULT_BLOCK_SIZE,block_seed,block_ranges
+from result_store import Result_Sink,read_manifest,write_manifest,read_chunk,write_chunk,read_compact_votes,write_compact_votes
+CURRENT_DIRECTORY:str = os.getcwd()
+# Manifest entry of a store written with common random numbers: the seed, block size and the inputs of every state
+CRN_KEY:str = "common_random_numbers"
+
+# Every round's swing and turnout come from the block's own stream, exactly as in parallel_simulation, and every
+# state's votes from a stream keyed by (block, state). Any one state can then be re-simulated for any block without
+# touching the others, and a re-simulated state sees the same swings, turnout and uniforms as before its inputs changed.
+
+def state_stream(master_seed:int,block_index:int,state:str) -> np.random.Generator:
+    # Keyed by the state's name rather than its row, so reordering the input files does not change anyone's draws
+    return np.random.default_rng(np.random.SeedSequence(master_seed,spawn_key=(block_index,zlib.crc32(state_key(state).encode("utf-8")))))
+
+def round_inputs(master_seed:int,block_index:int,n_rounds:int) -> tuple[np.ndarray,np.ndarray]:
+    rng:np.random.Generator = np.random.default_rng(block_seed(master_seed,block_index))
+    popularity_changes:np.ndarray = draw_popularity_changes(rng,n_rounds)
+    return popularity_changes,draw_turnout(rng,n_rounds)
+
+def simulate_state(registered:int,baseline:np.ndarray,popularity_changes:np.ndarray,turnout:np.ndarray,rng:np.random.Generator) -> np.ndarray:
+    # One state over a block of rounds, returned as (rep, dem, ind) x rounds vote counts
+    popularity:np.ndarray = baseline[None,:]+popularity_changes
+    rep,dem,ind = adjust_party_popularity(popularity[:,0],popularity[:,1],popularity[:,2])
+    rep_probability,dem_probability = vote_probabilities(rep,dem)
+    total_votes,rep_votes,dem_votes,ind_votes = sample_votes(rng,registered,turnout,rep_probability,dem_probability)
+    return np.stack([rep_votes,dem_votes,ind_votes])
+
+def simulate_block_crn(state_model:State_Model,master_seed:int,block_index:int,start:int,end:int) -> Round_Batch:
+    n_rounds:int = end-start+1
+    popularity_changes,turnout = round_inputs(master_seed,block_index,n_rounds)
+    votes:np.ndarray = np.empty((len(PARTIES),n_rounds,len(state_model)),dtype=np.int64)
+    for row,state in enumerate(state_model.states):
+        votes[:,:,row] = simulate_state(int(state_model.registered[row]),state_model.baseline[row],popularity_changes,turnout,state_stream(master_seed,block_index,state))
+    return Round_Batch(np.arange(start,end+1,dtype=np.int64),turnout,popularity_changes,votes.sum(axis=0),votes[0],votes[1],votes[2],state_model.electoral)
+
+def model_inputs(state_model:State_Model) -> dict[str,dict]:
+    return {str(state): {"registered": int(state_model.registered[row]),"baseline": [float(value) for value in state_model.baseline[row]],"electoral_votes": int(state_model.electoral[row])} for row,state in enumerate(state_model.states)}
+
+def changed_states(manifest:dict,state_model:State_Model) -> list[int]:
+    # Rows of state_model whose inputs differ from the ones the store was simulated with
+    stored:dict[str,dict] = {state_key(state):inputs for state,inputs in manifest[CRN_KEY]["inputs"].items()}
+    if set(stored) != {state_key(state) for state in state_model.states}:
+        raise ValueError("The set of states changed since the store was written; rerun it from scratch")
+    current:dict[str,dict] = model_inputs(state_model)
+    return [row for row,state in enumerate(state_model.states) if current[str(state)] != stored[state_key(state)]]
+
+def run_crn(state_model:State_Model,store_dir:str,max_round:int,seed:int,logger:XML_Logger,block_size:int=DEFAULT_BLOCK_SIZE,compact:bool=True) -> None:
+    # One store chunk per block, so a chunk can later be re-simulated from its block's streams alone
+    sink:Result_Sink = Result_Sink(store_dir,state_model.states,state_model.electoral,flush_rounds=block_size,compact=compact)
+    sink.manifest[CRN_KEY] = {"seed": seed,"block_size": block_size,"inputs": model_inputs(state_model)}
+    for block_index,start,end in block_ranges(max_round,block_size):
+        sink.append_batch(simulate_block_crn(state_model,seed,block_index,start,end))
+        sink.flush()
+        logger.log_to_xml(message=f"Simulated election rounds {start:,.0f}-{end:,.0f}/{max_round:,.0f}",basepath=logger.base_dir,status="INFO")
+        print(f"Simulated election rounds {start:,.0f}-{end:,.0f}/{max_round:,.0f} at {datetime.now()}")
+    sink.close()
+
+def patch_chunk(store_dir:str,manifest:dict,chunk:dict,state_model:State_Model,rows:list[int]) -> None:
+    crn:dict = manifest[CRN_KEY]
+    n_states:int = len(state_model)
+    n_rounds:int = chunk["rounds"]
+    block_index:int = (chunk["first_round"]-1)//crn["block_size"]
+    popularity_changes,turnout = round_inputs(crn["seed"],block_index,n_rounds)
+    if "codec" in chunk:
+        # Compact chunks only store vote counts and derive the federal totals on read, so only the counts change
+        votes:np.ndarray = np.array(read_compact_votes(store_dir,chunk,n_states))
+        for row in rows:
+            votes[:,:,row] = simulate_state(int(state_model.registered[row]),state_model.baseline[row],popularity_changes,turnout,state_stream(crn["seed"],block_index,state_model.states[row]))
+        write_compact_votes(store_dir,chunk,votes)
+        return
+    state_columns:dict[str,np.ndarray] = {key:np.array(values) for key,values in read_chunk(store_dir,chunk,"state",manifest=manifest).items()}
+    national_columns:dict[str,np.ndarray] = {key:np.array(values) for key,values in read_chunk(store_dir,chunk,"national",manifest=manifest).items()}
+    old_electoral:np.ndarray = np.asarray(manifest["electoral_votes"],dtype=np.int64)
+    for row in rows:
+        # This state's rows in the round-major state table
+        index:np.ndarray = np.arange(row,n_rounds*n_states,n_states)
+        old_votes:np.ndarray = np.stack([state_columns[f"{party}_votes"][index] for party in ("rep","dem","ind")]).astype(np.int64)
+        new_votes:np.ndarray = simulate_state(int(state_model.registered[row]),state_model.baseline[row],popularity_changes,turnout,state_stream(crn["seed"],block_index,state_model.states[row]))
+        new_total:np.ndarray = new_votes.sum(axis=0)
+        unique_winner:np.ndarray = (new_votes==new_votes.max(axis=0)).sum(axis=0)==1
+        state_columns["electoral_votes"][index] = state_model.electoral[row]
+        state_columns["winner"][index] = np.where(unique_winner,np.argmax(new_votes,axis=0),-1)
+        state_columns["total_votes"][index] = new_total
+        # Federal totals are patched by this state's change instead of being summed again over every state
+        national_columns["total_votes"] += new_total-old_votes.sum(axis=0)
+        old_winner:np.ndarray = np.argmax(old_votes,axis=0)
+        new_winner:np.ndarray = np.argmax(new_votes,axis=0)
+        for code,party in enumerate(("rep","dem","ind")):
+            state_columns[f"{party}_votes"][index] = new_votes[code]
+            state_columns[f"{party}_votes_pct"][index] = new_votes[code]/new_total
+            national_columns[f"{party}_votes"] += new_votes[code]-old_votes[code]
+            national_columns[f"{party}_electoral_votes"] += np.where(new_winner==code,state_model.electoral[row],0)-np.where(old_winner==code,old_electoral[row],0)
+    for party in ("rep","dem","ind"):
+        national_columns[f"{party}_votes_pct"] = national_columns[f"{party}_votes"]/national_columns["total_votes"]
+    write_chunk(store_dir,chunk,state_columns,national_columns,n_states)
+
+def _link_chunk(source_dir:str,target_dir:str) -> None:
+    # Hard links where the filesystem allows it. Chunk files are only ever replaced by rename (result_store._replace_file),
+    # never written through, so patching the copy cannot reach the original's data.
+    shutil.rmtree(target_dir,ignore_errors=True)
+    os.makedirs(target_dir)
+    for file_name in os.listdir(source_dir):
+        try:
+            os.link(os.path.join(source_dir,file_name),os.path.join(target_dir,file_name))
+        except OSError:
+            shutil.copy2(os.path.join(source_dir,file_name),os.path.join(target_dir,file_name))
+
+def update_crn(state_model:State_Model,store_dir:str,logger:XML_Logger,output_dir:str|None=None) -> list[str]:
+    # Re-simulates only the states whose inputs changed. With output_dir the patched copy is written there and the
+    # original store is kept for a paired comparison. Patched chunks are written to new directories and swapped in by
+    # a single manifest write, so a crash at any point leaves the store either wholly before or wholly after the update.
+    if output_dir is not None:
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        shutil.copytree(store_dir,output_dir)
+        store_dir = output_dir
+    manifest:dict = read_manifest(store_dir)
+    if CRN_KEY not in manifest:
+        raise ValueError(f"{store_dir} was not written with common random numbers; run it with incremental.run_crn first")
+    if [state_key(state) for state in manifest["states"]] != [state_key(state) for state in state_model.states]:
+        raise ValueError("State order changed since the store was written; rerun it from scratch")
+    rows:list[int] = changed_states(manifest,state_model)
+    # Directories a crashed update left behind, which no manifest lists
+    listed:set[str] = {chunk["name"] for chunk in manifest["chunks"]}
+    for entry in os.scandir(store_dir):
+        if entry.is_dir() and entry.name.startswith("chunk_") and entry.name not in listed:
+            shutil.rmtree(entry.path)
+    revision:int = manifest[CRN_KEY].get("revision",0)+1
+    patched:list[dict] = []
+    for chunk in manifest["chunks"]:
+        if not rows:
+            patched.append(chunk)
+            continue
+        new_chunk:dict = {**chunk,"name": f"{chunk['name'].split('_r')[0]}_r{revision:04d}"}
+        _link_chunk(os.path.join(store_dir,chunk["name"]),os.path.join(store_dir,new_chunk["name"]))
+        patch_chunk(store_dir,manifest,new_chunk,state_model,rows)
+        patched.append(new_chunk)
+    replaced:list[str] = [chunk["name"] for chunk in manifest["chunks"]] if rows else []
+    manifest["chunks"] = patched
+    manifest["electoral_votes"] = state_model.electoral.tolist()
+    manifest[CRN_KEY]["inputs"] = model_inputs(state_model)
+    manifest[CRN_KEY]["revision"] = revision
+    write_manifest(store_dir,manifest)
+    for name in replaced:
+        shutil.rmtree(os.path.join(store_dir,name),ignore_errors=True)
+    changed:list[str] = [str(state_model.states[row]) for row in rows]
+    logger.log_to_xml(message=f"Re-simulated {len(changed)} changed states ({', '.join(changed) or 'none'}) over {len(manifest['chunks'])} chunks in {store_dir}",basepath=logger.base_dir,status="INFO")
+    return changed
+
+def paired_difference(before_dir:str,after_dir:str) -> dict:
+    # Both stores share every random draw, so the per-round differences carry only the effect of the edit
+    manifest:dict = read_manifest(before_dir)
+    after_manifest:dict = read_manifest(after_dir)
+    majority:int = int(np.sum(after_manifest["electoral_votes"]))//2+1
+    differences:list[np.ndarray] = []
+    wins:list[tuple[np.ndarray,np.ndarray]] = []
+    for chunk,after_chunk in zip(manifest["chunks"],after_manifest["chunks"]):
+        before:dict[str,np.ndarray] = read_chunk(before_dir,chunk,"national",manifest=manifest)
+        after:dict[str,np.ndarray] = read_chunk(after_dir,after_chunk,"national",manifest=after_manifest)
+        before_votes:np.ndarray = np.column_stack([before[f"{party}_electoral_votes"] for party in ("rep","dem","ind")])
+        after_votes:np.ndarray = np.column_stack([after[f"{party}_electoral_votes"] for party in ("rep","dem","ind")])
+        differences.append(after_votes-before_votes)
+        wins.append((before_votes >= majority,after_votes >= majority))
+    difference:np.ndarray = np.concatenate(differences).astype(np.float64)
+    before_wins:np.ndarray = np.concatenate([before for before,_ in wins]).astype(np.float64)
+    after_wins:np.ndarray = np.concatenate([after for _,after in wins]).astype(np.float64)
+    n:int = len(difference)
+    win_difference:np.ndarray = after_wins-before_wins
+    return {
+            "rounds": n,
+            "electoral_vote_change": {party: float(difference[:,code].mean()) for code,party in enumerate(PARTIES)},
+            "electoral_vote_change_standard_error": {party: float(difference[:,code].std(ddof=1)/np.sqrt(n)) if n > 1 else None for code,party in enumerate(PARTIES)},
+            "win_probability_before": {party: float(before_wins[:,code].mean()) for code,party in enumerate(PARTIES)},
+            "win_probability_after": {party: float(after_wins[:,code].mean()) for code,party in enumerate(PARTIES)},
+            "win_probability_change_standard_error": {party: float(win_difference[:,code].std(ddof=1)/np.sqrt(n)) if n > 1 else None for code,party in enumerate(PARTIES)},
+            "rounds_with_changed_winner": int((np.abs(win_difference).sum(axis=1) > 0).sum())
+        }
+
+def main(mode:str,store_dir:str="results_crn",output_dir:str|None=None,max_round:int=100_000,seed:int|None=None,compact:bool=True,report_path:str="incremental_report.json"):
+    from input_cache import load_cached_state_model
+    try:
+        logger:XML_Logger = XML_Logger("incremental_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        state_model,_ = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root=os.path.join(CURRENT_DIRECTORY,"cache","inputs"))
+        started:float = time.perf_counter()
+        if mode == "run":
+            if seed is None:
+                seed = int(np.random.SeedSequence().entropy)
+            logger.log_to_xml(message=f"Simulating {max_round:,.0f} rounds with common random numbers and seed {seed} into {store_dir}",basepath=logger.base_dir,status="INFO")
+            run_crn(state_model,store_dir,max_round,seed,logger,compact=compact)
+            logger.log_to_xml(message=f"Finished {max_round:,.0f} rounds in {time.perf_counter()-started:,.1f}s",basepath=logger.base_dir,status="SUCCESS")
+            return
+        changed:list[str] = update_crn(state_model,store_dir,logger,output_dir=output_dir)
+        report:dict = {"changed_states": changed,"seconds": time.perf_counter()-started}
+        if output_dir is not None:
+            report["paired_difference"] = paired_difference(store_dir,output_dir)
+        with open(os.path.join(CURRENT_DIRECTORY,report_path),'w') as file:
+            json.dump(report,file,indent=2)
+        logger.log_to_xml(message=f"Updated {output_dir or store_dir} for {len(changed)} changed states in {report['seconds']:,.1f}s",basepath=logger.base_dir,status="SUCCESS")
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Incremental simulation failed. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Incremental simulation failed. Terminating program. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Simulate with common random numbers, then re-simulate only the states whose inputs changed")
+    parser.add_argument("mode",choices=["run","update"])
+    parser.add_argument("--store-dir",default="results_crn")
+    parser.add_argument("--output-dir",default=None,help="update: write the patched store here and report the paired difference against --store-dir")
+    parser.add_argument("--rounds",type=int,default=100_000)
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--uncompressed",action="store_true",help="run: write the uncompressed column layout instead of the compact one")
+    parser.add_argument("--report",default="incremental_report.json")
+    args:argparse.Namespace = parser.parse_args()
+    main(args.mode,store_dir=args.store_dir,output_dir=args.output_dir,max_round=args.rounds,seed=args.seed,compact=not args.uncompressed,report_path=args.report)
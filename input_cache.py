@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import time
+import hashlib
+from typing import TYPE_CHECKING
+from state_model import State_Model
+if TYPE_CHECKING:
+    from pandas import DataFrame
+CURRENT_DIRECTORY:str = os.getcwd()
+# Bump when the layout of a cache entry or the way State_Model is built changes
+CACHE_VERSION:int = 1
+DEFAULT_CACHE_ROOT:str = os.path.join("cache","inputs")
+# Pruning keeps the most recently used entries, and never removes one used within the last day, since a concurrent or
+# long-running simulation (and its worker processes) may still be reading it
+DEFAULT_KEEP_ENTRIES:int = 8
+DEFAULT_MIN_AGE_SECONDS:float = 24*3600
+
+def input_key(voter_file:str,party_file:str,year:int,electoral_file:str|None=None) -> str:
+    # Any edit to the source CSVs, electoral_votes.py or the target year gives a new key, which is what invalidates the cache
+    electoral_file = electoral_file if electoral_file is not None else os.path.join(os.path.dirname(os.path.abspath(__file__)),"electoral_votes.py")
+    digest = hashlib.sha256(f"version={CACHE_VERSION};year={year};".encode())
+    for file_name in (voter_file,party_file,electoral_file):
+        with open(file_name,'rb') as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()[:32]
+
+def build_state_model(voter_file:str,party_file:str,year:int) -> State_Model:
+    from pandas import read_csv
+    voter_df:"DataFrame" = read_csv(voter_file)
+    return State_Model.from_data(voter_df[voter_df["Year"]==year].to_numpy(),read_csv(party_file).to_numpy())
+
+def load_cached_state_model(voter_file:str,party_file:str,year:int,cache_root:str=DEFAULT_CACHE_ROOT,mmap:bool=True) -> tuple[State_Model,str]:
+    # Returns the model and the cache entry it came from; worker processes can map the same entry by path
+    key:str = input_key(voter_file,party_file,year)
+    entry:str = os.path.join(cache_root,key)
+    if os.path.exists(os.path.join(entry,"meta.json")):
+        _mark_used(entry)
+    else:
+        model:State_Model = build_state_model(voter_file,party_file,year)
+        # Built in a scratch directory and renamed into place, so concurrent readers never see a half-written entry
+        scratch:str = f"{entry}.tmp{os.getpid()}"
+        shutil.rmtree(scratch,ignore_errors=True)
+        model.save(scratch)
+        with open(os.path.join(scratch,"meta.json"),'w') as file:
+            json.dump({
+                    "version": CACHE_VERSION,
+                    "year": year,
+                    "sources": [os.path.abspath(voter_file),os.path.abspath(party_file)],
+                    "states": len(model),
+                    "total_electoral_votes": int(model.electoral.sum()),
+                    "total_registered_voters": int(model.registered.sum())
+                },file,indent=2)
+        try:
+            os.replace(scratch,entry)
+        except OSError:
+            # Another process published the same entry first; theirs is identical
+            shutil.rmtree(scratch,ignore_errors=True)
+        # Only a new entry can push the cache over its size, so hits never scan it
+        prune_cache(cache_root)
+    return State_Model.load(entry,mmap=mmap),entry
+
+def _mark_used(entry:str) -> None:
+    # meta.json's modification time doubles as the entry's last use, which is what pruning orders by
+    try:
+        os.utime(os.path.join(entry,"meta.json"))
+    except OSError:
+        pass
+
+def _last_used(entry:str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(entry,"meta.json"))
+    except OSError:
+        return os.path.getmtime(entry)
+
+def prune_cache(cache_root:str,keep:int=DEFAULT_KEEP_ENTRIES,min_age_seconds:float=DEFAULT_MIN_AGE_SECONDS) -> list[str]:
+    # Removes the least recently used entries beyond the newest keep, skipping any used within min_age_seconds, and
+    # scratch directories left by builds that crashed that long ago. Returns the removed paths.
+    cutoff:float = time.time()-min_age_seconds
+    entries:list[str] = []
+    removed:list[str] = []
+    for entry in os.scandir(cache_root):
+        if not entry.is_dir():
+            continue
+        if ".tmp" in entry.name:
+            if os.path.getmtime(entry.path) < cutoff:
+                shutil.rmtree(entry.path,ignore_errors=True)
+                removed.append(entry.path)
+            continue
+        entries.append(entry.path)
+    entries.sort(key=_last_used,reverse=True)
+    for path in entries[keep:]:
+        if _last_used(path) < cutoff:
+            shutil.rmtree(path,ignore_errors=True)
+            removed.append(path)
+    return removed
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import numpy as np
+from contextlib import contextmanager,nullcontext
+from collections import Counter
+from typing import Generator
+PROFILERS:tuple[str,...] = ("cprofile","sampling")
+
+class Stage_Timer:
+    # Wall-clock time per named stage of a round. Durations are buffered as integers from perf_counter_ns and only turned
+    # into percentiles when a summary is written, so a timed stage costs two clock reads and a list append.
+    def __init__(self,metrics_path:str,every_seconds:float=30.0,output_paths:list[str]|None=None):
+        self.metrics_path:str = metrics_path
+        self.every_seconds:float = every_seconds
+        # Files or directories whose growth is reported as bytes written
+        self.output_paths:list[str] = output_paths or []
+        self.durations:dict[str,list[int]] = {}
+        self.totals:dict[str,float] = {}
+        self.rounds:int = 0
+        self.window_rounds:int = 0
+        self.started_at:float = time.perf_counter()
+        self.window_started_at:float = self.started_at
+        self.initial_bytes:int = self._output_bytes()
+
+    def reset_output_bytes(self,initial_bytes:int|None=None) -> None:
+        # Called once the outputs have been opened, truncated or cleared, so bytes_written counts only this run's writes;
+        # initial_bytes overrides the measured size for files that are about to be rewritten from the start
+        self.initial_bytes = self._output_bytes() if initial_bytes is None else initial_bytes
+
+    @contextmanager
+    def stage(self,name:str) -> Generator[None,None,None]:
+        started:int = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.durations.setdefault(name,[]).append(time.perf_counter_ns()-started)
+
+    def round_done(self,rounds:int=1) -> None:
+        self.rounds += rounds
+        self.window_rounds += rounds
+        if time.perf_counter()-self.window_started_at >= self.every_seconds:
+            self.write_summary()
+
+    def _output_bytes(self) -> int:
+        total:int = 0
+        for path in self.output_paths:
+            if os.path.isfile(path):
+                total += os.path.getsize(path)
+            elif os.path.isdir(path):
+                total += sum(os.path.getsize(os.path.join(root,name)) for root,_,names in os.walk(path) for name in names)
+        return total
+
+    def summary(self) -> dict:
+        now:float = time.perf_counter()
+        stages:dict[str,dict[str,float]] = {}
+        for name,durations in self.durations.items():
+            seconds:np.ndarray = np.array(durations,dtype=np.float64)/1e9
+            self.totals[name] = self.totals.get(name,0.0)+float(seconds.sum())
+            stages[name] = {
+                    "count": len(seconds),
+                    "p50_seconds": float(np.percentile(seconds,50)) if len(seconds) else 0.0,
+                    "p95_seconds": float(np.percentile(seconds,95)) if len(seconds) else 0.0,
+                    "window_seconds": float(seconds.sum()),
+                    "total_seconds": self.totals[name]
+                }
+        window:float = max(now-self.window_started_at,1e-9)
+        return {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "rounds": self.rounds,
+                "window_rounds": self.window_rounds,
+                "rounds_per_sec": self.window_rounds/window,
+                "elapsed_seconds": now-self.started_at,
+                "bytes_written": self._output_bytes()-self.initial_bytes,
+                "stages": stages
+            }
+
+    def write_summary(self) -> dict:
+        # One JSON object per line; every summary covers the stage timings since the previous one. The latest summary
+        # is also published as a Prometheus text file next to it for local scraping.
+        summary:dict = self.summary()
+        with open(self.metrics_path,'a') as file:
+            file.write(json.dumps(summary)+"\n")
+        write_prometheus(f"{os.path.splitext(self.metrics_path)[0]}.prom",summary)
+        self.durations = {}
+        self.window_rounds = 0
+        self.window_started_at = time.perf_counter()
+        return summary
+
+    def close(self) -> dict:
+        return self.write_summary()
+
+def write_prometheus(path:str,summary:dict) -> None:
+    lines:list[str] = [
+            f"simulator_rounds_total {summary['rounds']}",
+            f"simulator_rounds_per_second {summary['rounds_per_sec']:.6f}",
+            f"simulator_elapsed_seconds {summary['elapsed_seconds']:.6f}",
+            f"simulator_bytes_written_total {summary['bytes_written']}"
+        ]
+    for name,stage in summary["stages"].items():
+        lines.append(f'simulator_stage_seconds{{stage="{name}",quantile="0.5"}} {stage["p50_seconds"]:.9f}')
+        lines.append(f'simulator_stage_seconds{{stage="{name}",quantile="0.95"}} {stage["p95_seconds"]:.9f}')
+        lines.append(f'simulator_stage_seconds_total{{stage="{name}"}} {stage["total_seconds"]:.9f}')
+    # Written to a temporary file and renamed so a scraper never reads a half-written file
+    temporary_path:str = f"{path}.tmp"
+    with open(temporary_path,'w') as file:
+        file.write("\n".join(lines)+"\n")
+    os.replace(temporary_path,path)
+
+class Null_Timer:
+    # Stand-in when instrumentation is off, so the simulation loop needs no branches
+    def stage(self,name:str):
+        return nullcontext()
+
+    def round_done(self,rounds:int=1) -> None:
+        pass
+
+    def reset_output_bytes(self,initial_bytes:int|None=None) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class Sampling_Profiler:
+    # Samples the main thread's stack every interval seconds from a background thread and writes the counts as collapsed
+    # stacks ("outer;inner count" per line), the input format of flamegraph tools
+    def __init__(self,output_path:str,interval:float=0.005):
+        self.output_path:str = output_path
+        self.interval:float = interval
+        self.stacks:Counter = Counter()
+        self.target_thread:int = threading.main_thread().ident
+        self.stop_event:threading.Event = threading.Event()
+        self.thread:threading.Thread|None = None
+
+    def _sample(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread)
+            stack:list[str] = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enable(self) -> None:
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample,name="sampling-profiler",daemon=True)
+        self.thread.start()
+
+    def disable(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def dump_stats(self,path:str) -> None:
+        with open(path,'w') as file:
+            for stack,count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+class Round_Profiler:
+    # Profiles only the rounds in [first_round, last_round], so a long run can be sampled in steady state
+    def __init__(self,first_round:int,last_round:int,output_path:str,profiler:str="cprofile"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}. Expected one of {PROFILERS}")
+        self.first_round:int = first_round
+        self.last_round:int = last_round
+        self.output_path:str = output_path
+        self.profiler = cProfile.Profile() if profiler=="cprofile" else Sampling_Profiler(output_path)
+        self.active:bool = False
+        self.done:bool = False
+
+    def before_round(self,current_round:int,block_end:int|None=None) -> None:
+        # Batch runs pass each block's first and last round, so a block that overlaps the window at all is profiled
+        block_end = current_round if block_end is None else block_end
+        if not self.active and not self.done and block_end >= self.first_round and current_round <= self.last_round:
+            self.profiler.enable()
+            self.active = True
+
+    def after_round(self,current_round:int) -> None:
+        if self.active and current_round >= self.last_round:
+            self.close()
+
+    def close(self) -> None:
+        if self.active:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output_path)
+            self.active = False
+            self.done = True
@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from pandas import DataFrame
+from batch_simulation import PARTIES,Round_Batch,state_winner_codes
+from result_store import STATE_COLUMNS,NATIONAL_COLUMNS
+
+# Per-state columns averaged in analysis/State_Results_Means.csv, in output order
+STATE_MEAN_KEYS:tuple[str,...] = ("total_votes","rep_votes","rep_votes_pct","dem_votes","dem_votes_pct","ind_votes","ind_votes_pct")
+NATIONAL_KEYS:tuple[str,...] = tuple(NATIONAL_COLUMNS)
+NATIONAL_FLOAT_KEYS:tuple[str,...] = ("turnout","rep_votes_pct","dem_votes_pct","ind_votes_pct")
+
+def previous_path(path:str) -> str:
+    return f"{os.path.splitext(path)[0]}_previous.npz"
+
+class Running_Moments:
+    # Welford's algorithm, merged a whole batch at a time with Chan et al.'s pairwise update
+    def __init__(self,shape:tuple[int,...]):
+        self.count:int = 0
+        self.mean:np.ndarray = np.zeros(shape)
+        self.m2:np.ndarray = np.zeros(shape)
+
+    def update(self,values:np.ndarray) -> None:
+        batch_count:int = len(values)
+        if batch_count == 0:
+            return
+        batch_mean:np.ndarray = values.mean(axis=0)
+        batch_m2:np.ndarray = ((values-batch_mean)**2).sum(axis=0)
+        total:int = self.count+batch_count
+        delta:np.ndarray = batch_mean-self.mean
+        self.mean = self.mean+delta*(batch_count/total)
+        self.m2 = self.m2+batch_m2+delta**2*(self.count*batch_count/total)
+        self.count = total
+
+    @property
+    def variance(self) -> np.ndarray:
+        return self.m2/(self.count-1) if self.count > 1 else np.zeros_like(self.m2)
+
+class Online_Aggregator:
+    def __init__(self,states:np.ndarray):
+        self.states:np.ndarray = np.asarray(states).astype(str)
+        self.national:Running_Moments = Running_Moments((len(NATIONAL_KEYS),))
+        self.state:Running_Moments = Running_Moments((len(self.states),len(STATE_MEAN_KEYS)))
+        self.winner_counts:np.ndarray = np.zeros((len(self.states),len(PARTIES)),dtype=np.int64)
+        # Popular/electoral split rounds are rare, so their national rows are kept whole for the HTML reports
+        self.rep_popular_dem_electoral:list[np.ndarray] = []
+        self.dem_popular_rep_electoral:list[np.ndarray] = []
+        # The last round folded in when the totals were saved or loaded; a resume only continues a matching checkpoint
+        self.last_round:int|None = None
+
+    @property
+    def rounds(self) -> int:
+        return self.national.count
+
+    def update(self,national_rows:np.ndarray,state_values:np.ndarray,winner_codes:np.ndarray) -> None:
+        # national_rows: rounds x NATIONAL_KEYS, state_values: rounds x states x STATE_MEAN_KEYS, winner_codes: rounds x states
+        self.national.update(national_rows)
+        self.state.update(state_values)
+        for code in range(len(PARTIES)):
+            self.winner_counts[:,code] += (winner_codes==code).sum(axis=0)
+        column:dict[str,int] = {key:index for index,key in enumerate(NATIONAL_KEYS)}
+        rep_votes:np.ndarray = national_rows[:,column["rep_votes"]]
+        dem_votes:np.ndarray = national_rows[:,column["dem_votes"]]
+        rep_electoral:np.ndarray = national_rows[:,column["rep_electoral_votes"]]
+        dem_electoral:np.ndarray = national_rows[:,column["dem_electoral_votes"]]
+        self.rep_popular_dem_electoral.append(national_rows[(rep_votes > dem_votes)&(rep_electoral < dem_electoral)])
+        self.dem_popular_rep_electoral.append(national_rows[(rep_votes < dem_votes)&(rep_electoral > dem_electoral)])
+
+    def update_batch(self,batch:Round_Batch) -> None:
+        total_votes:np.ndarray = batch.total_votes.astype(np.float64)
+        state_values:np.ndarray = np.stack([
+                batch.total_votes,batch.rep_votes,batch.rep_votes/total_votes,
+                batch.dem_votes,batch.dem_votes/total_votes,batch.ind_votes,batch.ind_votes/total_votes
+            ],axis=-1).astype(np.float64)
+        national_total:np.ndarray = total_votes.sum(axis=1)
+        rep_votes:np.ndarray = batch.rep_votes.sum(axis=1)
+        dem_votes:np.ndarray = batch.dem_votes.sum(axis=1)
+        ind_votes:np.ndarray = batch.ind_votes.sum(axis=1)
+        national_rows:np.ndarray = np.column_stack([
+                batch.rounds,batch.turnout,national_total,
+                rep_votes,batch.rep_electoral_votes,rep_votes/national_total,
+                dem_votes,batch.dem_electoral_votes,dem_votes/national_total,
+                ind_votes,batch.ind_electoral_votes,ind_votes/national_total
+            ]).astype(np.float64)
+        self.update(national_rows,state_values,state_winner_codes(batch))
+
+    def update_round(self,state_results:list[dict[str,int|float]],national_results:dict[str,list[int|float]]) -> None:
+        # Accepts the dicts produced by State_Election_Simulation.save_to_csv and Federal_Election_Simulation.results
+        state_values:np.ndarray = np.array([[row[STATE_COLUMNS[key]] for key in STATE_MEAN_KEYS] for row in state_results],dtype=np.float64)
+        winner_codes:np.ndarray = np.array([PARTIES.index(row["Winner"]) if row["Winner"] in PARTIES else -1 for row in state_results])
+        national_rows:np.ndarray = np.array([[national_results[NATIONAL_COLUMNS[key]][0] for key in NATIONAL_KEYS]],dtype=np.float64)
+        self.update(national_rows,state_values[None,...],winner_codes[None,...])
+
+    def _national_frame(self,rows:list[np.ndarray]) -> DataFrame:
+        data:np.ndarray = np.concatenate(rows) if rows else np.empty((0,len(NATIONAL_KEYS)))
+        df:DataFrame = DataFrame(data,columns=[NATIONAL_COLUMNS[key] for key in NATIONAL_KEYS])
+        for key in NATIONAL_KEYS:
+            if key not in NATIONAL_FLOAT_KEYS:
+                df[NATIONAL_COLUMNS[key]] = df[NATIONAL_COLUMNS[key]].astype(np.int64)
+        return df
+
+    def national_means(self) -> DataFrame:
+        return DataFrame([self.national.mean[1:]],columns=[NATIONAL_COLUMNS[key] for key in NATIONAL_KEYS[1:]])
+
+    def state_means(self) -> DataFrame:
+        order:np.ndarray = np.argsort(self.states)
+        df:DataFrame = DataFrame(self.state.mean[order],columns=[STATE_COLUMNS[key] for key in STATE_MEAN_KEYS])
+        df.insert(0,"State",self.states[order])
+        return df
+
+    def state_winners(self) -> DataFrame:
+        # Same shape as analysis.py's groupby(["State","Winner"]).count(): every count column holds the tally
+        rows:list[list] = []
+        for state_index in np.argsort(self.states):
+            for code in np.argsort(PARTIES):
+                count:int = int(self.winner_counts[state_index,code])
+                if count > 0:
+                    rows.append([self.states[state_index],PARTIES[code]]+[count]*(len(STATE_COLUMNS)-2))
+        return DataFrame(rows,columns=["State","Winner"]+[column for key,column in STATE_COLUMNS.items() if key not in ("state","winner")])
+
+    def emit(self) -> None:
+        from analysis import write_national_outputs,write_state_outputs
+        write_national_outputs(self.national_means(),self._national_frame(self.rep_popular_dem_electoral),self._national_frame(self.dem_popular_rep_electoral))
+        write_state_outputs(self.state_means(),self.state_winners())
+
+    def save(self,path:str,last_round:int) -> None:
+        # Saved just before each checkpoint so a resumed run continues the same running totals. The previous save is kept
+        # until the next one, because a crash between this save and the checkpoint leaves the checkpoint one save behind.
+        temp_path:str = f"{path}.tmp.npz"
+        np.savez(
+                temp_path,
+                last_round=np.array([last_round]),
+                states=self.states,
+                national=np.array([self.national.count]),national_mean=self.national.mean,national_m2=self.national.m2,
+                state_mean=self.state.mean,state_m2=self.state.m2,
+                winner_counts=self.winner_counts,
+                rep_popular_dem_electoral=self._national_frame(self.rep_popular_dem_electoral).to_numpy(dtype=np.float64),
+                dem_popular_rep_electoral=self._national_frame(self.dem_popular_rep_electoral).to_numpy(dtype=np.float64)
+            )
+        if os.path.exists(path):
+            os.replace(path,previous_path(path))
+        os.replace(temp_path,path)
+        self.last_round = last_round
+
+    @classmethod
+    def load(cls,path:str) -> "Online_Aggregator":
+        with np.load(path) as data:
+            aggregator:Online_Aggregator = cls(data["states"])
+            aggregator.last_round = int(data["last_round"][0]) if "last_round" in data.files else None
+            aggregator.national.count = int(data["national"][0])
+            aggregator.state.count = aggregator.national.count
+            aggregator.national.mean,aggregator.national.m2 = data["national_mean"],data["national_m2"]
+            aggregator.state.mean,aggregator.state.m2 = data["state_mean"],data["state_m2"]
+            aggregator.winner_counts = data["winner_counts"]
+            aggregator.rep_popular_dem_electoral = [data["rep_popular_dem_electoral"]]
+            aggregator.dem_popular_rep_electoral = [data["dem_popular_rep_electoral"]]
+        return aggregator
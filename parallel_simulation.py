@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from collections import deque
+from typing import Callable,Generator,Iterable
+from concurrent.futures import Executor,ProcessPoolExecutor,Future
+from batch_simulation import SWING_HIGHS,SWING_LOWS,TURNOUT_RANGE,Round_Batch,simulate_rounds,slice_batch
+
+# Rounds are generated in fixed blocks, each with its own child seed, so the output for a
+# master seed does not depend on how many workers share the blocks.
+DEFAULT_BLOCK_SIZE:int = 10_000
+_worker_inputs:dict[str,np.ndarray] = {}
+
+def block_seed(master_seed:int,block_index:int) -> np.random.SeedSequence:
+    # Identical to SeedSequence(master_seed).spawn(n)[block_index] without materializing earlier children
+    return np.random.SeedSequence(master_seed,spawn_key=(block_index,))
+
+def block_ranges(max_round:int,block_size:int,first_round:int=1) -> list[tuple[int,int,int]]:
+    # A first_round inside a block (a resume after a run that ended mid-block) gives a partial leading block
+    ranges:list[tuple[int,int,int]] = []
+    start:int = first_round
+    while start <= max_round:
+        block_index:int = (start-1)//block_size
+        end:int = min((block_index+1)*block_size,max_round)
+        ranges.append((block_index,start,end))
+        start = end+1
+    return ranges
+
+def _init_worker(registered:np.ndarray|None,baseline:np.ndarray|None,electoral:np.ndarray|None,input_dir:str|None=None,swing_model=None) -> None:
+    if input_dir is not None:
+        # Map the cached inputs from disk rather than unpickling a private copy in every worker
+        from state_model import State_Model
+        model:State_Model = State_Model.load(input_dir,mmap=True)
+        registered,baseline,electoral = model.registered,model.baseline,model.electoral
+    _worker_inputs["registered"] = registered
+    _worker_inputs["baseline"] = baseline
+    _worker_inputs["electoral"] = electoral
+    _worker_inputs["swing_model"] = swing_model
+
+def simulate_block(registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,master_seed:int,block_index:int,start:int,end:int,swing_highs:np.ndarray=SWING_HIGHS,swing_lows:np.ndarray=SWING_LOWS,turnout_range:tuple[float,float]=TURNOUT_RANGE,swing_model=None) -> Round_Batch:
+    rng:np.random.Generator = np.random.default_rng(block_seed(master_seed,block_index))
+    n_rounds:int = end-start+1
+    return next(simulate_rounds(registered,baseline,electoral,n_rounds,rng,chunk_size=n_rounds,first_round=start,swing_highs=swing_highs,swing_lows=swing_lows,turnout_range=turnout_range,swing_model=swing_model))
+
+def _simulate_block(master_seed:int,block_index:int,start:int,end:int,block_size:int=DEFAULT_BLOCK_SIZE) -> Round_Batch:
+    # A partial block is drawn whole and cut down, so a run's rounds do not depend on where it stopped or resumed:
+    # every run is a prefix of a longer one with the same seed
+    block_start:int = block_index*block_size+1
+    block_end:int = block_start+block_size-1
+    batch:Round_Batch = simulate_block(_worker_inputs["registered"],_worker_inputs["baseline"],_worker_inputs["electoral"],master_seed,block_index,block_start,block_end,swing_model=_worker_inputs["swing_model"])
+    if (start,end) != (block_start,block_end):
+        batch = slice_batch(batch,start-block_start,end-block_start+1,_worker_inputs["electoral"])
+    return batch
+
+def ordered_results(executor:Executor,function:Callable,tasks:Iterable[tuple],window:int) -> Generator:
+    # Keep a bounded window of tasks in flight and yield their results strictly in submission order
+    pending:deque[Future] = deque()
+    remaining = iter(tasks)
+    for task in remaining:
+        pending.append(executor.submit(function,*task))
+        if len(pending) >= window:
+            break
+    try:
+        while pending:
+            yield pending.popleft().result()
+            next_task:tuple|None = next(remaining,None)
+            if next_task is not None:
+                pending.append(executor.submit(function,*next_task))
+    finally:
+        # A caller that stops early (e.g. on convergence) should not wait for tasks it will never read
+        for future in pending:
+            future.cancel()
+
+def run_parallel(registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,max_round:int,master_seed:int,workers:int|None=None,block_size:int=DEFAULT_BLOCK_SIZE,first_round:int=1,input_dir:str|None=None,swing_model=None) -> Generator[Round_Batch,None,None]:
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    ranges:list[tuple[int,int,int]] = block_ranges(max_round,block_size,first_round)
+    if workers <= 1:
+        _init_worker(registered,baseline,electoral,swing_model=swing_model)
+        for block_index,start,end in ranges:
+            yield _simulate_block(master_seed,block_index,start,end,block_size)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers,initializer=_init_worker,initargs=(registered,baseline,electoral,None,swing_model) if input_dir is None else (None,None,None,input_dir,swing_model)) as executor:
+        yield from ordered_results(executor,_simulate_block,((master_seed,*block,block_size) for block in ranges),window=2*workers)
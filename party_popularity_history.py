@@ -1,16 +1,105 @@
 import os
 import re
 import csv
+import json
+import time
 import requests
 import traceback
 from bs4 import BeautifulSoup
 from xml_logging import XML_Logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 CURRENT_DIRECTORY:str = os.getcwd()
+STATE_URL:str = "https://www.270towin.com/states/{state}"
+# 270towin page names, which are also the cache file names
+STATES:tuple[str,...] = (
+        "alabama", "alaska", "arizona", "arkansas", "california",
+        "colorado", "connecticut", "delaware", "district-of-columbia", "florida", "georgia",
+        "hawaii", "idaho", "illinois", "indiana", "iowa",
+        "kansas", "kentucky", "louisiana", "maine", "maryland",
+        "massachusetts", "michigan", "minnesota", "mississippi", "missouri",
+        "montana", "nebraska", "nevada", "new-hampshire", "new-jersey",
+        "new-mexico", "new-york", "north-carolina", "north-dakota", "ohio",
+        "oklahoma", "oregon", "pennsylvania", "rhode-island", "south-carolina",
+        "south-dakota", "tennessee", "texas", "utah", "vermont",
+        "virginia", "washington", "west-virginia", "wisconsin", "wyoming"
+    )
 
-def _get_website_text(state:str,logger:XML_Logger) -> str|None:
+class Page_Fetcher:
+    # Fetches 270towin state pages through one pooled session and keeps every page in an on-disk cache.
+    # Cached pages younger than max_age_days are used as-is; older ones are revalidated with their ETag.
+    # With replay=True the network is never touched and only cached pages are returned.
+    def __init__(self,cache_dir:str,logger:XML_Logger,max_age_days:float=30,replay:bool=False,max_workers:int=8,timeout:float=20):
+        self.cache_dir:str = cache_dir
+        self.logger:XML_Logger = logger
+        self.max_age_seconds:float = max_age_days*86_400
+        self.replay:bool = replay
+        self.max_workers:int = max_workers
+        self.timeout:float = timeout
+        self.session:requests.Session = requests.Session()
+        retry:Retry = Retry(total=3,backoff_factor=1,status_forcelist=(429,500,502,503,504),allowed_methods=("GET",))
+        adapter:HTTPAdapter = HTTPAdapter(pool_connections=max_workers,pool_maxsize=max_workers,max_retries=retry)
+        self.session.mount("https://",adapter)
+        self.session.mount("http://",adapter)
+        os.makedirs(cache_dir,exist_ok=True)
+
+    def _paths(self,state:str) -> tuple[str,str]:
+        return os.path.join(self.cache_dir,f"{state}.html"),os.path.join(self.cache_dir,f"{state}.json")
+
+    def _read_cache(self,state:str) -> tuple[str|None,dict]:
+        html_path,meta_path = self._paths(state)
+        if not os.path.exists(html_path):
+            return None,{}
+        with open(html_path,'r',encoding='utf-8') as file:
+            html_content:str = file.read()
+        metadata:dict = {}
+        if os.path.exists(meta_path):
+            with open(meta_path,'r') as file:
+                metadata = json.load(file)
+        return html_content,metadata
+
+    def _write_cache(self,state:str,html_content:str|None,metadata:dict) -> None:
+        html_path,meta_path = self._paths(state)
+        if html_content is not None:
+            with open(f"{html_path}.tmp",'w',encoding='utf-8') as file:
+                file.write(html_content)
+            os.replace(f"{html_path}.tmp",html_path)
+        with open(f"{meta_path}.tmp",'w') as file:
+            json.dump(metadata,file)
+        os.replace(f"{meta_path}.tmp",meta_path)
+
+    def fetch(self,state:str) -> str|None:
+        try:
+            html_content,metadata = self._read_cache(state)
+            if self.replay:
+                if html_content is None:
+                    self.logger.log_to_xml(message=f"No cached page for {state} in replay mode.",basepath=self.logger.base_dir,status="ERROR")
+                return html_content
+            if html_content is not None and time.time()-metadata.get("fetched_at",0) < self.max_age_seconds:
+                return html_content
+            headers:dict[str,str] = {"If-None-Match": metadata["etag"]} if html_content is not None and "etag" in metadata else {}
+            response:requests.Response = self.session.get(STATE_URL.format(state=state),headers=headers,timeout=self.timeout)
+            if response.status_code == 304:
+                self._write_cache(state,None,{**metadata,"fetched_at": time.time()})
+                return html_content
+            response.raise_for_status()
+            self._write_cache(state,response.text,{"etag": response.headers.get("ETag"),"fetched_at": time.time(),"url": response.url})
+            return response.text
+        except Exception as e:
+            self.logger.log_to_xml(message=f"Failed to fetch the page for {state}. Official error: {traceback.format_exc()}",basepath=self.logger.base_dir,status="ERROR")
+            return None
+
+    def fetch_all(self,states:list[str]) -> dict[str,str|None]:
+        # Bounded by max_workers, which is also the size of the session's connection pool
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(states,executor.map(self.fetch,states)))
+
+def _get_website_text(state:str,logger:XML_Logger,html_content:str|None=None) -> str|None:
     try:
-        response:requests.Response = requests.get(f"https://www.270towin.com/states/{state}")
-        html_content:str = response.text
+        if html_content is None:
+            response:requests.Response = requests.get(STATE_URL.format(state=state),timeout=20)
+            html_content = response.text
 
         soup:BeautifulSoup = BeautifulSoup(html_content, 'html.parser')
         visible_text:str = soup.get_text()
@@ -30,20 +119,20 @@ def pct_to_float(value:str,logger:XML_Logger) -> str:
         logger.log_to_xml(message=f"Failed to convert the percent to a float. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="WARN")
         return value
 
-def past_election_results(state:str,logger:XML_Logger) -> list[list[int|float]]|None:
+def past_election_results(state:str,logger:XML_Logger,html_content:str|None=None) -> list[list[int|float]]|None:
     try:
-        webpage:str|None = _get_website_text(state=state,logger=logger)
+        webpage:str|None = _get_website_text(state=state,logger=logger,html_content=html_content)
         if webpage is None:
             return None
         lines:list[str] = webpage.splitlines()
         recent_presidential_elections_found:bool = False
         past_results:list[list[int|float]] = []
         past_results_row:list[int|float] = []
-        for line in lines:
+        for index,line in enumerate(lines):
             if("Recent Presidential Elections" in line):
                 recent_presidential_elections_found = True
                 continue
-            if((line.startswith("Show:")) and (lines[lines.index(line)+1].strip()=='7')):
+            if((line.startswith("Show:")) and (index+1 < len(lines)) and (lines[index+1].strip()=='7')):
                 break
             if(not(recent_presidential_elections_found)):
                 continue
@@ -89,10 +178,8 @@ def baseline_independent_popularity(past_results:list[list[int|float]],logger:XM
         logger.log_to_xml(message=f"Failed to get past baseline popularity for independents. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
         return None
 
-def save_popularity_to_csv(data:dict[str,list[float]],logger:XML_Logger) -> None:
+def save_popularity_to_csv(data:dict[str,list[float]],logger:XML_Logger,csv_file:str="data/Baseline_Popularity.csv") -> None:
     try:
-        # Define the CSV file name
-        csv_file = "data/Baseline_Popularity.csv"
 
         # Write to CSV
         with open(csv_file, mode='w', newline='') as file:
@@ -108,29 +195,54 @@ def save_popularity_to_csv(data:dict[str,list[float]],logger:XML_Logger) -> None
         logger.log_to_xml(message=f"Failed to save popularity to CSV. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
         return None
 
-def main():
+def save_past_results_to_csv(data:dict[str,list[list[int|float]]],logger:XML_Logger,csv_file:str="data/Historical_Results.csv") -> None:
+    # One row per state and election, the actual outcomes backtest.py scores forecasts against. Written to a temporary
+    # file and renamed, so a failed write keeps the previous table whole.
+    temp_file:str = f"{csv_file}.tmp"
+    try:
+        with open(temp_file, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["State", "Year", "Republican", "Democrat"])
+            for state, past_results in data.items():
+                for row in past_results:
+                    writer.writerow([state.title().capitalize().replace("-"," "), row[0], row[2], row[1]])
+        os.replace(temp_file,csv_file)
+    except Exception as e:
+        logger.log_to_xml(message=f"Failed to save past election results to CSV. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return None
+
+def main(replay:bool=False,cache_dir:str=os.path.join(CURRENT_DIRECTORY,"cache","270towin"),max_age_days:float=30,max_workers:int=8,output_file:str="data/Baseline_Popularity.csv",results_file:str="data/Historical_Results.csv",states:tuple[str,...]=STATES):
     try:
         logger:XML_Logger = XML_Logger("party_popularity_history_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
         logger.log_to_xml(message=f"Begin getting baseline popularity for each major political party.",basepath=logger.base_dir,status="INFO")
-        states:list[str] = [
-                "alabama", "alaska", "arizona", "arkansas", "california",
-                "colorado", "connecticut", "delaware", "district-of-columbia", "florida", "georgia",
-                "hawaii", "idaho", "illinois", "indiana", "iowa",
-                "kansas", "kentucky", "louisiana", "maine", "maryland",
-                "massachusetts", "michigan", "minnesota", "mississippi", "missouri",
-                "montana", "nebraska", "nevada", "new-hampshire", "new-jersey",
-                "new-mexico", "new-york", "north-carolina", "north-dakota", "ohio",
-                "oklahoma", "oregon", "pennsylvania", "rhode-island", "south-carolina",
-                "south-dakota", "tennessee", "texas", "utah", "vermont",
-                "virginia", "washington", "west-virginia", "wisconsin", "wyoming"
-            ]
+        fetcher:Page_Fetcher = Page_Fetcher(cache_dir,logger,max_age_days=max_age_days,replay=replay,max_workers=max_workers)
+        pages:dict[str,str|None] = fetcher.fetch_all(list(states))
+        missing:list[str] = [state for state in states if pages[state] is None]
+        if replay and missing:
+            # A replay is meant to reproduce a complete earlier scrape; writing what is cached would replace the CSVs
+            # with a partial (or, on a fresh checkout, header-only) table
+            logger.log_to_xml(message=f"No cached pages for {missing} in {cache_dir}. Nothing was written. Terminating program.",basepath=logger.base_dir,status="CRITICAL")
+            return None
         baseline_popularity:dict[str,list[float]] = {}
+        past_results_by_state:dict[str,list[list[int|float]]] = {}
         for state in states:
-            past_results:list[list[int|float]] = past_election_results(state=state,logger=logger)
+            if pages[state] is None:
+                continue
+            past_results:list[list[int|float]] = past_election_results(state=state,logger=logger,html_content=pages[state])
             if past_results is None:
                 continue
+            past_results_by_state[state] = past_results
             baseline_popularity[state] = [baseline_republican_popularity(past_results,logger),baseline_democratic_popularity(past_results,logger),baseline_independent_popularity(past_results,logger)]
-        save_popularity_to_csv(data=baseline_popularity,logger=logger)
+        save_popularity_to_csv(data=baseline_popularity,logger=logger,csv_file=output_file)
+        incomplete:list[str] = [state for state in states if state not in past_results_by_state]
+        if incomplete:
+            # backtest.py needs every state's results for every year it scores, so a table missing states would only
+            # replace a complete one with one it cannot use
+            logger.log_to_xml(message=f"No past results for {incomplete}. Kept the existing {results_file}.",basepath=logger.base_dir,status="ERROR")
+        else:
+            save_past_results_to_csv(data=past_results_by_state,logger=logger,csv_file=results_file)
         logger.save_variable_info(locals_dict=locals(),variable_save_path=os.path.join(CURRENT_DIRECTORY,'party_popularity_history_variables.json'))
         logger.log_to_xml(message=f"Successfully got baseline popularity for each major political party and saved to CSV.",basepath=logger.base_dir,status="SUCCESS")
     except Exception as e:
@@ -141,4 +253,13 @@ def main():
         return None
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Rebuild data/Baseline_Popularity.csv from 270towin state pages")
+    parser.add_argument("--replay",action="store_true",help="Use only cached pages; never touch the network")
+    parser.add_argument("--cache-dir",default=os.path.join(CURRENT_DIRECTORY,"cache","270towin"))
+    parser.add_argument("--max-age-days",type=float,default=30)
+    parser.add_argument("--workers",type=int,default=8)
+    parser.add_argument("--output-file",default="data/Baseline_Popularity.csv")
+    parser.add_argument("--results-file",default="data/Historical_Results.csv",help="Also write every scraped election result here, for backtest.py")
+    args:argparse.Namespace = parser.parse_args()
+    main(replay=args.replay,cache_dir=args.cache_dir,max_age_days=args.max_age_days,max_workers=args.workers,output_file=args.output_file,results_file=args.results_file)
\ No newline at end of file
@@ -0,0 +1,269 @@
+import os
+import json
+import math
+import argparse
+import threading
+import traceback
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future,ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from pandas import read_csv,DataFrame
+from xml_logging import XML_Logger
+from state_model import State_Model,state_key
+from batch_simulation import PARTIES,Round_Batch
+from parallel_simulation import block_ranges,simulate_block,ordered_results
+from scenario_sweep import SCENARIO_KEYS,Scenario,apply_baseline_overrides
+CURRENT_DIRECTORY:str = os.getcwd()
+# Small enough that a default query answers in a fraction of a second, large enough for about +/-0.01 on a win probability
+DEFAULT_QUERY_ROUNDS:int = 10_000
+# A query runs while its HTTP request waits, so one request cannot ask for an arbitrarily long simulation
+MAX_QUERY_ROUNDS:int = 1_000_000
+DEFAULT_QUERY_BLOCK_SIZE:int = 2_500
+DEFAULT_QUERY_SEED:int = 2028
+DEFAULT_CACHE_SIZE:int = 256
+# Accepted on top of the Scenario parameters: {state: {party: change}} added to that state's baseline popularity
+QUERY_KEYS:tuple[str,...] = (*[key for key in SCENARIO_KEYS if key != "name"],"baseline_shifts")
+
+def _is_integer(value) -> bool:
+    return isinstance(value,int) and not isinstance(value,bool)
+
+def _is_number(value) -> bool:
+    return (isinstance(value,(int,float)) and not isinstance(value,bool)) and math.isfinite(value)
+
+def _check_range(value,what:str) -> None:
+    if not isinstance(value,(list,tuple)) or len(value) != 2 or not all(_is_number(bound) for bound in value):
+        raise ValueError(f"{what} must be a [low, high] pair of numbers, got {value!r}")
+
+def _check_party_table(value,what:str) -> None:
+    # {state: {party: number}}
+    if not isinstance(value,dict) or not all(isinstance(state,str) and isinstance(parties,dict) for state,parties in value.items()):
+        raise ValueError(f"{what} must map state names to {{party: number}} objects, got {value!r}")
+    for state,parties in value.items():
+        if not all(_is_number(number) for number in parties.values()):
+            raise ValueError(f"{what} for {state} must be numbers, got {parties!r}")
+
+def validate_query(parameters) -> None:
+    # Request bodies are untrusted JSON: every wrong type or shape is a ValueError, which the handler answers with 400
+    if not isinstance(parameters,dict):
+        raise ValueError(f"A query must be a JSON object, got {type(parameters).__name__}")
+    unknown:list[str] = sorted(set(parameters)-set(QUERY_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown query parameters {unknown}. Expected some of {QUERY_KEYS}")
+    if "rounds" in parameters and not (_is_integer(parameters["rounds"]) and 0 < parameters["rounds"] <= MAX_QUERY_ROUNDS):
+        raise ValueError(f"rounds must be an integer from 1 to {MAX_QUERY_ROUNDS:,}, got {parameters['rounds']!r}")
+    if "year" in parameters and not _is_integer(parameters["year"]):
+        raise ValueError(f"year must be an integer, got {parameters['year']!r}")
+    if parameters.get("seed") is not None and not (_is_integer(parameters["seed"]) and parameters["seed"] >= 0):
+        raise ValueError(f"seed must be a non-negative integer, got {parameters['seed']!r}")
+    if parameters.get("turnout_range") is not None:
+        _check_range(parameters["turnout_range"],"turnout_range")
+    if parameters.get("swing_ranges") is not None:
+        if not isinstance(parameters["swing_ranges"],dict):
+            raise ValueError(f"swing_ranges must map swing transfers to [low, high] pairs, got {parameters['swing_ranges']!r}")
+        for name,bounds in parameters["swing_ranges"].items():
+            _check_range(bounds,f"swing_ranges[{name!r}]")
+    for key in ("baseline_overrides","baseline_shifts"):
+        if parameters.get(key) is not None:
+            _check_party_table(parameters[key],key)
+
+class Electoral_Histogram:
+    # Counts of every electoral vote total per party, the distribution a query returns alongside the win probabilities
+    def __init__(self,total_electoral_votes:int):
+        self.counts:np.ndarray = np.zeros((len(PARTIES),total_electoral_votes+1),dtype=np.int64)
+
+    def update_batch(self,batch:Round_Batch) -> None:
+        for code,votes in enumerate((batch.rep_electoral_votes,batch.dem_electoral_votes,batch.ind_electoral_votes)):
+            self.counts[code] += np.bincount(votes,minlength=self.counts.shape[1])
+
+    def distribution(self) -> dict[str,dict[int,float]]:
+        # Only totals that occurred, as {electoral votes: probability}
+        rounds:int = max(int(self.counts[0].sum()),1)
+        return {party: {int(votes): float(self.counts[code,votes]/rounds) for votes in np.flatnonzero(self.counts[code])} for code,party in enumerate(PARTIES)}
+
+class Query_Service:
+    # Answers what-if queries with the batch engine. Inputs are read once and one State_Model is kept per year, the
+    # worker pool stays up between queries, and answers are kept in an LRU cache keyed by the canonical parameters.
+    # Identical queries that arrive while the first is still running wait for its answer instead of running again.
+    def __init__(self,voter_file:str="data/Combined_Data.csv",party_file:str="data/Baseline_Popularity.csv",workers:int=1,cache_size:int=DEFAULT_CACHE_SIZE,rounds:int=DEFAULT_QUERY_ROUNDS,seed:int=DEFAULT_QUERY_SEED,block_size:int=DEFAULT_QUERY_BLOCK_SIZE):
+        if not 0 < rounds <= MAX_QUERY_ROUNDS:
+            raise ValueError(f"rounds must be from 1 to {MAX_QUERY_ROUNDS:,}, got {rounds}")
+        self.voter_df:DataFrame = read_csv(voter_file)
+        self.party_popularity_data:np.ndarray = read_csv(party_file).to_numpy()
+        self.cache_size:int = cache_size
+        self.rounds:int = rounds
+        # Every query uses the same seed unless it sets one, so two what-ifs differ by their parameters, not by noise
+        self.seed:int = seed
+        self.block_size:int = block_size
+        self.models:dict[int,State_Model] = {}
+        self.cache:OrderedDict[str,dict] = OrderedDict()
+        self.in_flight:dict[str,Future] = {}
+        self.lock:threading.Lock = threading.Lock()
+        self.hits:int = 0
+        self.misses:int = 0
+        self.executor:ProcessPoolExecutor|None = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.workers:int = workers
+
+    def state_model(self,year:int) -> State_Model:
+        with self.lock:
+            if year not in self.models:
+                voter_data:np.ndarray = self.voter_df[self.voter_df["Year"]==year].to_numpy()
+                if len(voter_data) == 0:
+                    raise ValueError(f"No voter data for {year}")
+                self.models[year] = State_Model.from_data(voter_data,self.party_popularity_data)
+            return self.models[year]
+
+    def scenario(self,parameters:dict) -> Scenario:
+        validate_query(parameters)
+        parameters = {"rounds": self.rounds,"seed": self.seed,**parameters}
+        shifts:dict[str,dict[str,float]] = parameters.pop("baseline_shifts",{}) or {}
+        model:State_Model = self.state_model(int(parameters.get("year",2028)))
+        rows:dict[str,int] = {state_key(state):row for row,state in enumerate(model.states)}
+        # Overrides and shifts are resolved to absolute popularity under the model's own state names, so every way of
+        # writing the same query shares one cache entry
+        overrides:dict[str,dict[str,float]] = {}
+        for changes,relative in ((parameters.get("baseline_overrides") or {},False),(shifts,True)):
+            for state,override in changes.items():
+                if state_key(state) not in rows:
+                    raise ValueError(f"Unknown state {state!r}")
+                name:str = str(model.states[rows[state_key(state)]])
+                for party,value in override.items():
+                    if party not in PARTIES:
+                        raise ValueError(f"Unknown party {party!r} for {state}. Expected one of {PARTIES}")
+                    current:float = overrides.get(name,{}).get(party,float(model.baseline[rows[state_key(state)],PARTIES.index(party)]))
+                    overrides.setdefault(name,{})[party] = current+float(value) if relative else float(value)
+        parameters["baseline_overrides"] = overrides
+        return Scenario(name="query",**parameters)
+
+    def canonical_key(self,scenario:Scenario) -> str:
+        parameters:dict = scenario.parameters()
+        del parameters["name"]
+        parameters["baseline_overrides"] = {state: dict(sorted(override.items())) for state,override in sorted(scenario.baseline_overrides.items())}
+        return json.dumps(parameters,sort_keys=True,separators=(",",":"))
+
+    def query(self,parameters:dict) -> dict:
+        scenario:Scenario = self.scenario(parameters)
+        key:str = self.canonical_key(scenario)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return {**self.cache[key],"cached": True}
+            running:Future|None = self.in_flight.get(key)
+            if running is None:
+                self.misses += 1
+                self.in_flight[key] = Future()
+        if running is not None:
+            return {**running.result(),"cached": True}
+        try:
+            result:dict = self._simulate(scenario)
+        except Exception as e:
+            with self.lock:
+                self.in_flight.pop(key).set_exception(e)
+            raise
+        with self.lock:
+            self.cache[key] = result
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.in_flight.pop(key).set_result(result)
+        return {**result,"cached": False}
+
+    def _simulate(self,scenario:Scenario) -> dict:
+        from convergence import Convergence_Monitor
+        model:State_Model = self.state_model(scenario.year)
+        baseline:np.ndarray = apply_baseline_overrides(model,scenario.baseline_overrides)
+        tasks = [(model.registered,baseline,model.electoral,scenario.seed,block_index,start,end,scenario.swing_highs,scenario.swing_lows,scenario.turnout_range) for block_index,start,end in block_ranges(scenario.rounds,self.block_size)]
+        batches = ordered_results(self.executor,simulate_block,tasks,window=2*self.workers) if self.executor is not None else (simulate_block(*task) for task in tasks)
+        monitor:Convergence_Monitor = Convergence_Monitor(model.electoral)
+        histogram:Electoral_Histogram = Electoral_Histogram(int(model.electoral.sum()))
+        for batch in batches:
+            monitor.update_batch(batch)
+            histogram.update_batch(batch)
+        report:dict = monitor.report()
+        rounds:int = max(monitor.rounds,1)
+        return {
+                "parameters": {key:value for key,value in scenario.parameters().items() if key != "name"},
+                "rounds": report["rounds"],
+                "national_win_probability": report["national_win_probability"],
+                "expected_electoral_votes": report["expected_electoral_votes"],
+                "achieved_half_width": report["achieved_half_width"],
+                "electoral_vote_distribution": histogram.distribution(),
+                "state_win_probability": {str(state): {party: float(monitor.state_wins[row,code]/rounds) for code,party in enumerate(PARTIES)} for row,state in enumerate(model.states)}
+            }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"cached_queries": len(self.cache),"cache_size": self.cache_size,"hits": self.hits,"misses": self.misses,"years_loaded": sorted(self.models)}
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+def make_handler(service:Query_Service,logger:XML_Logger):
+    class Query_Handler(BaseHTTPRequestHandler):
+        # POST /query with a JSON object of query parameters; GET /stats for cache statistics
+        def _send(self,status:int,body:dict) -> None:
+            data:bytes = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type","application/json")
+            self.send_header("Content-Length",str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/stats":
+                self._send(200,service.stats())
+            else:
+                self._send(404,{"error": f"Unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            if self.path != "/query":
+                self._send(404,{"error": f"Unknown path {self.path}"})
+                return
+            try:
+                parameters:dict = json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))) or b"{}")
+                self._send(200,service.query(parameters))
+            except (ValueError,TypeError) as e:
+                self._send(400,{"error": str(e)})
+            except Exception as e:
+                logger.log_to_xml(message=f"Query failed. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
+                self._send(500,{"error": str(e)})
+
+        def log_message(self,format:str,*args) -> None:
+            # Requests are not logged one by one; failures go to the XML log
+            pass
+    return Query_Handler
+
+def main(host:str="127.0.0.1",port:int=8028,workers:int=1,cache_size:int=DEFAULT_CACHE_SIZE,rounds:int=DEFAULT_QUERY_ROUNDS,seed:int=DEFAULT_QUERY_SEED):
+    try:
+        logger:XML_Logger = XML_Logger("query_service_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        service:Query_Service = Query_Service(workers=workers,cache_size=cache_size,rounds=rounds,seed=seed)
+        # Load the default year up front so the first query does not pay for it
+        service.state_model(2028)
+        server:ThreadingHTTPServer = ThreadingHTTPServer((host,port),make_handler(service,logger))
+        logger.log_to_xml(message=f"Serving what-if queries on http://{host}:{port}/query",basepath=logger.base_dir,status="INFO")
+        print(f"Serving what-if queries on http://{host}:{port}/query")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Query service failed. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Query service failed. Terminating program. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Serve what-if election queries over HTTP")
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--port",type=int,default=8028)
+    parser.add_argument("--workers",type=int,default=1)
+    parser.add_argument("--cache-size",type=int,default=DEFAULT_CACHE_SIZE)
+    parser.add_argument("--rounds",type=int,default=DEFAULT_QUERY_ROUNDS,help="Rounds per query unless the query sets its own")
+    parser.add_argument("--seed",type=int,default=DEFAULT_QUERY_SEED)
+    args:argparse.Namespace = parser.parse_args()
+    main(host=args.host,port=args.port,workers=args.workers,cache_size=args.cache_size,rounds=args.rounds,seed=args.seed)
@@ -0,0 +1,77 @@
+import json
+import numpy as np
+from state_model import state_key
+
+# Census Bureau divisions, the default regional blocks of the covariance
+CENSUS_DIVISIONS:dict[str,tuple[str,...]] = {
+        "New England": ("Connecticut","Maine","Massachusetts","New Hampshire","Rhode Island","Vermont"),
+        "Mid-Atlantic": ("New Jersey","New York","Pennsylvania"),
+        "East North Central": ("Illinois","Indiana","Michigan","Ohio","Wisconsin"),
+        "West North Central": ("Iowa","Kansas","Minnesota","Missouri","Nebraska","North Dakota","South Dakota"),
+        "South Atlantic": ("Delaware","District of Columbia","Florida","Georgia","Maryland","North Carolina","South Carolina","Virginia","West Virginia"),
+        "East South Central": ("Alabama","Kentucky","Mississippi","Tennessee"),
+        "West South Central": ("Arkansas","Louisiana","Oklahoma","Texas"),
+        "Mountain": ("Arizona","Colorado","Idaho","Montana","Nevada","New Mexico","Utah","Wyoming"),
+        "Pacific": ("Alaska","California","Hawaii","Oregon","Washington")
+    }
+
+class Regional_Swing:
+    # Per-state Republican-minus-Democrat margin shifts drawn from a multivariate normal, added on top of the national
+    # swing. Half of a state's shift moves from the Democrat to the Republican, so every state's popularity still sums to
+    # one and the usual clamping in adjust_party_popularity applies. Shifts are clipped at +/-max_shift so no party
+    # falls below -1 before clamping, the range in which the clamping branches keep every share non-negative.
+    def __init__(self,states:np.ndarray,covariance:np.ndarray,max_shift:float=0.5):
+        self.states:np.ndarray = np.asarray(states,dtype=object)
+        self.covariance:np.ndarray = np.asarray(covariance,dtype=np.float64)
+        if self.covariance.shape != (len(self.states),len(self.states)):
+            raise ValueError(f"Covariance is {self.covariance.shape}, expected one row and column per state ({len(self.states)})")
+        if not 0 < max_shift <= 1:
+            raise ValueError(f"max_shift must be in (0, 1], got {max_shift}")
+        self.max_shift:float = max_shift
+        try:
+            # Factored once; every draw is then one matrix product over all rounds and states
+            self.cholesky:np.ndarray = np.linalg.cholesky(self.covariance)
+        except np.linalg.LinAlgError:
+            raise ValueError("Swing covariance is not positive definite")
+
+    @classmethod
+    def from_regions(cls,states:np.ndarray,regions:dict[str,list[str]]|None=None,national_sd:float=0.0,regional_sd:float=0.03,state_sd:float=0.02,max_shift:float=0.5) -> "Regional_Swing":
+        # Block covariance: a shared national term, a term shared within each region and an independent state term.
+        # States outside every region only get the national and state terms.
+        regions = CENSUS_DIVISIONS if regions is None else regions
+        rows:dict[str,int] = {state_key(state):row for row,state in enumerate(states)}
+        membership:np.ndarray = np.zeros((len(states),len(regions)),dtype=np.float64)
+        for column,(region,members) in enumerate(regions.items()):
+            unknown:list[str] = sorted(state for state in members if state_key(state) not in rows)
+            if unknown:
+                raise ValueError(f"Region {region!r} lists unknown states {unknown}")
+            membership[[rows[state_key(state)] for state in members],column] = 1
+        if (membership.sum(axis=1) > 1).any():
+            raise ValueError("A state is listed in more than one region")
+        covariance:np.ndarray = national_sd**2+regional_sd**2*(membership@membership.T)+state_sd**2*np.eye(len(states))
+        return cls(states,covariance,max_shift=max_shift)
+
+    @classmethod
+    def from_spec(cls,states:np.ndarray,spec:dict) -> "Regional_Swing":
+        # Either {"covariance": [[...]], "states": [...]} with rows in the listed state order, or the keyword arguments of
+        # from_regions
+        if "covariance" not in spec:
+            return cls.from_regions(states,**spec)
+        covariance:np.ndarray = np.asarray(spec["covariance"],dtype=np.float64)
+        if "states" in spec:
+            rows:dict[str,int] = {state_key(state):row for row,state in enumerate(spec["states"])}
+            missing:list[str] = [state for state in states if state_key(state) not in rows]
+            if missing:
+                raise ValueError(f"Swing covariance is missing states {missing}")
+            order:np.ndarray = np.array([rows[state_key(state)] for state in states])
+            covariance = covariance[np.ix_(order,order)]
+        return cls(states,covariance,max_shift=spec.get("max_shift",0.5))
+
+    def draw(self,rng:np.random.Generator,n_rounds:int) -> np.ndarray:
+        # rounds x states margin shifts
+        normals:np.ndarray = rng.standard_normal((n_rounds,len(self.states)))
+        return np.clip(normals@self.cholesky.T,-self.max_shift,self.max_shift)
+
+def read_swing_model(path:str,states:np.ndarray) -> Regional_Swing:
+    with open(path,'r') as file:
+        return Regional_Swing.from_spec(states,json.load(file))
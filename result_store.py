@@ -0,0 +1,373 @@
+import io
+import os
+import json
+import shutil
+import zlib
+import numpy as np
+from typing import Generator,TYPE_CHECKING
+from batch_simulation import PARTIES,Round_Batch,state_winner_codes,winner_names
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+MANIFEST_NAME:str = "manifest.json"
+DEFAULT_FLUSH_ROUNDS:int = 50_000
+# Stored column name -> CSV column name. State and Winner are stored as small int codes.
+STATE_COLUMNS:dict[str,str] = {
+        "round": "Round",
+        "state": "State",
+        "electoral_votes": "Electoral Votes",
+        "winner": "Winner",
+        "total_votes": "Total Votes",
+        "rep_votes": "Republican Votes",
+        "rep_votes_pct": "Republican Vote Percent",
+        "dem_votes": "Democrat Votes",
+        "dem_votes_pct": "Democrat Vote Percent",
+        "ind_votes": "Independent Votes",
+        "ind_votes_pct": "Independent Vote Percent"
+    }
+NATIONAL_COLUMNS:dict[str,str] = {
+        "round": "Round",
+        "turnout": "Turnout Percent",
+        "total_votes": "Total Votes",
+        "rep_votes": "Republican Votes",
+        "rep_electoral_votes": "Republican Electoral Votes",
+        "rep_votes_pct": "Republican Vote Percent",
+        "dem_votes": "Democrat Votes",
+        "dem_electoral_votes": "Democrat Electoral Votes",
+        "dem_votes_pct": "Democrat Vote Percent",
+        "ind_votes": "Independent Votes",
+        "ind_electoral_votes": "Independent Electoral Votes",
+        "ind_votes_pct": "Independent Vote Percent"
+    }
+
+# State rows dominate the store, so they are kept in the narrowest types that hold a state's vote counts
+STATE_DTYPES:dict[str,type] = {
+        "round": np.int32,
+        "state": np.int16,
+        "electoral_votes": np.int16,
+        "winner": np.int8,
+        "total_votes": np.int32,
+        "rep_votes": np.int32,
+        "rep_votes_pct": np.float64,
+        "dem_votes": np.int32,
+        "dem_votes_pct": np.float64,
+        "ind_votes": np.int32,
+        "ind_votes_pct": np.float64
+    }
+
+# Compact chunks keep only the three vote counts per state and round plus the national turnout. Everything else in the
+# CSV schema is derived from them on read: total votes and percentages from the counts, winners with the simulator's
+# tie rules, national rows as sums over states, and rounds from the chunk's first_round.
+COMPACT_VOTES:str = "votes.bin"
+COMPACT_TURNOUT:str = "turnout.bin"
+# Preferred first; zlib is in the standard library and always available
+CODECS:tuple[str,...] = ("zstd","lz4","zlib")
+
+def available_codec(preferred:str|None=None) -> str:
+    for codec in ([preferred] if preferred is not None else CODECS):
+        try:
+            _codec_module(codec)
+            return codec
+        except ImportError:
+            if preferred is not None:
+                raise
+    return "zlib"
+
+def _codec_module(codec:str):
+    if codec == "zstd":
+        import zstandard
+        return zstandard
+    if codec == "lz4":
+        import lz4.frame
+        return lz4.frame
+    if codec == "zlib":
+        return zlib
+    raise ValueError(f"Unknown codec {codec!r}. Expected one of {CODECS}")
+
+def compress(codec:str,data:bytes) -> bytes:
+    module = _codec_module(codec)
+    if codec == "zstd":
+        return module.ZstdCompressor(level=3).compress(data)
+    if codec == "lz4":
+        return module.compress(data)
+    return module.compress(data,6)
+
+def decompress(codec:str,data:bytes) -> bytes:
+    module = _codec_module(codec)
+    if codec == "zstd":
+        return module.ZstdDecompressor().decompress(data)
+    return module.decompress(data)
+
+def shuffle_bytes(array:np.ndarray) -> bytes:
+    # Groups the n-th byte of every value together. The high bytes of vote counts barely change, so they compress to
+    # almost nothing once they sit next to each other.
+    return np.ascontiguousarray(array).view(np.uint8).reshape(-1,array.dtype.itemsize).T.tobytes()
+
+def unshuffle_bytes(data:bytes,dtype:type,shape:tuple[int,...]) -> np.ndarray:
+    itemsize:int = np.dtype(dtype).itemsize
+    return np.frombuffer(data,dtype=np.uint8).reshape(itemsize,-1).T.copy().view(dtype).reshape(shape)
+
+def write_manifest(store_dir:str,manifest:dict) -> None:
+    # Written to a temporary file and renamed so readers never see a half-written manifest
+    temp_path:str = os.path.join(store_dir,f"{MANIFEST_NAME}.tmp")
+    with open(temp_path,'w') as file:
+        json.dump(manifest,file,indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path,os.path.join(store_dir,MANIFEST_NAME))
+
+def read_manifest(store_dir:str) -> dict:
+    with open(os.path.join(store_dir,MANIFEST_NAME),'r') as file:
+        return json.load(file)
+
+def _replace_file(path:str,data:bytes) -> None:
+    # Never writes through an existing file: incremental.py patches hard-linked copies of chunks, whose files are shared
+    # with the originals until replaced
+    temp_path:str = f"{path}.tmp"
+    with open(temp_path,'wb') as file:
+        file.write(data)
+    os.replace(temp_path,path)
+
+def write_chunk(store_dir:str,chunk:dict,state_columns:dict[str,np.ndarray],national_columns:dict[str,np.ndarray],n_states:int) -> None:
+    # A chunk entry with a codec is written in the compact layout, which only keeps the vote counts and turnout
+    chunk_dir:str = os.path.join(store_dir,chunk["name"])
+    os.makedirs(chunk_dir,exist_ok=True)
+    if "codec" not in chunk:
+        for table,columns in (("state",state_columns),("national",national_columns)):
+            for key,values in columns.items():
+                buffer:io.BytesIO = io.BytesIO()
+                np.save(buffer,np.asarray(values).astype(STATE_DTYPES[key],copy=False) if table=="state" else values)
+                _replace_file(os.path.join(chunk_dir,f"{table}_{key}.npy"),buffer.getvalue())
+        return
+    rounds:np.ndarray = national_columns["round"]
+    if not np.array_equal(rounds,np.arange(rounds[0],rounds[0]+len(rounds))) or not np.array_equal(state_columns["state"],np.tile(np.arange(n_states),len(rounds))):
+        raise ValueError("Compact chunks need consecutive rounds with every state in store order")
+    write_compact_votes(store_dir,chunk,np.stack([np.asarray(state_columns[key]).reshape(len(rounds),n_states) for key in ("rep_votes","dem_votes","ind_votes")]))
+    _replace_file(os.path.join(chunk_dir,COMPACT_TURNOUT),compress(chunk["codec"],shuffle_bytes(np.asarray(national_columns["turnout"],dtype=np.float64))))
+
+class Result_Sink:
+    # compact=True writes compressed vote counts only (see COMPACT_VOTES); readers decode either layout transparently
+    def __init__(self,store_dir:str,states:np.ndarray,electoral:np.ndarray,flush_rounds:int=DEFAULT_FLUSH_ROUNDS,overwrite:bool=True,compact:bool=False,codec:str|None=None):
+        self.store_dir:str = store_dir
+        self.compact:bool = compact
+        self.codec:str|None = available_codec(codec) if compact else None
+        self.states:np.ndarray = np.asarray(states).astype(str)
+        self.electoral:np.ndarray = np.asarray(electoral,dtype=np.int64)
+        self.state_codes:dict[str,int] = {state:code for code,state in enumerate(self.states)}
+        self.flush_rounds:int = flush_rounds
+        self.state_buffer:list[dict[str,np.ndarray]] = []
+        self.national_buffer:list[dict[str,np.ndarray]] = []
+        self.buffered_rounds:int = 0
+        if overwrite and os.path.isdir(store_dir):
+            shutil.rmtree(store_dir)
+        os.makedirs(store_dir,exist_ok=True)
+        if os.path.exists(os.path.join(store_dir,MANIFEST_NAME)):
+            self.manifest:dict = read_manifest(store_dir)
+            if self.manifest.get("format","columns") != ("compact" if compact else "columns"):
+                raise ValueError(f"{store_dir} holds a {self.manifest.get('format','columns')} store and cannot be appended to as {'compact' if compact else 'columns'}")
+        else:
+            self.manifest:dict = {"format": "compact" if compact else "columns","states": self.states.tolist(),"electoral_votes": self.electoral.tolist(),"parties": list(PARTIES),"chunks": []}
+            write_manifest(store_dir,self.manifest)
+
+    @property
+    def rounds_written(self) -> int:
+        return sum(chunk["rounds"] for chunk in self.manifest["chunks"])
+
+    def append_columns(self,state_columns:dict[str,np.ndarray],national_columns:dict[str,np.ndarray]) -> None:
+        self.state_buffer.append({key:np.asarray(values).astype(STATE_DTYPES[key],copy=False) for key,values in state_columns.items()})
+        self.national_buffer.append(national_columns)
+        self.buffered_rounds += len(national_columns["round"])
+        if self.buffered_rounds >= self.flush_rounds:
+            self.flush()
+
+    def append_batch(self,batch:Round_Batch) -> None:
+        n_rounds,n_states = batch.total_votes.shape
+        if self.compact:
+            # Only the columns a compact chunk stores; the rest would be dropped at flush anyway
+            self.append_columns(
+                    {"state": np.tile(np.arange(n_states,dtype=np.int16),n_rounds),"rep_votes": batch.rep_votes.ravel(),"dem_votes": batch.dem_votes.ravel(),"ind_votes": batch.ind_votes.ravel()},
+                    {"round": batch.rounds,"turnout": batch.turnout}
+                )
+            return
+        total_votes:np.ndarray = batch.total_votes.astype(np.float64)
+        state_columns:dict[str,np.ndarray] = {
+                "round": np.repeat(batch.rounds,n_states),
+                "state": np.tile(np.arange(n_states,dtype=np.int16),n_rounds),
+                "electoral_votes": np.tile(self.electoral,n_rounds),
+                "winner": state_winner_codes(batch).ravel(),
+                "total_votes": batch.total_votes.ravel(),
+                "rep_votes": batch.rep_votes.ravel(),
+                "rep_votes_pct": (batch.rep_votes/total_votes).ravel(),
+                "dem_votes": batch.dem_votes.ravel(),
+                "dem_votes_pct": (batch.dem_votes/total_votes).ravel(),
+                "ind_votes": batch.ind_votes.ravel(),
+                "ind_votes_pct": (batch.ind_votes/total_votes).ravel()
+            }
+        national_total:np.ndarray = batch.total_votes.sum(axis=1)
+        national_columns:dict[str,np.ndarray] = {
+                "round": batch.rounds,
+                "turnout": batch.turnout,
+                "total_votes": national_total,
+                "rep_votes": batch.rep_votes.sum(axis=1),
+                "rep_electoral_votes": batch.rep_electoral_votes,
+                "rep_votes_pct": batch.rep_votes.sum(axis=1)/national_total,
+                "dem_votes": batch.dem_votes.sum(axis=1),
+                "dem_electoral_votes": batch.dem_electoral_votes,
+                "dem_votes_pct": batch.dem_votes.sum(axis=1)/national_total,
+                "ind_votes": batch.ind_votes.sum(axis=1),
+                "ind_electoral_votes": batch.ind_electoral_votes,
+                "ind_votes_pct": batch.ind_votes.sum(axis=1)/national_total
+            }
+        self.append_columns(state_columns,national_columns)
+
+    def append_round(self,state_results:list[dict[str,int|float]],national_results:dict[str,list[int|float]]) -> None:
+        # Accepts the dicts produced by State_Election_Simulation.save_to_csv and Federal_Election_Simulation.save_to_csv
+        party_codes:dict[str|None,int] = {party:code for code,party in enumerate(PARTIES)}
+        state_columns:dict[str,np.ndarray] = {}
+        for key,column in STATE_COLUMNS.items():
+            values:list = [row[column] for row in state_results]
+            if key == "state":
+                state_columns[key] = np.array([self.state_codes[value] for value in values],dtype=np.int16)
+            elif key == "winner":
+                state_columns[key] = np.array([party_codes.get(value,-1) for value in values],dtype=np.int8)
+            else:
+                state_columns[key] = np.array(values)
+        national_columns:dict[str,np.ndarray] = {key:np.array(national_results[column]) for key,column in NATIONAL_COLUMNS.items()}
+        self.append_columns(state_columns,national_columns)
+
+    def flush(self) -> None:
+        if self.buffered_rounds == 0:
+            return
+        chunk_name:str = f"chunk_{len(self.manifest['chunks']):06d}"
+        state_columns:dict[str,np.ndarray] = {key:np.concatenate([columns[key] for columns in self.state_buffer]) for key in self.state_buffer[0]}
+        national_columns:dict[str,np.ndarray] = {key:np.concatenate([columns[key] for columns in self.national_buffer]) for key in self.national_buffer[0]}
+        rounds:np.ndarray = national_columns["round"]
+        chunk:dict = {"name": chunk_name,"first_round": int(rounds[0]),"last_round": int(rounds[-1]),"rounds": int(len(rounds))}
+        if self.compact:
+            chunk["codec"] = self.codec
+        write_chunk(self.store_dir,chunk,state_columns,national_columns,len(self.states))
+        self.manifest["chunks"].append(chunk)
+        write_manifest(self.store_dir,self.manifest)
+        self.state_buffer = []
+        self.national_buffer = []
+        self.buffered_rounds = 0
+
+    def truncate(self,n_chunks:int) -> None:
+        # Discards buffered rows and every chunk after the first n_chunks, including directories a crash left unlisted
+        self.state_buffer = []
+        self.national_buffer = []
+        self.buffered_rounds = 0
+        self.manifest["chunks"] = self.manifest["chunks"][:n_chunks]
+        kept:set[str] = {chunk["name"] for chunk in self.manifest["chunks"]}
+        for entry in os.scandir(self.store_dir):
+            if entry.is_dir() and entry.name.startswith("chunk_") and entry.name not in kept:
+                shutil.rmtree(entry.path)
+        write_manifest(self.store_dir,self.manifest)
+
+    def close(self) -> None:
+        self.flush()
+
+def read_compact_votes(store_dir:str,chunk:dict,n_states:int) -> np.ndarray:
+    # parties x rounds x states vote counts of a compact chunk
+    with open(os.path.join(store_dir,chunk["name"],COMPACT_VOTES),'rb') as file:
+        return unshuffle_bytes(decompress(chunk["codec"],file.read()),np.int32,(3,n_states,chunk["rounds"])).transpose(0,2,1)
+
+def write_compact_votes(store_dir:str,chunk:dict,votes:np.ndarray) -> None:
+    # Stored parties x states x rounds, so each state's counts over consecutive rounds are adjacent
+    _replace_file(os.path.join(store_dir,chunk["name"],COMPACT_VOTES),compress(chunk["codec"],shuffle_bytes(np.asarray(votes,dtype=np.int32).transpose(0,2,1))))
+
+def decode_compact_chunk(store_dir:str,chunk:dict,table:str,electoral:np.ndarray) -> dict[str,np.ndarray]:
+    # Rebuilds the same columns Result_Sink.append_batch stores in the uncompressed layout
+    chunk_dir:str = os.path.join(store_dir,chunk["name"])
+    n_rounds:int = chunk["rounds"]
+    rounds:np.ndarray = np.arange(chunk["first_round"],chunk["first_round"]+n_rounds,dtype=np.int64)
+    votes:np.ndarray = read_compact_votes(store_dir,chunk,len(electoral))
+    rep_votes,dem_votes,ind_votes = votes
+    total_votes:np.ndarray = rep_votes+dem_votes+ind_votes
+    if table == "state":
+        n_states:int = len(electoral)
+        state_total:np.ndarray = total_votes.astype(np.float64)
+        stacked:np.ndarray = np.stack([rep_votes,dem_votes,ind_votes],axis=-1)
+        unique_winner:np.ndarray = (stacked==stacked.max(axis=-1,keepdims=True)).sum(axis=-1)==1
+        return {key:values.astype(STATE_DTYPES[key],copy=False) for key,values in {
+                "round": np.repeat(rounds,n_states),
+                "state": np.tile(np.arange(n_states),n_rounds),
+                "electoral_votes": np.tile(electoral,n_rounds),
+                "winner": np.where(unique_winner,np.argmax(stacked,axis=-1),-1).ravel(),
+                "total_votes": total_votes.ravel(),
+                "rep_votes": rep_votes.ravel(),
+                "rep_votes_pct": (rep_votes/state_total).ravel(),
+                "dem_votes": dem_votes.ravel(),
+                "dem_votes_pct": (dem_votes/state_total).ravel(),
+                "ind_votes": ind_votes.ravel(),
+                "ind_votes_pct": (ind_votes/state_total).ravel()
+            }.items()}
+    with open(os.path.join(chunk_dir,COMPACT_TURNOUT),'rb') as file:
+        turnout:np.ndarray = unshuffle_bytes(decompress(chunk["codec"],file.read()),np.float64,(n_rounds,))
+    # Electoral votes go to the plurality winner with Federal_Election_Simulation's Republican-first tie-breaking
+    winners:np.ndarray = np.argmax(np.stack([rep_votes,dem_votes,ind_votes],axis=-1),axis=-1)
+    national_total:np.ndarray = total_votes.sum(axis=1,dtype=np.int64)
+    columns:dict[str,np.ndarray] = {"round": rounds,"turnout": turnout,"total_votes": national_total}
+    for code,party in enumerate(("rep","dem","ind")):
+        party_votes:np.ndarray = votes[code].sum(axis=1,dtype=np.int64)
+        columns[f"{party}_votes"] = party_votes
+        columns[f"{party}_electoral_votes"] = np.where(winners==code,electoral,0).sum(axis=1)
+        columns[f"{party}_votes_pct"] = party_votes/national_total
+    return columns
+
+def read_chunk(store_dir:str,chunk:dict,table:str,mmap:bool=False,manifest:dict|None=None) -> dict[str,np.ndarray]:
+    # Compact chunks are decoded in memory, so mmap only applies to the uncompressed layout
+    if "codec" in chunk:
+        manifest = manifest if manifest is not None else read_manifest(store_dir)
+        return decode_compact_chunk(store_dir,chunk,table,np.asarray(manifest["electoral_votes"],dtype=np.int64))
+    chunk_dir:str = os.path.join(store_dir,chunk["name"])
+    columns:dict[str,np.ndarray] = {}
+    for file_name in sorted(os.listdir(chunk_dir)):
+        if file_name.startswith(f"{table}_") and file_name.endswith(".npy"):
+            columns[file_name[len(table)+1:-4]] = np.load(os.path.join(chunk_dir,file_name),mmap_mode="r" if mmap else None)
+    return columns
+
+def read_table(store_dir:str,table:str,mmap:bool=False) -> dict[str,np.ndarray]:
+    # Only chunks listed in the manifest are read, so a reader sees a consistent snapshot during a run
+    manifest:dict = read_manifest(store_dir)
+    columns:dict[str,list[np.ndarray]] = {}
+    for chunk in manifest["chunks"]:
+        for key,values in read_chunk(store_dir,chunk,table,mmap=mmap,manifest=manifest).items():
+            columns.setdefault(key,[]).append(values)
+    return {key:np.concatenate(values) if len(values)>1 else values[0] for key,values in columns.items()}
+
+def national_frame(columns:dict[str,np.ndarray]) -> "DataFrame":
+    from pandas import DataFrame
+    return DataFrame({csv_name:columns[key] for key,csv_name in NATIONAL_COLUMNS.items()})
+
+def state_frame(columns:dict[str,np.ndarray],manifest:dict) -> "DataFrame":
+    from pandas import DataFrame,Categorical
+    data:dict[str,object] = {}
+    for key,csv_name in STATE_COLUMNS.items():
+        if key == "state":
+            data[csv_name] = Categorical.from_codes(columns[key].astype(np.int64),categories=manifest["states"])
+        elif key == "winner":
+            data[csv_name] = winner_names(columns[key])
+        else:
+            data[csv_name] = columns[key]
+    return DataFrame(data)
+
+def read_national_results(store_dir:str) -> "DataFrame":
+    return national_frame(read_table(store_dir,"national"))
+
+def read_state_results(store_dir:str) -> "DataFrame":
+    return state_frame(read_table(store_dir,"state"),read_manifest(store_dir))
+
+def iter_results(store_dir:str,table:str) -> Generator["DataFrame",None,None]:
+    # One CSV-schema frame per chunk, decoded only when the caller asks for it
+    manifest:dict = read_manifest(store_dir)
+    for chunk in manifest["chunks"]:
+        columns:dict[str,np.ndarray] = read_chunk(store_dir,chunk,table,manifest=manifest)
+        yield state_frame(columns,manifest) if table=="state" else national_frame(columns)
+
+def export_csv(store_dir:str,state_csv:str="State_Results.csv",national_csv:str="National_Results.csv") -> None:
+    # Converted one chunk at a time so the export never holds the whole run in memory
+    for index,(state_df,national_df) in enumerate(zip(iter_results(store_dir,"state"),iter_results(store_dir,"national"))):
+        to_csv_options:dict = {"mode": "w" if index==0 else "a","encoding": 'utf-8',"index": False,"header": index==0,"float_format": '{:,.4f}'.format}
+        state_df.to_csv(state_csv,**to_csv_options)
+        national_df.to_csv(national_csv,**to_csv_options)
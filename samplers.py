@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import argparse
+import traceback
+import numpy as np
+from xml_logging import XML_Logger
+from state_model import State_Model
+from batch_simulation import PARTIES,SWING_NAMES,SWING_HIGHS,SWING_LOWS,TURNOUT_RANGE,Round_Batch,net_popularity_changes,simulate_batch,state_winner_codes
+CURRENT_DIRECTORY:str = os.getcwd()
+SAMPLERS:tuple[str,...] = ("monte_carlo","antithetic","latin_hypercube","sobol","importance")
+# Every round is one point of the unit cube: the six swing transfers, then turnout
+DIMENSIONS:tuple[str,...] = (*SWING_NAMES,"turnout")
+# Rounds per replicate. Each replicate is an independent randomization, so their spread measures the achieved precision.
+DEFAULT_CHUNK_SIZE:int = 2_048
+IMPORTANCE_TARGETS:tuple[str,...] = ("split","independent_state")
+# Outcomes estimated for every run, each a 0/1 value per round
+METRICS:tuple[str,...] = ("republican_win","democrat_win","independent_win","republican_popular_democrat_electoral","democrat_popular_republican_electoral","independent_state")
+
+def round_outcomes(batch:Round_Batch,majority:int) -> dict[str,np.ndarray]:
+    rep_votes:np.ndarray = batch.rep_votes.sum(axis=1)
+    dem_votes:np.ndarray = batch.dem_votes.sum(axis=1)
+    return {
+            "republican_win": batch.rep_electoral_votes >= majority,
+            "democrat_win": batch.dem_electoral_votes >= majority,
+            "independent_win": batch.ind_electoral_votes >= majority,
+            # The same splits analysis.py reports
+            "republican_popular_democrat_electoral": (rep_votes > dem_votes)&(batch.rep_electoral_votes < batch.dem_electoral_votes),
+            "democrat_popular_republican_electoral": (dem_votes > rep_votes)&(batch.dem_electoral_votes < batch.rep_electoral_votes),
+            "independent_state": (state_winner_codes(batch)==2).any(axis=1)
+        }
+
+def unit_to_inputs(points:np.ndarray,swing_highs:np.ndarray=SWING_HIGHS,swing_lows:np.ndarray=SWING_LOWS,turnout_range:tuple[float,float]=TURNOUT_RANGE) -> tuple[np.ndarray,np.ndarray]:
+    # Same affine map rng.uniform applies, so U(0,1) points reproduce draw_popularity_changes and draw_turnout
+    transfers:np.ndarray = swing_lows+(swing_highs-swing_lows)*points[:,:len(SWING_NAMES)]
+    turnout:np.ndarray = turnout_range[0]+(turnout_range[1]-turnout_range[0])*points[:,len(SWING_NAMES)]
+    return net_popularity_changes(transfers),turnout
+
+class Marginal_Proposal:
+    # Importance proposal over the unit cube: per dimension, a histogram of where the target outcome occurred in a pilot
+    # run, mixed with the uniform so every weight stays below 1/uniform_share. Dimensions are drawn independently, so
+    # the density (and the weight p/q = 1/q) is exact.
+    def __init__(self,event_points:np.ndarray,bins:int=20,uniform_share:float=0.2):
+        self.bins:int = bins
+        counts:np.ndarray = np.stack([np.histogram(event_points[:,dimension],bins=bins,range=(0,1))[0] for dimension in range(event_points.shape[1])])
+        self.bin_probability:np.ndarray = uniform_share/bins+(1-uniform_share)*counts/counts.sum(axis=1,keepdims=True)
+
+    def sample(self,rng:np.random.Generator,n:int) -> tuple[np.ndarray,np.ndarray]:
+        dimensions:int = len(self.bin_probability)
+        cumulative:np.ndarray = np.cumsum(self.bin_probability,axis=1)
+        chosen:np.ndarray = np.stack([np.minimum(np.searchsorted(cumulative[dimension],rng.random(n)*cumulative[dimension,-1]),self.bins-1) for dimension in range(dimensions)],axis=1)
+        points:np.ndarray = (chosen+rng.random((n,dimensions)))/self.bins
+        density:np.ndarray = np.prod(self.bin_probability[np.arange(dimensions),chosen]*self.bins,axis=1)
+        return points,1/density
+
+def sample_unit_points(sampler:str,rng:np.random.Generator,n:int,proposal:Marginal_Proposal|None=None) -> tuple[np.ndarray,np.ndarray]:
+    # Returns n points in the unit cube and their likelihood-ratio weights (all 1 except for importance sampling)
+    dimensions:int = len(DIMENSIONS)
+    if sampler == "monte_carlo":
+        points:np.ndarray = rng.random((n,dimensions))
+    elif sampler == "antithetic":
+        half:np.ndarray = rng.random(((n+1)//2,dimensions))
+        points = np.empty((2*len(half),dimensions))
+        points[0::2] = half
+        points[1::2] = 1-half
+        points = points[:n]
+    elif sampler == "latin_hypercube":
+        # One point in each of the n equal-probability strata of every dimension, paired up at random
+        strata:np.ndarray = np.argsort(rng.random((dimensions,n)),axis=1).T
+        points = (strata+rng.random((n,dimensions)))/n
+    elif sampler == "sobol":
+        # Scrambled Sobol points; scipy is only needed for this sampler. The sequence is drawn to a power of two, where its
+        # balance properties hold, and cut back to n for a short final replicate.
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError("The sobol sampler needs scipy, which is not installed. Install scipy or use the latin_hypercube sampler.") from None
+        points = qmc.Sobol(dimensions,scramble=True,seed=rng).random_base2(int(np.ceil(np.log2(max(n,1)))))[:n]
+    elif sampler == "importance":
+        if proposal is None:
+            raise ValueError("The importance sampler needs a proposal from a pilot run")
+        return proposal.sample(rng,n)
+    else:
+        raise ValueError(f"Unknown sampler {sampler!r}. Expected one of {SAMPLERS}")
+    return points,np.ones(n)
+
+def pilot_proposal(state_model:State_Model,rng:np.random.Generator,target:str,pilot_rounds:int=20_000) -> Marginal_Proposal|None:
+    # Plain Monte Carlo rounds locate the region of the cube where the target outcome happens
+    majority:int = int(state_model.electoral.sum())//2+1
+    event_points:list[np.ndarray] = []
+    for start in range(0,pilot_rounds,DEFAULT_CHUNK_SIZE):
+        points,_ = sample_unit_points("monte_carlo",rng,min(DEFAULT_CHUNK_SIZE,pilot_rounds-start))
+        popularity_changes,turnout = unit_to_inputs(points)
+        outcomes:dict[str,np.ndarray] = round_outcomes(simulate_batch(state_model.registered,state_model.baseline,state_model.electoral,popularity_changes,turnout,rng),majority)
+        hits:np.ndarray = outcomes["republican_popular_democrat_electoral"]|outcomes["democrat_popular_republican_electoral"] if target=="split" else outcomes[target]
+        event_points.append(points[hits])
+    events:np.ndarray = np.concatenate(event_points)
+    return Marginal_Proposal(events) if len(events) > 0 else None
+
+class Weighted_Estimates:
+    # Self-normalized weighted means of every metric, kept per replicate so their spread gives the achieved variance
+    def __init__(self,electoral:np.ndarray):
+        self.electoral:np.ndarray = np.asarray(electoral,dtype=np.int64)
+        self.majority:int = int(self.electoral.sum())//2+1
+        self.rounds:int = 0
+        self.weight_sum:float = 0.0
+        self.weight_square_sum:float = 0.0
+        self.metric_sums:np.ndarray = np.zeros(len(METRICS))
+        self.electoral_sums:np.ndarray = np.zeros(len(PARTIES))
+        self.state_win_sums:np.ndarray = np.zeros((len(self.electoral),len(PARTIES)))
+        self.replicates:list[np.ndarray] = []
+
+    def update(self,batch:Round_Batch,weights:np.ndarray) -> None:
+        outcomes:dict[str,np.ndarray] = round_outcomes(batch,self.majority)
+        values:np.ndarray = np.column_stack([outcomes[metric] for metric in METRICS]).astype(np.float64)
+        self.rounds += len(weights)
+        self.weight_sum += float(weights.sum())
+        self.weight_square_sum += float((weights**2).sum())
+        self.metric_sums += weights@values
+        self.electoral_sums += weights@np.column_stack([batch.rep_electoral_votes,batch.dem_electoral_votes,batch.ind_electoral_votes])
+        winner_codes:np.ndarray = state_winner_codes(batch)
+        for code in range(len(PARTIES)):
+            self.state_win_sums[:,code] += weights@(winner_codes==code)
+        self.replicates.append(weights@values/weights.sum())
+
+    def estimates(self) -> np.ndarray:
+        return self.metric_sums/self.weight_sum if self.weight_sum > 0 else np.zeros(len(METRICS))
+
+    def effective_sample_size(self) -> dict[str,float|None]:
+        # n_eff = p(1-p)/Var(estimate): the number of plain Monte Carlo rounds with the same precision. Var(estimate) comes
+        # from the spread of the independent replicates; metrics never observed have no defined n_eff.
+        estimates:np.ndarray = self.estimates()
+        replicates:np.ndarray = np.array(self.replicates)
+        result:dict[str,float|None] = {}
+        for index,metric in enumerate(METRICS):
+            p:float = float(estimates[index])
+            variance:float = float(replicates[:,index].var(ddof=1)/len(replicates)) if len(replicates) > 1 else 0.0
+            result[metric] = p*(1-p)/variance if variance > 0 and 0 < p < 1 else None
+        return result
+
+    def report(self) -> dict:
+        estimates:np.ndarray = self.estimates()
+        replicates:np.ndarray = np.array(self.replicates)
+        standard_error:np.ndarray = replicates.std(axis=0,ddof=1)/np.sqrt(len(replicates)) if len(replicates) > 1 else np.full(len(METRICS),np.nan)
+        return {
+                "rounds": self.rounds,
+                "replicates": len(self.replicates),
+                "estimates": {metric: float(estimates[index]) for index,metric in enumerate(METRICS)},
+                "standard_error": {metric: float(standard_error[index]) for index,metric in enumerate(METRICS)},
+                "effective_sample_size": self.effective_sample_size(),
+                # Kish's weight-based n_eff, which only differs from the round count for importance sampling
+                "weight_effective_sample_size": self.weight_sum**2/self.weight_square_sum if self.weight_square_sum > 0 else 0.0,
+                "expected_electoral_votes": {party: float(self.electoral_sums[code]/self.weight_sum) for code,party in enumerate(PARTIES)}
+            }
+
+def run_sampler(state_model:State_Model,sampler:str,rounds:int,seed:int|None=None,target:str="split",pilot_rounds:int=20_000,chunk_size:int=DEFAULT_CHUNK_SIZE) -> Weighted_Estimates:
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler {sampler!r}. Expected one of {SAMPLERS}")
+    rng:np.random.Generator = np.random.default_rng(seed)
+    proposal:Marginal_Proposal|None = None
+    if sampler == "importance":
+        if target not in IMPORTANCE_TARGETS:
+            raise ValueError(f"Unknown importance target {target!r}. Expected one of {IMPORTANCE_TARGETS}")
+        proposal = pilot_proposal(state_model,rng,target,pilot_rounds)
+        if proposal is None:
+            # Nothing to aim at; the uniform proposal is plain Monte Carlo with unit weights
+            sampler = "monte_carlo"
+    estimates:Weighted_Estimates = Weighted_Estimates(state_model.electoral)
+    for start in range(0,rounds,chunk_size):
+        points,weights = sample_unit_points(sampler,rng,min(chunk_size,rounds-start),proposal)
+        popularity_changes,turnout = unit_to_inputs(points)
+        estimates.update(simulate_batch(state_model.registered,state_model.baseline,state_model.electoral,popularity_changes,turnout,rng,first_round=start+1),weights)
+    return estimates
+
+def main(sampler:str="latin_hypercube",rounds:int=100_000,seed:int|None=None,target:str="split",report_path:str="sampler_report.json"):
+    try:
+        from input_cache import load_cached_state_model
+        logger:XML_Logger = XML_Logger("samplers_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        started:float = time.perf_counter()
+        state_model,_ = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root=os.path.join(CURRENT_DIRECTORY,"cache","inputs"))
+        report:dict = run_sampler(state_model,sampler,rounds,seed=seed,target=target).report()
+        report.update({"sampler": sampler,"target": target if sampler=="importance" else None,"seconds": time.perf_counter()-started})
+        with open(os.path.join(CURRENT_DIRECTORY,report_path),'w') as file:
+            json.dump(report,file,indent=2)
+        effective:str = ", ".join(f"{metric} {value:,.0f}" for metric,value in report["effective_sample_size"].items() if value is not None)
+        message:str = f"{sampler} sampler, {rounds:,.0f} rounds in {report['seconds']:.1f}s. Effective sample sizes: {effective}"
+        logger.log_to_xml(message=message,basepath=logger.base_dir,status="SUCCESS")
+        print(message)
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Sampler run failed. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Sampler run failed. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Estimate outcome probabilities with a variance-reduction sampler and report its effective sample size")
+    parser.add_argument("--sampler",choices=SAMPLERS,default="latin_hypercube",help="sobol needs scipy")
+    parser.add_argument("--rounds",type=int,default=100_000)
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--target",choices=IMPORTANCE_TARGETS,default="split",help="Outcome the importance sampler aims at")
+    parser.add_argument("--report",default="sampler_report.json")
+    args:argparse.Namespace = parser.parse_args()
+    main(sampler=args.sampler,rounds=args.rounds,seed=args.seed,target=args.target,report_path=args.report)
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import argparse
+import itertools
+import traceback
+import numpy as np
+from datetime import datetime
+from pandas import read_csv,DataFrame
+from xml_logging import XML_Logger
+from state_model import State_Model,state_key
+from batch_simulation import PARTIES,SWING_NAMES,SWING_HIGHS,SWING_LOWS,TURNOUT_RANGE
+from parallel_simulation import DEFAULT_BLOCK_SIZE,block_ranges,simulate_block,ordered_results
+CURRENT_DIRECTORY:str = os.getcwd()
+SWEEP_MANIFEST:str = "sweep_manifest.json"
+SCENARIO_KEYS:tuple[str,...] = ("name","year","rounds","seed","swing_ranges","turnout_range","baseline_overrides")
+
+class Scenario:
+    # One parameter set. swing_ranges maps a SWING_NAMES transfer to its [low, high] uniform bounds, baseline_overrides
+    # maps a state to {party: popularity}; anything left out keeps the simulator's hardcoded value.
+    def __init__(self,name:str,year:int=2028,rounds:int=100_000,seed:int|None=None,swing_ranges:dict[str,list[float]]|None=None,turnout_range:list[float]|None=None,baseline_overrides:dict[str,dict[str,float]]|None=None):
+        # The name becomes a directory under the sweep's output directory, which Result_Sink empties before writing
+        if not isinstance(name,str) or not re.fullmatch(r"[A-Za-z0-9_.-]+",name) or name in (".",".."):
+            raise ValueError(f"Invalid scenario name {name!r}. Use letters, digits, '_', '.' and '-' only")
+        self.name:str = name
+        self.year:int = int(year)
+        self.rounds:int = int(rounds)
+        self.seed:int|None = seed
+        self.swing_ranges:dict[str,list[float]] = swing_ranges or {}
+        self.turnout_range:tuple[float,float] = tuple(turnout_range) if turnout_range is not None else TURNOUT_RANGE
+        self.baseline_overrides:dict[str,dict[str,float]] = baseline_overrides or {}
+        unknown:list[str] = sorted(set(self.swing_ranges)-set(SWING_NAMES))
+        if unknown:
+            raise ValueError(f"Scenario {name!r} has unknown swing transfers {unknown}. Expected some of {SWING_NAMES}")
+        for state,override in self.baseline_overrides.items():
+            unknown = sorted(set(override)-set(PARTIES))
+            if unknown:
+                raise ValueError(f"Scenario {name!r} overrides unknown parties {unknown} for {state}. Expected some of {PARTIES}")
+        for transfer,bounds in self.swing_ranges.items():
+            if len(bounds) != 2 or not bounds[0] <= bounds[1]:
+                raise ValueError(f"Scenario {name!r} has an invalid range {bounds} for {transfer}. Expected [low, high] with low <= high")
+        if not 0 <= self.turnout_range[0] <= self.turnout_range[1] <= 1:
+            raise ValueError(f"Scenario {name!r} has an invalid turnout range {self.turnout_range}")
+        if self.rounds <= 0:
+            raise ValueError(f"Scenario {name!r} needs a positive number of rounds, not {self.rounds}")
+
+    @property
+    def swing_lows(self) -> np.ndarray:
+        return np.array([self.swing_ranges.get(name,(low,high))[0] for name,low,high in zip(SWING_NAMES,SWING_LOWS,SWING_HIGHS)],dtype=np.float64)
+
+    @property
+    def swing_highs(self) -> np.ndarray:
+        return np.array([self.swing_ranges.get(name,(low,high))[1] for name,low,high in zip(SWING_NAMES,SWING_LOWS,SWING_HIGHS)],dtype=np.float64)
+
+    def parameters(self) -> dict:
+        return {
+                "name": self.name,
+                "year": self.year,
+                "rounds": self.rounds,
+                "seed": self.seed,
+                "swing_ranges": {name: [float(low),float(high)] for name,low,high in zip(SWING_NAMES,self.swing_lows,self.swing_highs)},
+                "turnout_range": list(self.turnout_range),
+                "baseline_overrides": self.baseline_overrides
+            }
+
+def read_scenario_file(path:str) -> dict:
+    extension:str = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        import tomllib
+        with open(path,'rb') as file:
+            return tomllib.load(file)
+    if extension in (".yaml",".yml"):
+        # PyYAML is only needed for YAML scenario files
+        import yaml
+        with open(path,'r') as file:
+            return yaml.safe_load(file)
+    with open(path,'r') as file:
+        return json.load(file)
+
+def expand_scenarios(spec:dict) -> list[Scenario]:
+    # "defaults" apply to every scenario, "scenarios" lists parameter sets, and "grid" maps a parameter to the values
+    # it sweeps over; every listed scenario is crossed with every combination of grid values.
+    defaults:dict = spec.get("defaults",{})
+    listed:list[dict] = spec.get("scenarios",[{}])
+    grid:dict[str,list] = spec.get("grid",{})
+    unknown:list[str] = sorted((set(defaults)|set(grid)|{key for entry in listed for key in entry})-set(SCENARIO_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters {unknown}. Expected some of {SCENARIO_KEYS}")
+    combinations:list[dict] = [dict(zip(grid,values)) for values in itertools.product(*grid.values())]
+    scenarios:list[Scenario] = []
+    for index,entry in enumerate(listed):
+        base_name:str = entry.get("name",f"scenario_{index:04d}")
+        for grid_index,combination in enumerate(combinations):
+            name:str = base_name if len(combinations)==1 else f"{base_name}_{grid_index:04d}"
+            scenarios.append(Scenario(**{**defaults,**entry,**combination,"name": name}))
+    names:list[str] = [scenario.name for scenario in scenarios]
+    duplicates:list[str] = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate scenario names {duplicates}")
+    return scenarios
+
+def apply_baseline_overrides(state_model:State_Model,overrides:dict[str,dict[str,float]]) -> np.ndarray:
+    baseline:np.ndarray = np.array(state_model.baseline,dtype=np.float64)
+    rows:dict[str,int] = {state_key(state):row for row,state in enumerate(state_model.states)}
+    for state,override in overrides.items():
+        if state_key(state) not in rows:
+            raise ValueError(f"Baseline override for unknown state {state!r}")
+        for party,popularity in override.items():
+            baseline[rows[state_key(state)],PARTIES.index(party)] = popularity
+    return baseline
+
+def _scenario_tasks(scenario:Scenario,state_model:State_Model,baseline:np.ndarray,seed:int,block_size:int):
+    for block_index,start,end in block_ranges(scenario.rounds,block_size):
+        yield (state_model.registered,baseline,state_model.electoral,seed,block_index,start,end,scenario.swing_highs,scenario.swing_lows,scenario.turnout_range)
+
+def run_sweep(scenarios:list[Scenario],output_dir:str,logger:XML_Logger,seed:int,workers:int=1,store:bool=False,block_size:int=DEFAULT_BLOCK_SIZE,voter_file:str="data/Combined_Data.csv",party_file:str="data/Baseline_Popularity.csv") -> list[dict]:
+    from convergence import Convergence_Monitor
+    # Inputs are read once and one State_Model is built per year, then shared by every scenario for that year
+    voter_df:DataFrame = read_csv(voter_file)
+    party_popularity_data:np.ndarray = read_csv(party_file).to_numpy()
+    models:dict[int,State_Model] = {year: State_Model.from_data(voter_df[voter_df["Year"]==year].to_numpy(),party_popularity_data) for year in sorted({scenario.year for scenario in scenarios})}
+    baselines:list[np.ndarray] = [apply_baseline_overrides(models[scenario.year],scenario.baseline_overrides) for scenario in scenarios]
+    # Scenarios without their own seed share the sweep seed, so their differences are not masked by sampling noise
+    seeds:list[int] = [scenario.seed if scenario.seed is not None else seed for scenario in scenarios]
+    tasks = ((index,task) for index,scenario in enumerate(scenarios) for task in _scenario_tasks(scenario,models[scenario.year],baselines[index],seeds[index],block_size))
+    owners:list[int] = []
+    def queued_tasks():
+        for index,task in tasks:
+            owners.append(index)
+            yield task
+
+    os.makedirs(output_dir,exist_ok=True)
+    monitors:list = [Convergence_Monitor(models[scenario.year].electoral) for scenario in scenarios]
+    sinks:list = [None]*len(scenarios)
+    if store:
+        from result_store import Result_Sink
+        sinks = [Result_Sink(os.path.join(output_dir,scenario.name),models[scenario.year].states,models[scenario.year].electoral) for scenario in scenarios]
+
+    # One worker pool runs the blocks of every scenario back to back, so it never idles between scenarios
+    if workers <= 1:
+        batches = (simulate_block(*task) for task in queued_tasks())
+        executor = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+        batches = ordered_results(executor,simulate_block,queued_tasks(),window=2*workers)
+    try:
+        for position,batch in enumerate(batches):
+            index:int = owners[position]
+            monitors[index].update_batch(batch)
+            if sinks[index] is not None:
+                sinks[index].append_batch(batch)
+            if int(batch.rounds[-1]) == scenarios[index].rounds:
+                if sinks[index] is not None:
+                    sinks[index].close()
+                logger.log_to_xml(message=f"Finished scenario {scenarios[index].name} ({index+1}/{len(scenarios)})",basepath=logger.base_dir,status="INFO")
+                print(f"Finished scenario {scenarios[index].name} ({index+1}/{len(scenarios)}) at {datetime.now()}")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        # Also writes out what a scenario had buffered when the sweep stopped early
+        for sink in sinks:
+            if sink is not None:
+                sink.close()
+
+    results:list[dict] = []
+    for index,scenario in enumerate(scenarios):
+        report:dict = monitors[index].report()
+        results.append({
+                **scenario.parameters(),
+                "seed": seeds[index],
+                "partition": scenario.name if store else None,
+                "national_win_probability": report["national_win_probability"],
+                "expected_electoral_votes": report["expected_electoral_votes"],
+                "achieved_half_width": report["achieved_half_width"]
+            })
+    with open(os.path.join(output_dir,SWEEP_MANIFEST),'w') as file:
+        json.dump({"seed": seed,"scenarios": results},file,indent=2)
+    summary_frame(results).to_csv(os.path.join(output_dir,"Scenario_Summary.csv"),index=False)
+    return results
+
+def summary_frame(results:list[dict]) -> DataFrame:
+    return DataFrame.from_records([{
+            "Scenario": result["name"],
+            "Year": result["year"],
+            "Rounds": result["rounds"],
+            "Turnout Low": result["turnout_range"][0],
+            "Turnout High": result["turnout_range"][1],
+            **{f"{party} Win Probability": result["national_win_probability"][party] for party in PARTIES},
+            **{f"{party} Expected Electoral Votes": result["expected_electoral_votes"][party] for party in PARTIES}
+        } for result in results])
+
+def main(scenario_file:str,output_dir:str="sweep",seed:int|None=None,workers:int=1,store:bool=False):
+    try:
+        logger:XML_Logger = XML_Logger("scenario_sweep_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        scenarios:list[Scenario] = expand_scenarios(read_scenario_file(scenario_file))
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        logger.log_to_xml(message=f"Running {len(scenarios):,.0f} scenarios from {scenario_file} with seed {seed}",basepath=logger.base_dir,status="INFO")
+        run_sweep(scenarios,output_dir,logger,seed,workers=workers,store=store)
+        logger.log_to_xml(message=f"Finished {len(scenarios):,.0f} scenarios. Results are in {output_dir}",basepath=logger.base_dir,status="SUCCESS")
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Scenario sweep failed. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Scenario sweep failed. Terminating program. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Run every scenario in a JSON/TOML/YAML scenario file through the batch engine")
+    parser.add_argument("scenario_file")
+    parser.add_argument("--output-dir",default="sweep")
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--workers",type=int,default=1)
+    parser.add_argument("--store",action="store_true",help="Also keep every round of every scenario, one result store partition per scenario")
+    args:argparse.Namespace = parser.parse_args()
+    main(args.scenario_file,output_dir=args.output_dir,seed=args.seed,workers=args.workers,store=args.store)
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import shutil
+import socket
+import argparse
+import traceback
+import numpy as np
+from datetime import datetime
+from xml_logging import XML_Logger
+from state_model import State_Model
+from parallel_simulation import DEFAULT_BLOCK_SIZE,run_parallel
+from result_store import Result_Sink,read_manifest,write_manifest
+CURRENT_DIRECTORY:str = os.getcwd()
+VOTER_FILE:str = "data/Combined_Data.csv"
+PARTY_FILE:str = "data/Baseline_Popularity.csv"
+PLAN_NAME:str = "plan.json"
+SEGMENT_NAME:str = "segment.json"
+DEFAULT_SHARD_ROUNDS:int = 50_000
+DEFAULT_LEASE_SECONDS:float = 120.0
+# How often a host with nothing to claim checks for finished segments and released or expired leases
+LEASE_POLL_SECONDS:float = 1.0
+
+# Queue directory layout, shared by every host:
+#   plan.json                  seed, round count, shard size, output layout and the hash of the inputs
+#   leases/shard_NNNNNN.json   held by whoever is simulating the shard, until expires_at
+#   segments/shard_NNNNNN/     a finished shard: a result store plus segment.json with its seed and round range
+# Shards are whole blocks of parallel_simulation, so every round gets the same block seed it would get in a single-host
+# run and the merged results are identical to one.
+
+def owner_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def shard_name(index:int) -> str:
+    return f"shard_{index:06d}"
+
+def read_plan(queue_dir:str) -> dict:
+    with open(os.path.join(queue_dir,PLAN_NAME),'r') as file:
+        return json.load(file)
+
+def _write_json(path:str,data:dict) -> None:
+    temp_path:str = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path,'w') as file:
+        json.dump(data,file,indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path,path)
+
+def init_queue(queue_dir:str,max_round:int,seed:int,shard_rounds:int=DEFAULT_SHARD_ROUNDS,compact:bool=True,year:int=2028) -> dict:
+    from input_cache import input_key
+    if shard_rounds%DEFAULT_BLOCK_SIZE != 0:
+        raise ValueError(f"shard_rounds must be a multiple of the block size {DEFAULT_BLOCK_SIZE}")
+    if os.path.exists(os.path.join(queue_dir,PLAN_NAME)):
+        raise ValueError(f"{queue_dir} already holds a plan")
+    for name in ("leases","segments"):
+        os.makedirs(os.path.join(queue_dir,name),exist_ok=True)
+    shards:list[dict] = [{"name": shard_name(index),"first_round": start,"last_round": min(start+shard_rounds-1,max_round)} for index,start in enumerate(range(1,max_round+1,shard_rounds))]
+    plan:dict = {"seed": seed,"max_round": max_round,"shard_rounds": shard_rounds,"compact": compact,"year": year,"input_key": input_key(VOTER_FILE,PARTY_FILE,year),"shards": shards}
+    _write_json(os.path.join(queue_dir,PLAN_NAME),plan)
+    return plan
+
+def try_lease(queue_dir:str,shard:dict,owner:str,lease_seconds:float) -> bool:
+    path:str = os.path.join(queue_dir,"leases",f"{shard['name']}.json")
+    for attempt in range(2):
+        try:
+            # O_EXCL makes creating the lease file the atomic claim; only one host can succeed
+            descriptor:int = os.open(path,os.O_CREAT|os.O_EXCL|os.O_WRONLY)
+        except FileExistsError:
+            if attempt == 1 or not lease_expired(path,lease_seconds):
+                return False
+            try:
+                # Of several hosts reclaiming the same expired lease, only the one whose rename succeeds retries
+                stale_path:str = f"{path}.expired.{owner.replace(':','_')}"
+                os.rename(path,stale_path)
+                os.remove(stale_path)
+            except FileNotFoundError:
+                return False
+            continue
+        with os.fdopen(descriptor,'w') as file:
+            json.dump({"owner": owner,"acquired_at": time.time(),"expires_at": time.time()+lease_seconds},file)
+        return True
+    return False
+
+def lease_expired(path:str,lease_seconds:float) -> bool:
+    try:
+        with open(path,'r') as file:
+            lease:dict = json.load(file)
+        return lease["expires_at"] < time.time()
+    except FileNotFoundError:
+        return False
+    except (ValueError,KeyError):
+        # A lease caught mid-write is only treated as abandoned once it is older than a whole lease
+        return os.path.getmtime(path)+lease_seconds < time.time()
+
+def lease_expires_at(path:str,lease_seconds:float) -> float:
+    # A released lease counts as expired now; one caught mid-write expires a whole lease after it was last written
+    try:
+        with open(path,'r') as file:
+            return float(json.load(file)["expires_at"])
+    except FileNotFoundError:
+        return time.time()
+    except (ValueError,KeyError):
+        return os.path.getmtime(path)+lease_seconds
+
+def renew_lease(queue_dir:str,shard:dict,owner:str,lease_seconds:float) -> bool:
+    # Returns False if the lease expired and another host took the shard over
+    path:str = os.path.join(queue_dir,"leases",f"{shard['name']}.json")
+    try:
+        with open(path,'r') as file:
+            lease:dict = json.load(file)
+    except (FileNotFoundError,ValueError):
+        return False
+    if lease.get("owner") != owner:
+        return False
+    lease["expires_at"] = time.time()+lease_seconds
+    _write_json(path,lease)
+    return True
+
+def release_lease(queue_dir:str,shard:dict,owner:str) -> None:
+    path:str = os.path.join(queue_dir,"leases",f"{shard['name']}.json")
+    try:
+        with open(path,'r') as file:
+            if json.load(file).get("owner") == owner:
+                os.remove(path)
+    except (FileNotFoundError,ValueError):
+        pass
+
+def segment_done(queue_dir:str,shard:dict) -> bool:
+    return os.path.exists(os.path.join(queue_dir,"segments",shard["name"],SEGMENT_NAME))
+
+def run_shard(queue_dir:str,plan:dict,shard:dict,state_model:State_Model,owner:str,lease_seconds:float,workers:int,logger:XML_Logger) -> bool:
+    # Written under a private name and renamed into place when complete, so segments/ only ever holds finished shards
+    segment_dir:str = os.path.join(queue_dir,"segments",shard["name"])
+    temp_dir:str = os.path.join(queue_dir,"segments",f".{shard['name']}.{owner.replace(':','_')}")
+    sink:Result_Sink = Result_Sink(temp_dir,state_model.states,state_model.electoral,compact=plan["compact"])
+    for batch in run_parallel(state_model.registered,state_model.baseline,state_model.electoral,shard["last_round"],plan["seed"],workers=workers,first_round=shard["first_round"]):
+        sink.append_batch(batch)
+        if not renew_lease(queue_dir,shard,owner,lease_seconds):
+            logger.log_to_xml(message=f"Lost the lease on {shard['name']} to another host. Abandoning it.",basepath=logger.base_dir,status="WARN")
+            shutil.rmtree(temp_dir,ignore_errors=True)
+            return False
+    sink.close()
+    _write_json(os.path.join(temp_dir,SEGMENT_NAME),{
+            **shard,
+            "seed": plan["seed"],
+            "rounds": shard["last_round"]-shard["first_round"]+1,
+            "input_key": plan["input_key"],
+            "owner": owner,
+            "finished_at": datetime.now().isoformat()
+        })
+    try:
+        os.rename(temp_dir,segment_dir)
+    except OSError:
+        # Another host finished the same shard after taking over an expired lease; its copy is identical
+        shutil.rmtree(temp_dir,ignore_errors=True)
+        return False
+    return True
+
+def work(queue_dir:str,logger:XML_Logger,workers:int=1,lease_seconds:float=DEFAULT_LEASE_SECONDS,max_shards:int|None=None) -> int:
+    from input_cache import load_cached_state_model,input_key
+    plan:dict = read_plan(queue_dir)
+    if input_key(VOTER_FILE,PARTY_FILE,plan["year"]) != plan["input_key"]:
+        raise ValueError(f"Input files on {socket.gethostname()} differ from the ones {queue_dir} was planned with")
+    state_model,_ = load_cached_state_model(VOTER_FILE,PARTY_FILE,year=plan["year"],cache_root=os.path.join(CURRENT_DIRECTORY,"cache","inputs"))
+    owner:str = owner_name()
+    finished:int = 0
+    waiting:bool = False
+    while True:
+        pending:list[dict] = [shard for shard in plan["shards"] if not segment_done(queue_dir,shard)]
+        if not pending:
+            break
+        claimed:bool = False
+        for shard in pending:
+            if max_shards is not None and finished >= max_shards:
+                return finished
+            if segment_done(queue_dir,shard) or not try_lease(queue_dir,shard,owner,lease_seconds):
+                continue
+            claimed = True
+            waiting = False
+            try:
+                if segment_done(queue_dir,shard):
+                    continue
+                if run_shard(queue_dir,plan,shard,state_model,owner,lease_seconds,workers,logger):
+                    finished += 1
+                    logger.log_to_xml(message=f"{owner} finished {shard['name']} (rounds {shard['first_round']:,.0f}-{shard['last_round']:,.0f})",basepath=logger.base_dir,status="INFO")
+                    print(f"{owner} finished {shard['name']} (rounds {shard['first_round']:,.0f}-{shard['last_round']:,.0f}) at {datetime.now()}")
+            finally:
+                release_lease(queue_dir,shard,owner)
+        if not claimed:
+            # Every unfinished shard is leased by another host. Wait until the earliest lease runs out, so a dead host's
+            # shard is taken over, polling meanwhile for segments and leases that live hosts finish or release
+            wait:float = min(lease_expires_at(os.path.join(queue_dir,"leases",f"{shard['name']}.json"),lease_seconds) for shard in pending)-time.time()
+            if wait > 0:
+                if not waiting:
+                    logger.log_to_xml(message=f"{owner} waiting up to {wait:,.1f}s for {len(pending)} shards leased by other hosts",basepath=logger.base_dir,status="INFO")
+                    waiting = True
+                time.sleep(min(wait,LEASE_POLL_SECONDS))
+    return finished
+
+def check_segments(queue_dir:str) -> tuple[list[dict],dict]:
+    # Every finished segment, in round order, and a report of the rounds that are missing or covered twice
+    plan:dict = read_plan(queue_dir)
+    segments:list[dict] = []
+    segments_dir:str = os.path.join(queue_dir,"segments")
+    for name in sorted(os.listdir(segments_dir)):
+        path:str = os.path.join(segments_dir,name,SEGMENT_NAME)
+        if name.startswith(".") or not os.path.exists(path):
+            continue
+        with open(path,'r') as file:
+            segment:dict = json.load(file)
+        chunks:list[dict] = read_manifest(os.path.join(segments_dir,name))["chunks"]
+        written:list[int] = [round_number for chunk in chunks for round_number in (chunk["first_round"],chunk["last_round"])]
+        # The chunks must hold exactly the range the segment claims, with no gap between them
+        contiguous:bool = all(chunks[index+1]["first_round"]==chunks[index]["last_round"]+1 for index in range(len(chunks)-1))
+        if segment["seed"] != plan["seed"] or segment["input_key"] != plan["input_key"] or not chunks or not contiguous or written[0] != segment["first_round"] or written[-1] != segment["last_round"]:
+            raise ValueError(f"Segment {name} does not match the plan or its own round range")
+        segments.append({**segment,"directory": os.path.join(segments_dir,name)})
+    segments.sort(key=lambda segment: segment["first_round"])
+    coverage:np.ndarray = np.zeros(plan["max_round"]+2,dtype=np.int64)
+    for segment in segments:
+        coverage[segment["first_round"]] += 1
+        coverage[segment["last_round"]+1] -= 1
+    counts:np.ndarray = np.cumsum(coverage)[1:plan["max_round"]+1]
+    report:dict = {
+            "max_round": plan["max_round"],
+            "segments": len(segments),
+            "missing_rounds": _round_ranges(np.flatnonzero(counts==0)+1),
+            "duplicate_rounds": _round_ranges(np.flatnonzero(counts>1)+1)
+        }
+    return segments,report
+
+def _round_ranges(rounds:np.ndarray) -> list[list[int]]:
+    # [[first, last], ...] runs of consecutive rounds
+    if len(rounds) == 0:
+        return []
+    breaks:np.ndarray = np.flatnonzero(np.diff(rounds) != 1)
+    starts:np.ndarray = np.concatenate([[rounds[0]],rounds[breaks+1]])
+    ends:np.ndarray = np.concatenate([rounds[breaks],[rounds[-1]]])
+    return [[int(start),int(end)] for start,end in zip(starts,ends)]
+
+def merge(queue_dir:str,store_dir:str,logger:XML_Logger,export:bool=True,analyze:bool=True,workers:int=1) -> dict:
+    segments,report = check_segments(queue_dir)
+    with open(os.path.join(queue_dir,"merge_report.json"),'w') as file:
+        json.dump(report,file,indent=2)
+    if report["missing_rounds"] or report["duplicate_rounds"]:
+        raise ValueError(f"Cannot merge {queue_dir}: missing rounds {report['missing_rounds']}, duplicate rounds {report['duplicate_rounds']}")
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+    os.makedirs(store_dir)
+    manifest:dict|None = None
+    for segment in segments:
+        segment_manifest:dict = read_manifest(segment["directory"])
+        if manifest is None:
+            manifest = {**segment_manifest,"chunks": []}
+        for chunk in segment_manifest["chunks"]:
+            # Chunks are renumbered into one store; files are hard-linked where the filesystem allows it
+            name:str = f"chunk_{len(manifest['chunks']):06d}"
+            source_dir:str = os.path.join(segment["directory"],chunk["name"])
+            os.makedirs(os.path.join(store_dir,name))
+            for file_name in os.listdir(source_dir):
+                try:
+                    os.link(os.path.join(source_dir,file_name),os.path.join(store_dir,name,file_name))
+                except OSError:
+                    shutil.copy2(os.path.join(source_dir,file_name),os.path.join(store_dir,name,file_name))
+            manifest["chunks"].append({**chunk,"name": name})
+    write_manifest(store_dir,manifest)
+    logger.log_to_xml(message=f"Merged {len(segments)} segments ({report['max_round']:,.0f} rounds) into {store_dir}",basepath=logger.base_dir,status="INFO")
+    if export:
+        from result_store import export_csv
+        export_csv(store_dir)
+    if analyze:
+        from analysis import main as analyze_results
+        os.makedirs("analysis",exist_ok=True)
+        analyze_results(store_dir=store_dir,workers=workers)
+    return report
+
+def _local_worker(queue_dir:str,workers:int,lease_seconds:float) -> int:
+    logger:XML_Logger = XML_Logger("shard_queue_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+    return work(queue_dir,logger,workers=workers,lease_seconds=lease_seconds)
+
+def run_local(queue_dir:str,hosts:int,workers:int=1,lease_seconds:float=DEFAULT_LEASE_SECONDS) -> list[int]:
+    # Stand-in for several hosts: independent processes that only share the queue directory
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=hosts) as executor:
+        return list(executor.map(_local_worker,[queue_dir]*hosts,[workers]*hosts,[lease_seconds]*hosts))
+
+def main(command:str,queue_dir:str="queue",max_round:int=1_000_000,seed:int|None=None,shard_rounds:int=DEFAULT_SHARD_ROUNDS,compact:bool=True,workers:int=1,hosts:int=2,lease_seconds:float=DEFAULT_LEASE_SECONDS,store_dir:str="results",export:bool=True,analyze:bool=True):
+    try:
+        logger:XML_Logger = XML_Logger("shard_queue_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
+        if command == "init":
+            if seed is None:
+                seed = int(np.random.SeedSequence().entropy)
+            plan:dict = init_queue(queue_dir,max_round,seed,shard_rounds=shard_rounds,compact=compact)
+            logger.log_to_xml(message=f"Planned {len(plan['shards'])} shards of {shard_rounds:,.0f} rounds in {queue_dir} with seed {seed}",basepath=logger.base_dir,status="INFO")
+        elif command == "work":
+            finished:int = work(queue_dir,logger,workers=workers,lease_seconds=lease_seconds)
+            logger.log_to_xml(message=f"{owner_name()} finished {finished} shards; every shard has a segment",basepath=logger.base_dir,status="SUCCESS")
+        elif command == "local":
+            finished:list[int] = run_local(queue_dir,hosts,workers=workers,lease_seconds=lease_seconds)
+            logger.log_to_xml(message=f"{hosts} local workers finished {sum(finished)} shards ({finished})",basepath=logger.base_dir,status="SUCCESS")
+        elif command == "merge":
+            merge(queue_dir,store_dir,logger,export=export,analyze=analyze,workers=workers)
+            logger.log_to_xml(message=f"Merged {queue_dir} into {store_dir}",basepath=logger.base_dir,status="SUCCESS")
+    except Exception as e:
+        if('logger' in locals()):
+            logger.log_to_xml(message=f"Sharded run failed. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        else:
+            print(f"Sharded run failed. Terminating program. Official error: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Shard a simulation across hosts that share a queue directory, then merge the segments")
+    parser.add_argument("command",choices=["init","work","local","merge"],help="local runs --hosts worker processes on this machine in place of separate hosts")
+    parser.add_argument("--queue-dir",default="queue")
+    parser.add_argument("--rounds",type=int,default=1_000_000)
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--shard-rounds",type=int,default=DEFAULT_SHARD_ROUNDS)
+    parser.add_argument("--uncompressed",action="store_true",help="init: write segments in the uncompressed column layout")
+    parser.add_argument("--workers",type=int,default=1,help="Processes per host")
+    parser.add_argument("--hosts",type=int,default=2)
+    parser.add_argument("--lease-seconds",type=float,default=DEFAULT_LEASE_SECONDS)
+    parser.add_argument("--store-dir",default="results")
+    parser.add_argument("--no-export",action="store_true",help="merge: skip writing State_Results.csv and National_Results.csv")
+    parser.add_argument("--no-analysis",action="store_true",help="merge: skip the analysis/ outputs")
+    args:argparse.Namespace = parser.parse_args()
+    main(args.command,queue_dir=args.queue_dir,max_round=args.rounds,seed=args.seed,shard_rounds=args.shard_rounds,compact=not args.uncompressed,workers=args.workers,hosts=args.hosts,lease_seconds=args.lease_seconds,store_dir=args.store_dir,export=not args.no_export,analyze=not args.no_analysis)
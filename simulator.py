@@ -1,18 +1,26 @@
 import os
 import re
-import shutil
+import json
 import random
+import argparse
 import traceback
 import numpy as np
 from typing import Generator
 from datetime import datetime
 from xml_logging import XML_Logger
-from pandas import read_csv,DataFrame
+from state_model import State_Model
 from electoral_votes import electoral_votes
+from checkpoint import CHECKPOINT_FILE,read_checkpoint,restore_rng_state,restore_output_offsets,save_run_checkpoint
 CURRENT_DIRECTORY:str = os.getcwd()
+ENGINES:tuple[str,...] = ("scalar","numpy")
+ABSTAIN_RATE:float = 0.02
 
 class State_Election_Simulation:
-    def __init__(self,voter_data:np.ndarray,baseline_popularity_data:np.ndarray,popularity_changes:list[float],turnout:float,current_round:int):
+    def __init__(self,voter_data:np.ndarray,baseline_popularity_data:np.ndarray,popularity_changes:list[float],turnout:float,current_round:int,engine:str="scalar",rng:np.random.Generator|None=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}. Expected one of {ENGINES}")
+        self.engine:str = engine
+        self.rng:np.random.Generator = rng if rng is not None else np.random.default_rng()
         self.current_round:int = current_round
         self.votes_to_cast:int = self._get_number_of_votes_to_cast(voter_data,turnout)
         self.total_votes:int = 0
@@ -99,6 +107,8 @@ class State_Election_Simulation:
             self.dem_popularity = 0
 
     def _get_number_of_votes_to_cast(self,voter_data:np.ndarray,turnout:float):
+        if self.engine == "numpy":
+            return int(self.rng.binomial(int(voter_data[1]),turnout))
         total_votes:int = 0
         for _ in range(voter_data[1]):
             is_vote:float = random.random()
@@ -129,9 +139,25 @@ class State_Election_Simulation:
         self.dem_votes += 1
         return 1 # Democrat vote
         
+    def _vote_probabilities(self) -> np.ndarray:
+        # Same thresholds as cast_vote: Republican below rep_popularity, Independent at or above rep+dem, Democrat in between
+        rep_cutoff:float = min(max(self.rep_popularity,0),1)
+        dem_cutoff:float = min(max(self.rep_popularity+self.dem_popularity,rep_cutoff),1)
+        return np.array([rep_cutoff,dem_cutoff-rep_cutoff,1-dem_cutoff])
+
+    def _simulate_election_numpy(self):
+        self.total_votes = int(self.rng.binomial(self.votes_to_cast,1-ABSTAIN_RATE))
+        rep_votes,dem_votes,ind_votes = self.rng.multinomial(self.total_votes,self._vote_probabilities())
+        self.rep_votes = int(rep_votes)
+        self.dem_votes = int(dem_votes)
+        self.ind_votes = int(ind_votes)
+
     def simulate_election(self):
-        for vote in range(self.votes_to_cast):
-            self.cast_vote()
+        if self.engine == "numpy":
+            self._simulate_election_numpy()
+        else:
+            for vote in range(self.votes_to_cast):
+                self.cast_vote()
         self.rep_votes_pct = self.rep_votes/self.total_votes
         self.dem_votes_pct = self.dem_votes/self.total_votes
         self.ind_votes_pct = self.ind_votes/self.total_votes
@@ -153,7 +179,7 @@ class State_Election_Simulation:
         return data
 
 class Federal_Election_Simulation:
-    def __init__(self,state_data:list[State_Election_Simulation],current_round:int,turnout:float):
+    def __init__(self,state_data:list[State_Election_Simulation],current_round:int,turnout:float,electoral:np.ndarray|None=None):
         self.turnout:float = turnout
         self.current_round:int = current_round
         self.total_votes:int = 0
@@ -167,7 +193,7 @@ class Federal_Election_Simulation:
         self.ind_electoral_votes:int = 0
         self.ind_votes_pct:float = 0
         self._get_total_votes(state_data)
-        self._get_electoral_votes(state_data)
+        self._get_electoral_votes(state_data,electoral)
 
     def _get_total_votes(self,state_data:list[State_Election_Simulation]):
         for state in state_data:
@@ -179,10 +205,11 @@ class Federal_Election_Simulation:
         self.dem_votes_pct = self.dem_votes/self.total_votes
         self.ind_votes_pct = self.ind_votes/self.total_votes
     
-    def _get_electoral_votes(self,state_data:list[State_Election_Simulation]):
-        for state in state_data:
+    def _get_electoral_votes(self,state_data:list[State_Election_Simulation],electoral:np.ndarray|None=None):
+        # electoral, when given, is State_Model.electoral aligned with state_data and replaces the per-state name lookup
+        for index,state in enumerate(state_data):
             state_votes:list[int] = [state.rep_votes,state.dem_votes,state.ind_votes]
-            num_electoral_votes:int = electoral_votes[state.state]
+            num_electoral_votes:int = electoral_votes[state.state] if electoral is None else int(electoral[index])
             if max(state_votes)==state_votes[0]:
                 self.rep_electoral_votes += num_electoral_votes
             elif max(state_votes)==state_votes[1]:
@@ -190,8 +217,8 @@ class Federal_Election_Simulation:
             else:
                 self.ind_electoral_votes += num_electoral_votes
 
-    def save_to_csv(self):
-        data:dict[str,int|float] = {
+    def results(self) -> dict[str,list[int|float]]:
+        return {
                 "Round": [self.current_round],
                 "Turnout Percent": [self.turnout],
                 "Total Votes": [self.total_votes],
@@ -205,7 +232,10 @@ class Federal_Election_Simulation:
                 "Independent Electoral Votes": [self.ind_electoral_votes],
                 "Independent Vote Percent": [self.ind_votes_pct]
             }
-        DataFrame(data).to_csv(
+
+    def save_to_csv(self):
+        from pandas import DataFrame
+        DataFrame(self.results()).to_csv(
                                 "National_Results.csv", 
                                 mode="w" if self.current_round==1 else "a", 
                                 encoding='utf-8', 
@@ -214,23 +244,6 @@ class Federal_Election_Simulation:
                                 float_format='{:,.4f}'.format
                                )
 
-def get_voter_data(file_name:str,logger:XML_Logger,year:int) -> np.ndarray|None:
-    try:
-        df:DataFrame = read_csv(file_name)
-        df:DataFrame = df[df["Year"]==year]
-        return df.to_numpy()
-    except Exception as e:
-        logger.log_to_xml(message=f"Failed to get data from {file_name}. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
-        return None
-    
-def get_party_popularity_data(file_name:str,logger:XML_Logger) -> np.ndarray|None:
-    try:
-        df:DataFrame = read_csv(file_name)
-        return df.to_numpy()
-    except Exception as e:
-        logger.log_to_xml(message=f"Failed to get data from {file_name}. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
-        return None
-
 def get_popularity_changes() -> list[float]:
     net_rep_change:float = 0
     net_dem_change:float = 0
@@ -256,59 +269,320 @@ def get_popularity_changes() -> list[float]:
 
     return [net_rep_change,net_dem_change,net_ind_change]
 
-def copy_simulated_data() -> None:
+def simulate_states(voter_data, party_popularity_data, changes, turnout, current_round, engine="scalar", rng=None) -> Generator[State_Election_Simulation, None, None]:
+    for state_voter_data, state_party_data in zip(voter_data, party_popularity_data):
+        state_sim = State_Election_Simulation(state_voter_data, state_party_data, changes, turnout, current_round, engine=engine, rng=rng)
+        state_sim.simulate_election()
+        yield state_sim
+
+def simulate_in_batches(state_model:State_Model,max_round:int,seed:int,logger:XML_Logger,workers:int=1,sink=None,start_round:int=1,on_checkpoint=None,aggregator=None,progress=None,monitor=None,input_dir:str|None=None,timer=None,round_profiler=None,swing_model=None) -> int:
+    # Returns the last round simulated, so the caller can write the final checkpoint
+    from batch_simulation import state_results_frame,national_results_frame
+    from parallel_simulation import DEFAULT_BLOCK_SIZE,run_parallel
+    from instrumentation import Null_Timer
+    timer = timer or Null_Timer()
+    states,registered,baseline,electoral = state_model.states,state_model.registered,state_model.baseline,state_model.electoral
+    batches = run_parallel(registered,baseline,electoral,max_round,seed,workers=workers,first_round=start_round,input_dir=input_dir,swing_model=swing_model)
+    while True:
+        if round_profiler is not None:
+            round_profiler.before_round(start_round,min(((start_round-1)//DEFAULT_BLOCK_SIZE+1)*DEFAULT_BLOCK_SIZE,max_round))
+        # The popularity draw, state simulation and federal totals all happen inside a block, so the batch engine
+        # times the block as one stage; with workers it is the wait for the next finished block
+        with timer.stage("block_simulation"):
+            batch = next(batches,None)
+        if batch is None:
+            break
+        first_round:int = int(batch.rounds[0])
+        last_round:int = int(batch.rounds[-1])
+        start_round = last_round+1
+        if progress is not None:
+            progress.update(last_round)
+        else:
+            logger.log_to_xml(message=f"Simulated election rounds {first_round:,.0f}-{last_round:,.0f}/{max_round:,.0f}",basepath=logger.base_dir,status="INFO")
+            print(f"Simulated election rounds {first_round:,.0f}-{last_round:,.0f}/{max_round:,.0f} at {datetime.now()}")
+        if aggregator is not None:
+            with timer.stage("aggregation"):
+                aggregator.update_batch(batch)
+        with timer.stage("result_write"):
+            if sink is not None:
+                sink.append_batch(batch)
+            else:
+                try:
+                    state_results_frame(batch,states,electoral).to_csv("State_Results.csv",mode="w" if first_round==1 else "a",encoding='utf-8',index=False,header=first_round==1,float_format='{:,.4f}'.format)
+                    national_results_frame(batch).to_csv("National_Results.csv",mode="w" if first_round==1 else "a",encoding='utf-8',index=False,header=first_round==1,float_format='{:,.4f}'.format)
+                except Exception as e:
+                    logger.log_to_xml(message=f"Failed to save results for rounds {first_round}-{last_round}. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
+        if on_checkpoint is not None:
+            with timer.stage("checkpoint"):
+                on_checkpoint(last_round)
+        if round_profiler is not None:
+            round_profiler.after_round(last_round)
+        timer.round_done(len(batch.rounds))
+        if monitor is not None:
+            with timer.stage("convergence"):
+                monitor.update_batch(batch)
+            if monitor.converged():
+                break
+    return start_round-1
+
+def load_cached_inputs(logger:XML_Logger,voter_file:str="data/Combined_Data.csv",party_file:str="data/Baseline_Popularity.csv",year:int=2028) -> tuple[State_Model,str]|None:
+    from input_cache import load_cached_state_model
     try:
-        if os.path.exists("State_Results - Copy.csv"):
-            os.remove("State_Results - Copy.csv")
-        shutil.copyfile("State_Results.csv","State_Results - Copy.csv")
-    except:
-        pass
+        return load_cached_state_model(voter_file,party_file,year=year,cache_root=os.path.join(CURRENT_DIRECTORY,"cache","inputs"))
+    except Exception as e:
+        logger.log_to_xml(message=f"Failed to load state inputs. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        return None
+
+def per_round_inputs(state_model:State_Model,year:int) -> tuple[np.ndarray,np.ndarray]:
+    # The rows State_Election_Simulation reads (state, registered voters, ..., year and state, rep, dem, ind), rebuilt from
+    # the cached arrays so the per-round engines start without parsing the CSVs
+    voter_data:np.ndarray = np.empty((len(state_model),3),dtype=object)
+    voter_data[:,0] = state_model.states
+    voter_data[:,1] = [int(registered) for registered in state_model.registered]
+    voter_data[:,2] = year
+    party_popularity_data:np.ndarray = np.empty((len(state_model),4),dtype=object)
+    party_popularity_data[:,0] = state_model.states
+    party_popularity_data[:,1:] = state_model.baseline.tolist()
+    return voter_data,party_popularity_data
 
+def load_swing_model(path:str,state_model:State_Model,logger:XML_Logger):
+    from regional_swing import read_swing_model
     try:
-        if os.path.exists("National_Results - Copy.csv"):
-            os.remove("National_Results - Copy.csv")
-        shutil.copyfile("National_Results.csv","National_Results - Copy.csv")
-    except:
-        pass
+        return read_swing_model(path,state_model.states)
+    except Exception as e:
+        logger.log_to_xml(message=f"Failed to load swing model {path}. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
+        return None
 
-def simulate_states(voter_data, party_popularity_data, changes, turnout, current_round) -> Generator[State_Election_Simulation, None, None]:
-    for state_voter_data, state_party_data in zip(voter_data, party_popularity_data):
-        state_sim = State_Election_Simulation(state_voter_data, state_party_data, changes, turnout, current_round)
-        state_sim.simulate_election()
-        yield state_sim
+def open_result_sink(state_model:State_Model,store_dir:str,overwrite:bool=True,compact:bool=False):
+    from result_store import Result_Sink
+    return Result_Sink(store_dir,state_model.states,state_model.electoral,overwrite=overwrite,compact=compact)
+
+def aggregate_path(checkpoint_path:str) -> str:
+    return f"{os.path.splitext(checkpoint_path)[0]}_aggregate.npz"
+
+def open_aggregator(state_model:State_Model,path:str,logger:XML_Logger,last_round:int|None=None):
+    # last_round is the resumed checkpoint's. The totals must cover exactly the rounds up to it: the latest save can be
+    # one checkpoint ahead after a crash, in which case the save before it is the matching one.
+    from online_aggregator import Online_Aggregator,previous_path
+    if last_round is None:
+        return Online_Aggregator(state_model.states)
+    for candidate in (path,previous_path(path)):
+        if os.path.exists(candidate):
+            aggregator:Online_Aggregator = Online_Aggregator.load(candidate)
+            if aggregator.last_round == last_round:
+                return aggregator
+    logger.log_to_xml(message=f"No running totals at {path} match the checkpoint at round {last_round:,.0f}. Resume without --aggregate and analyze the results instead. Terminating program.",basepath=logger.base_dir,status="CRITICAL")
+    return None
+
+def open_convergence_monitor(state_model:State_Model,probability_tolerance:float,electoral_tolerance:float):
+    from convergence import Convergence_Monitor
+    return Convergence_Monitor(state_model.electoral,probability_tolerance=probability_tolerance,electoral_tolerance=electoral_tolerance)
+
+def report_convergence(monitor,logger:XML_Logger,report_path:str="convergence_report.json") -> None:
+    report:dict = monitor.report()
+    with open(os.path.join(CURRENT_DIRECTORY,report_path),'w') as file:
+        json.dump(report,file,indent=2)
+    precision:str = ", ".join(f"{name} +/-{value:.4f}" for name,value in report["achieved_half_width"].items())
+    message:str = f"{'Converged' if report['converged'] else 'Did not converge'} after {report['rounds']:,.0f} rounds at {report['confidence']:.0%} confidence: {precision}"
+    logger.log_to_xml(message=message,basepath=logger.base_dir,status="SUCCESS" if report["converged"] else "WARN")
+    print(message)
 
-def main():
+def open_stage_timer(metrics_path:str|None,every_seconds:float,output:str,store_dir:str):
+    from instrumentation import Stage_Timer,Null_Timer
+    if metrics_path is None:
+        return Null_Timer()
+    output_paths:list[str] = [store_dir] if output in ("store","compact") else ["State_Results.csv","National_Results.csv"]
+    return Stage_Timer(metrics_path,every_seconds=every_seconds,output_paths=output_paths)
+
+def open_round_profiler(profile_rounds:tuple[int,int]|None,profile_path:str,profiler:str):
+    from instrumentation import Round_Profiler
+    if profile_rounds is None:
+        return None
+    return Round_Profiler(profile_rounds[0],profile_rounds[1],profile_path,profiler=profiler)
+
+def main(engine:str="numpy",seed:int|None=None,workers:int=1,output:str="csv",store_dir:str="results",max_round:int=1_000_000,resume:bool=False,checkpoint_path:str=CHECKPOINT_FILE,checkpoint_every:int=25,aggregate:bool=False,log_mode:str="sync",progress_every_rounds:int|None=None,progress_every_seconds:float|None=10.0,stop_on_convergence:bool=False,probability_tolerance:float=0.005,electoral_tolerance:float=0.5,metrics_path:str|None=None,metrics_every_seconds:float=30.0,profile_rounds:tuple[int,int]|None=None,profile_path:str="simulator_profile.pstats",profiler:str="cprofile",swing_model_path:str|None=None,voter_file:str="data/Combined_Data.csv",party_file:str="data/Baseline_Popularity.csv",year:int=2028):
     logger:XML_Logger = XML_Logger("simulator_logger","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
-    voter_data:np.ndarray = get_voter_data(file_name="data/Combined_Data.csv",logger=logger,year=2028)
-    party_popularity_data:np.ndarray = get_party_popularity_data(file_name="data/Baseline_Popularity.csv",logger=logger)
-    max_round:int = 1_000_000
-
-    for current_round in range(1,max_round+1):
-        logger.log_to_xml(message=f"Beginning election round {current_round:,.0f}/{max_round:,.0f}",basepath=logger.base_dir,status="INFO")
-        print(f"Beginning election round {current_round:,.0f}/{max_round:,.0f} at {datetime.now()}")
-
-        popularity_changes:list[float] = get_popularity_changes()
-        turnout:float = random.uniform(0.6,0.9)
-
-        state_elections = list(simulate_states(voter_data, party_popularity_data, popularity_changes, turnout, current_round))
-        state_results = [state_sim.save_to_csv() for state_sim in state_elections]
-        try:
-            DataFrame.from_records(state_results).to_csv(
-                                    "State_Results.csv", 
-                                    mode="w" if current_round==1 else "a", 
-                                    encoding='utf-8', 
-                                    index=False, 
-                                    header=True if current_round==1 else False,
-                                    float_format='{:,.4f}'.format
-                                )
-        except Exception as e:
-            logger.log_to_xml(message=f"Failed to save state results on round {current_round}. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
-        federal_election:Federal_Election_Simulation = Federal_Election_Simulation(state_elections,current_round=current_round,turnout=turnout)
-        federal_election.save_to_csv()
-        if current_round%25 == 0:
-            copy_simulated_data()
+    # metrics_path turns on per-stage timing; profile_rounds additionally profiles an inclusive window of rounds
+    timer = open_stage_timer(metrics_path,metrics_every_seconds,output,store_dir)
+    round_profiler = open_round_profiler(profile_rounds,profile_path,profiler)
+    first_round:int = 1
+    checkpoint:dict|None = read_checkpoint(checkpoint_path) if resume else None
+    if resume and checkpoint is None:
+        logger.log_to_xml(message=f"No checkpoint found at {checkpoint_path}. Starting a new run.",basepath=logger.base_dir,status="WARN")
+    if checkpoint is not None:
+        # A resumed run keeps the settings it was started with
+        seed,engine,output = checkpoint["seed"],checkpoint["engine"],checkpoint["output"]
+        first_round = checkpoint["last_round"]+1
+        logger.log_to_xml(message=f"Resuming {engine} run with seed {seed} at round {first_round:,.0f}",basepath=logger.base_dir,status="INFO")
+    # Every engine starts from the typed arrays, which are cached on disk keyed by the input file hashes
+    with timer.stage("input_load"):
+        loaded:tuple[State_Model,str]|None = load_cached_inputs(logger,voter_file,party_file,year)
+    if loaded is None:
+        return
+    state_model,input_dir = loaded
+    if engine == "batch":
+        # swing_model_path adds correlated per-state swings (see regional_swing.py) to the national swing
+        swing_model = load_swing_model(swing_model_path,state_model,logger) if swing_model_path is not None else None
+        if swing_model_path is not None and swing_model is None:
+            return
+    else:
+        if swing_model_path is not None:
+            logger.log_to_xml(message=f"Correlated state swings are only supported by the batch engine, not {engine}. Terminating program.",basepath=logger.base_dir,status="CRITICAL")
+            return
+        # Rows already aligned by state name; the per-round engines zip them together
+        voter_data,party_popularity_data = per_round_inputs(state_model,year)
+    # aggregate=True keeps running analysis totals so the analysis/ outputs never need a re-read of the results
+    aggregator = open_aggregator(state_model,aggregate_path(checkpoint_path),logger,last_round=first_round-1 if checkpoint is not None else None) if aggregate else None
+    if aggregate and aggregator is None:
+        return
+    # output="store" buffers results into the columnar store in result_store.py instead of appending CSV rows every round
+    # output="compact" writes only compressed vote counts and derives the other columns when the store is read
+    sink = open_result_sink(state_model,store_dir,overwrite=checkpoint is None,compact=output=="compact") if output in ("store","compact") else None
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+    logger.log_to_xml(message=f"Simulation master seed {seed}",basepath=logger.base_dir,status="INFO")
+    progress = None
+    if log_mode == "async":
+        # Per-round INFO logs and prints are replaced by rate-limited progress summaries on a writer thread
+        from async_logging import Async_XML_Logger,Progress_Reporter
+        logger = Async_XML_Logger(logger)
+        progress = Progress_Reporter(logger,max_round,start_round=first_round,every_rounds=progress_every_rounds,every_seconds=progress_every_seconds)
+    random.seed(seed)
+    rng:np.random.Generator = np.random.default_rng(seed)
+    if checkpoint is not None:
+        restore_rng_state(rng,checkpoint["rng_state"])
+        restore_output_offsets(checkpoint["offsets"],sink)
+    # A new run replaces its outputs (the store is cleared above, the CSVs are rewritten from round 1), so everything in
+    # them at the end was written by it; a resumed run counts from its outputs cut back to the checkpoint
+    timer.reset_output_bytes(0 if checkpoint is None else None)
+
+    # With stop_on_convergence, max_round is only an upper bound. After a resume the monitor counts rounds since the
+    # resume, which can only widen its intervals, so it never stops early on the strength of rounds it has not seen.
+    monitor = open_convergence_monitor(state_model,probability_tolerance,electoral_tolerance) if stop_on_convergence else None
+
+    def on_checkpoint(last_round:int,final:bool=False) -> None:
+        # A store checkpoint records whole chunks, so between flushes it waits for the sink to write its buffer rather
+        # than forcing out a small chunk every checkpoint_every rounds
+        if sink is not None and sink.buffered_rounds > 0 and not final:
+            return
+        if aggregator is not None:
+            aggregator.save(aggregate_path(checkpoint_path),last_round)
+        save_run_checkpoint(checkpoint_path,seed,engine,output,last_round,len(state_model),rng,sink)
+
+    if engine == "batch":
+        last_round:int = simulate_in_batches(state_model,max_round,seed,logger,workers=workers,sink=sink,start_round=first_round,on_checkpoint=on_checkpoint,aggregator=aggregator,progress=progress,monitor=monitor,input_dir=input_dir,timer=timer,round_profiler=round_profiler,swing_model=swing_model)
+        with timer.stage("checkpoint"):
+            on_checkpoint(last_round,final=True)
+        if round_profiler is not None:
+            round_profiler.close()
+        if sink is not None:
+            sink.close()
+        timer.close()
+        if monitor is not None:
+            report_convergence(monitor,logger)
+        if aggregator is not None:
+            aggregator.emit()
+        logger.save_variable_info(locals_dict=locals(),variable_save_path=os.path.join(CURRENT_DIRECTORY,'simulator_variables.json'))
+        if progress is not None:
+            logger.close()
+        return
 
+    last_round:int = first_round-1
+    for current_round in range(first_round,max_round+1):
+        if progress is None:
+            logger.log_to_xml(message=f"Beginning election round {current_round:,.0f}/{max_round:,.0f}",basepath=logger.base_dir,status="INFO")
+            print(f"Beginning election round {current_round:,.0f}/{max_round:,.0f} at {datetime.now()}")
+
+        if round_profiler is not None:
+            round_profiler.before_round(current_round)
+        with timer.stage("popularity_draw"):
+            popularity_changes:list[float] = get_popularity_changes()
+            turnout:float = random.uniform(0.6,0.9)
+
+        with timer.stage("state_simulation"):
+            state_elections = list(simulate_states(voter_data, party_popularity_data, popularity_changes, turnout, current_round, engine=engine, rng=rng))
+            state_results = [state_sim.save_to_csv() for state_sim in state_elections]
+        with timer.stage("federal_aggregation"):
+            federal_election:Federal_Election_Simulation = Federal_Election_Simulation(state_elections,current_round=current_round,turnout=turnout,electoral=state_model.electoral)
+        if aggregator is not None:
+            with timer.stage("aggregation"):
+                aggregator.update_round(state_results,federal_election.results())
+        with timer.stage("result_write"):
+            if sink is not None:
+                sink.append_round(state_results,federal_election.results())
+            else:
+                from pandas import DataFrame
+                try:
+                    DataFrame.from_records(state_results).to_csv(
+                                            "State_Results.csv", 
+                                            mode="w" if current_round==1 else "a", 
+                                            encoding='utf-8', 
+                                            index=False, 
+                                            header=True if current_round==1 else False,
+                                            float_format='{:,.4f}'.format
+                                        )
+                except Exception as e:
+                    logger.log_to_xml(message=f"Failed to save state results on round {current_round}. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
+                federal_election.save_to_csv()
+        # Checkpoints replace the old full-file copies; readers use the row counts they record as a consistent snapshot
+        if current_round%checkpoint_every == 0:
+            with timer.stage("checkpoint"):
+                on_checkpoint(current_round)
+        if round_profiler is not None:
+            round_profiler.after_round(current_round)
+        timer.round_done()
+        last_round = current_round
+        if progress is not None:
+            progress.update(current_round)
+        if monitor is not None:
+            with timer.stage("convergence"):
+                monitor.update_round(state_results,federal_election.results())
+            if monitor.converged():
+                break
+    # Covers the rounds after the last periodic checkpoint, which readers of the checkpoint would otherwise skip
+    with timer.stage("checkpoint"):
+        on_checkpoint(last_round,final=True)
+
+    if round_profiler is not None:
+        round_profiler.close()
+    if sink is not None:
+        sink.close()
+    timer.close()
+    if aggregator is not None:
+        aggregator.emit()
+    if monitor is not None:
+        report_convergence(monitor,logger)
     logger.save_variable_info(locals_dict=locals(),variable_save_path=os.path.join(CURRENT_DIRECTORY,'simulator_variables.json'))
+    if progress is not None:
+        logger.close()
+
+def add_arguments(parser:argparse.ArgumentParser) -> None:
+    # Shared with the simulate subcommand of cli.py
+    parser.add_argument("--engine",choices=[*ENGINES,"batch"],default="numpy")
+    parser.add_argument("--seed",type=int,default=None)
+    parser.add_argument("--workers",type=int,default=1)
+    parser.add_argument("--output",choices=["csv","store","compact"],default="csv")
+    parser.add_argument("--store-dir",default="results")
+    parser.add_argument("--rounds",type=int,default=1_000_000)
+    parser.add_argument("--resume",action="store_true",help="Continue from the last checkpoint instead of starting over")
+    parser.add_argument("--aggregate",action="store_true",help="Keep running analysis totals and write analysis/ at the end of the run")
+    parser.add_argument("--log-mode",choices=["sync","async"],default="sync",help="async logs WARN and above per round and reports progress every --progress-seconds")
+    parser.add_argument("--progress-seconds",type=float,default=10.0)
+    parser.add_argument("--stop-on-convergence",action="store_true",help="Stop once every tracked estimate is within tolerance; --rounds becomes an upper bound")
+    parser.add_argument("--probability-tolerance",type=float,default=0.005,help="Confidence interval half-width for win probabilities and state win rates")
+    parser.add_argument("--electoral-tolerance",type=float,default=0.5,help="Confidence interval half-width for expected electoral votes")
+    parser.add_argument("--metrics",default=None,help="Append per-stage timing summaries (JSON lines) here and keep the latest as a Prometheus .prom file beside it")
+    parser.add_argument("--metrics-seconds",type=float,default=30.0)
+    parser.add_argument("--profile-rounds",type=int,nargs=2,default=None,metavar=("FIRST","LAST"),help="Profile rounds FIRST-LAST inclusive")
+    parser.add_argument("--profile-path",default="simulator_profile.pstats")
+    parser.add_argument("--profiler",choices=["cprofile","sampling"],default="cprofile",help="sampling writes collapsed stacks instead of pstats")
+    parser.add_argument("--swing-model",default=None,help="JSON covariance spec for correlated per-state swings (batch engine only)")
+    parser.add_argument("--voter-file",default="data/Combined_Data.csv")
+    parser.add_argument("--party-file",default="data/Baseline_Popularity.csv")
+    parser.add_argument("--year",type=int,default=2028)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description="Monte Carlo simulation of the presidential election")
+    add_arguments(parser)
+    args:argparse.Namespace = parser.parse_args()
+    main(engine=args.engine,seed=args.seed,workers=args.workers,output=args.output,store_dir=args.store_dir,max_round=args.rounds,resume=args.resume,aggregate=args.aggregate,log_mode=args.log_mode,progress_every_seconds=args.progress_seconds,stop_on_convergence=args.stop_on_convergence,probability_tolerance=args.probability_tolerance,electoral_tolerance=args.electoral_tolerance,metrics_path=args.metrics,metrics_every_seconds=args.metrics_seconds,profile_rounds=args.profile_rounds,profile_path=args.profile_path,profiler=args.profiler,swing_model_path=args.swing_model,voter_file=args.voter_file,party_file=args.party_file,year=args.year)
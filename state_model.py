@@ -0,0 +1,59 @@
+import os
+import numpy as np
+from electoral_votes import electoral_votes
+MODEL_ARRAYS:tuple[str,...] = ("states","registered","baseline","electoral","party_rows")
+
+def state_key(state:str) -> str:
+    # Baseline_Popularity.csv is written with str.capitalize ("New hampshire"), Combined_Data.csv in title case
+    return " ".join(str(state).split()).casefold()
+
+class State_Model:
+    # Typed, index-aligned inputs for every state, built once per run. Row i of every array is states[i].
+    def __init__(self,states:np.ndarray,registered:np.ndarray,baseline:np.ndarray,electoral:np.ndarray,party_rows:np.ndarray):
+        self.states:np.ndarray = states
+        self.registered:np.ndarray = np.ascontiguousarray(registered,dtype=np.int64)
+        self.baseline:np.ndarray = np.ascontiguousarray(baseline,dtype=np.float64)
+        self.electoral:np.ndarray = np.ascontiguousarray(electoral,dtype=np.int64)
+        # Row of the popularity data for each state, so the object arrays can be realigned for the per-round engines
+        self.party_rows:np.ndarray = party_rows
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @classmethod
+    def from_data(cls,voter_data:np.ndarray,party_popularity_data:np.ndarray,electoral_map:dict[str,int]=electoral_votes) -> "State_Model":
+        voter_keys:list[str] = [state_key(state) for state in voter_data[:,0]]
+        party_keys:list[str] = [state_key(state) for state in party_popularity_data[:,0]]
+        electoral_keys:dict[str,int] = {state_key(state):votes for state,votes in electoral_map.items()}
+        problems:list[str] = []
+        for name,keys in (("voter data",voter_keys),("popularity data",party_keys)):
+            duplicates:list[str] = sorted({key for key in keys if keys.count(key) > 1})
+            if duplicates:
+                problems.append(f"duplicate states in {name}: {duplicates}")
+        for name,keys in (("voter data",set(voter_keys)),("popularity data",set(party_keys)),("electoral_votes.py",set(electoral_keys))):
+            missing:list[str] = sorted((set(voter_keys)|set(party_keys)|set(electoral_keys))-keys)
+            if missing:
+                problems.append(f"missing from {name}: {missing}")
+        if problems:
+            raise ValueError("State inputs do not line up; "+"; ".join(problems))
+
+        party_index:dict[str,int] = {key:row for row,key in enumerate(party_keys)}
+        party_rows:np.ndarray = np.array([party_index[key] for key in voter_keys],dtype=np.int64)
+        return cls(
+                states=voter_data[:,0].astype(str),
+                registered=voter_data[:,1].astype(np.int64),
+                baseline=party_popularity_data[party_rows,1:4].astype(np.float64),
+                electoral=np.array([electoral_keys[key] for key in voter_keys],dtype=np.int64),
+                party_rows=party_rows
+            )
+
+    def save(self,directory:str) -> None:
+        os.makedirs(directory,exist_ok=True)
+        for name in MODEL_ARRAYS:
+            np.save(os.path.join(directory,f"{name}.npy"),getattr(self,name))
+
+    @classmethod
+    def load(cls,directory:str,mmap:bool=True) -> "State_Model":
+        # Memory-mapped by default so every worker process shares the same pages instead of its own copy
+        arrays:dict[str,np.ndarray] = {name:np.load(os.path.join(directory,f"{name}.npy"),mmap_mode="r" if mmap else None) for name in MODEL_ARRAYS}
+        return cls(**arrays)
@@ -0,0 +1,16 @@
+import os
+import sys
+import shutil
+import pytest
+# The modules live at the repository root rather than in a package
+REPO_DIRECTORY:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIRECTORY)
+
+@pytest.fixture
+def run_dir(tmp_path,monkeypatch):
+    # A scratch working directory holding a copy of data/, the layout the simulator expects to run in
+    shutil.copytree(os.path.join(REPO_DIRECTORY,"data"),tmp_path/"data")
+    monkeypatch.chdir(tmp_path)
+    import simulator
+    monkeypatch.setattr(simulator,"CURRENT_DIRECTORY",str(tmp_path))
+    return tmp_path
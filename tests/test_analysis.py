@@ -0,0 +1,44 @@
+import io
+import os
+import pytest
+import simulator
+import analysis
+from pandas import read_csv,DataFrame
+
+ANALYSIS_FILES:tuple[str,...] = ("National_Results_Means.csv","National_Results_Means.html","Republican_Popular_Democrat_Electoral.html","Democrat_Popular_Republican_Electoral.html","State_Results_Means.csv","State_Results_Means.html","State_Winners.html")
+
+def _analysis_outputs() -> dict[str,bytes]:
+    return {name: open(os.path.join("analysis",name),'rb').read() for name in ANALYSIS_FILES}
+
+def _analyze(workers:int,part_bytes:int) -> dict[str,bytes]:
+    analysis.analyze_national_data(workers=workers,part_bytes=part_bytes)
+    analysis.analyze_state_data(workers=workers,part_bytes=part_bytes)
+    return _analysis_outputs()
+
+def test_chunked_analysis_matches_a_whole_file_read(run_dir):
+    simulator.main(engine="numpy",seed=5,max_round=40)
+    os.makedirs("analysis")
+    whole:dict[str,bytes] = _analyze(workers=1,part_bytes=analysis.DEFAULT_PART_BYTES)
+    chunked:dict[str,bytes] = _analyze(workers=2,part_bytes=4096)
+    # The per-part state sums are combined in the parent rather than summed in file order, which can move the last digit
+    assert {name: data for name,data in chunked.items() if not name.startswith("State_Results_Means")} == {name: data for name,data in whole.items() if not name.startswith("State_Results_Means")}
+    chunked_means:DataFrame = read_csv(io.BytesIO(chunked["State_Results_Means.csv"]))
+    whole_means:DataFrame = read_csv(io.BytesIO(whole["State_Results_Means.csv"]))
+    assert (chunked_means["State"] == whole_means["State"]).all()
+    assert chunked_means.drop(columns="State").to_numpy() == pytest.approx(whole_means.drop(columns="State").to_numpy(),rel=1e-14)
+    # The means are the ones the single read_csv of the whole file gives
+    df:DataFrame = read_csv("State_Results.csv")
+    df_states_mean:DataFrame = df.groupby("State").mean(numeric_only=True)
+    df_states_mean.insert(0,"State",sorted(df["State"].unique()))
+    assert df_states_mean.drop(["Round","Electoral Votes"],axis=1).to_csv(index=False).encode() == whole["State_Results_Means.csv"]
+    df = read_csv("National_Results.csv")
+    assert DataFrame(df.mean()).T.drop("Round",axis=1).to_csv(index=False).encode() == whole["National_Results_Means.csv"]
+
+@pytest.mark.parametrize("contents",["","Round,Republican Votes\n"])
+def test_empty_results_are_skipped(run_dir,contents):
+    os.makedirs("analysis")
+    for name in ("National_Results.csv","State_Results.csv"):
+        with open(name,'w') as file:
+            file.write(contents)
+    analysis.main(checkpoint_path="missing_checkpoint.json")
+    assert os.listdir("analysis") == []
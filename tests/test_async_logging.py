@@ -0,0 +1,24 @@
+import threading
+from async_logging import Async_XML_Logger
+
+class Failing_Logger:
+    def __init__(self):
+        self.base_dir:str = "."
+        self.written:list[str] = []
+
+    def log_to_xml(self,message:str,basepath:str,status:str="INFO") -> None:
+        if message == "bad":
+            raise OSError("disk full")
+        self.written.append(message)
+
+def test_writer_survives_a_failing_logger(capsys):
+    wrapped:Failing_Logger = Failing_Logger()
+    logger:Async_XML_Logger = Async_XML_Logger(wrapped,min_status="INFO",flush_interval=0.05)
+    for message in ("first","bad","second","third"):
+        logger.log_to_xml(message=message,basepath=".",status="WARN")
+    closer:threading.Thread = threading.Thread(target=logger.close)
+    closer.start()
+    closer.join(timeout=10)
+    assert not closer.is_alive()
+    assert wrapped.written == ["first","second","third"]
+    assert "disk full" in capsys.readouterr().err
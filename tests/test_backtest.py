@@ -0,0 +1,54 @@
+import os
+import json
+import pytest
+import numpy as np
+import backtest
+import party_popularity_history
+from pandas import read_csv,DataFrame
+FIXTURE_PAGES:str = os.path.join(os.path.dirname(os.path.abspath(__file__)),"fixtures","270towin")
+FIXTURE_STATES:tuple[str,...] = ("district-of-columbia","ohio","texas")
+
+@pytest.fixture
+def historical(run_dir,monkeypatch):
+    # A synthetic Historical_Results.csv: every state of the baseline, with seeded swings around it in each election
+    monkeypatch.setattr(backtest,"CURRENT_DIRECTORY",str(run_dir))
+    baseline:DataFrame = read_csv("data/Baseline_Popularity.csv")
+    rng:np.random.Generator = np.random.default_rng(0)
+    rows:list[dict] = []
+    for year in range(2000,2025,4):
+        swing:np.ndarray = rng.normal(0,0.03,len(baseline))
+        rows.extend({"State": state,"Year": year,"Republican": round(rep+change,3),"Democrat": round(dem-change,3)} for state,rep,dem,change in zip(baseline["State"],baseline["Republican"],baseline["Democrat"],swing))
+    DataFrame(rows).to_csv("results.csv",index=False)
+    return run_dir
+
+def test_backtest_scores_every_year(historical):
+    backtest.main(years=(2016,2020,2024),rounds=2000,seed=7,results_file="results.csv",output_dir="scored")
+    with open(os.path.join("scored",backtest.BACKTEST_MANIFEST),'r') as file:
+        manifest:dict = json.load(file)
+    assert manifest["years"] == [2016,2020,2024]
+    assert set(manifest["scores"]) >= set(backtest.OBJECTIVES)
+    states:DataFrame = read_csv(os.path.join("scored","Backtest_States.csv"))
+    assert len(states) == 3*51
+    assert len(read_csv(os.path.join("scored","Backtest_Years.csv"))) == 3
+
+def test_calibration_is_the_same_on_any_number_of_workers(historical):
+    with open("grid.json",'w') as file:
+        json.dump({"swing_scale": [0.5,1.0],"turnout_range": [[0.55,0.75],[0.6,0.9]]},file)
+    for workers in (1,2):
+        backtest.main(calibrate_parameters=True,calibration_file="grid.json",rounds=1000,seed=7,workers=workers,results_file="results.csv",output_dir=f"calibrated_{workers}")
+    first:bytes = open(os.path.join("calibrated_1","Calibration.csv"),'rb').read()
+    assert first == open(os.path.join("calibrated_2","Calibration.csv"),'rb').read()
+    assert len(read_csv(os.path.join("calibrated_1","Calibration.csv"))) == 4
+
+def test_missing_results_file_is_reported(historical):
+    with pytest.raises(FileNotFoundError,match="scrape-baseline"):
+        backtest.read_historical_results("missing.csv")
+
+def test_incomplete_scrape_keeps_the_existing_results(historical,monkeypatch):
+    monkeypatch.setattr(party_popularity_history,"CURRENT_DIRECTORY",str(historical))
+    before:bytes = open("results.csv",'rb').read()
+    parse = party_popularity_history.past_election_results
+    monkeypatch.setattr(party_popularity_history,"past_election_results",lambda state,logger,html_content: None if state=="texas" else parse(state=state,logger=logger,html_content=html_content))
+    party_popularity_history.main(replay=True,cache_dir=FIXTURE_PAGES,output_file="baseline.csv",results_file="results.csv",states=FIXTURE_STATES)
+    assert open("results.csv",'rb').read() == before
+    assert not os.path.exists("results.csv.tmp")
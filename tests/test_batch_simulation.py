@@ -0,0 +1,70 @@
+import random
+import itertools
+import pytest
+import numpy as np
+from simulator import State_Election_Simulation,Federal_Election_Simulation,get_popularity_changes,simulate_states
+from batch_simulation import adjust_party_popularity,simulate_batch
+
+POPULARITY_GRID:tuple[float,...] = (-0.3,-0.05,0.0,0.2,0.6)
+
+def _scalar_state(state:str,registered:int,baseline:tuple[float,float,float],popularity_changes:list[float],turnout:float) -> State_Election_Simulation:
+    voter_data:np.ndarray = np.array([state,registered,2028],dtype=object)
+    baseline_popularity_data:np.ndarray = np.array([state,*baseline],dtype=object)
+    return State_Election_Simulation(voter_data,baseline_popularity_data,popularity_changes,turnout,current_round=1,engine="scalar")
+
+def test_adjusted_popularity_matches_the_scalar_engine():
+    # Every sign combination of the three popularities, so each branch of _adjusted_party_popularity is taken
+    grid:list[tuple[float,float,float]] = list(itertools.product(POPULARITY_GRID,repeat=3))
+    rep,dem,ind = adjust_party_popularity(*(np.array(column) for column in zip(*grid)))
+    for index,popularity in enumerate(grid):
+        # No registered voters, so building the scalar state casts no votes
+        state:State_Election_Simulation = _scalar_state("Ohio",0,popularity,[0,0,0],0.7)
+        assert (rep[index],dem[index],ind[index]) == pytest.approx((state.rep_popularity,state.dem_popularity,state.ind_popularity))
+
+def test_batch_vote_shares_match_the_scalar_engine():
+    registered:np.ndarray = np.array([3000,3000,3000])
+    # The second state's Independent popularity goes negative and is redistributed
+    baseline:np.ndarray = np.array([[0.45,0.45,0.10],[0.60,0.38,0.02],[0.30,0.55,0.15]])
+    popularity_changes:list[float] = [0.05,-0.02,-0.03]
+    turnout:float = 0.7
+    n_rounds:int = 50
+    random.seed(11)
+    scalar:np.ndarray = np.zeros((n_rounds,len(registered),4))
+    for round_index in range(n_rounds):
+        for state_index,state_baseline in enumerate(baseline):
+            state:State_Election_Simulation = _scalar_state(f"State {state_index}",int(registered[state_index]),tuple(state_baseline),popularity_changes,turnout)
+            state.simulate_election()
+            scalar[round_index,state_index] = (state.total_votes,state.rep_votes,state.dem_votes,state.ind_votes)
+    batch = simulate_batch(registered,baseline,np.array([10,10,10]),np.tile(popularity_changes,(n_rounds,1)),np.full(n_rounds,turnout),np.random.default_rng(11))
+    batched:np.ndarray = np.stack([batch.total_votes,batch.rep_votes,batch.dem_votes,batch.ind_votes],axis=-1)
+    assert batched.shape == scalar.shape
+    assert batched[...,0].mean(axis=0) == pytest.approx(scalar[...,0].mean(axis=0),rel=0.01)
+    for column in (1,2,3):
+        assert (batched[...,column]/batched[...,0]).mean(axis=0) == pytest.approx((scalar[...,column]/scalar[...,0]).mean(axis=0),abs=0.01)
+
+def test_numpy_engine_win_rates_match_the_scalar_engine():
+    voter_data:np.ndarray = np.array([[f"State {index}",1500,2028] for index in range(4)],dtype=object)
+    party_popularity_data:np.ndarray = np.array([["State 0",0.45,0.45,0.10],["State 1",0.48,0.42,0.10],["State 2",0.42,0.48,0.10],["State 3",0.40,0.40,0.20]],dtype=object)
+    electoral:np.ndarray = np.array([10,7,5,3])
+    n_rounds:int = 300
+    random.seed(5)
+    # Both engines see the same national swings and turnout; only the vote sampling differs
+    inputs:list[tuple[list[float],float]] = [(get_popularity_changes(),random.uniform(0.6,0.9)) for _ in range(n_rounds)]
+    rng:np.random.Generator = np.random.default_rng(5)
+    outcomes:dict[str,np.ndarray] = {}
+    for engine in ("scalar","numpy"):
+        electoral_votes:list[tuple[int,int]] = []
+        for current_round,(changes,turnout) in enumerate(inputs,start=1):
+            states:list[State_Election_Simulation] = list(simulate_states(voter_data,party_popularity_data,changes,turnout,current_round,engine=engine,rng=rng))
+            federal:Federal_Election_Simulation = Federal_Election_Simulation(states,current_round=current_round,turnout=turnout,electoral=electoral)
+            electoral_votes.append((federal.rep_electoral_votes,federal.dem_electoral_votes))
+        outcomes[engine] = np.array(electoral_votes)
+    scalar,vectorized = outcomes["scalar"],outcomes["numpy"]
+    for party in (0,1):
+        # Win rates within four standard errors of the difference of two binomial proportions
+        wins:np.ndarray = np.array([(outcome[:,party] > outcome[:,1-party]).mean() for outcome in (scalar,vectorized)])
+        pooled:float = wins.mean()
+        assert 0 < pooled < 1
+        assert abs(wins[0]-wins[1]) <= 4*np.sqrt(pooled*(1-pooled)*2/n_rounds)
+        spread:float = np.concatenate([scalar[:,party],vectorized[:,party]]).std()
+        assert abs(scalar[:,party].mean()-vectorized[:,party].mean()) <= 4*spread*np.sqrt(2/n_rounds)
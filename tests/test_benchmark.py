@@ -0,0 +1,16 @@
+import sys
+import json
+import benchmark
+
+def test_writes_and_compares_a_json_report(run_dir,monkeypatch,capsys):
+    arguments:list[str] = ["benchmark.py","--benchmarks","federal","batch","--sizes","20","--workers","1","2"]
+    monkeypatch.setattr(sys,"argv",arguments+["--output","baseline.json"])
+    benchmark.main()
+    with open("baseline.json",'r') as file:
+        report:dict = json.load(file)
+    assert [(result["benchmark"],result["rounds"],result["workers"]) for result in report["results"]] == [("federal",20,1),("batch",20,1),("batch",20,2)]
+    assert all(result["seconds"] > 0 and result["peak_rss_kb"] > 0 for result in report["results"])
+    capsys.readouterr()
+    monkeypatch.setattr(sys,"argv",arguments+["--output","current.json","--compare","baseline.json"])
+    benchmark.main()
+    assert capsys.readouterr().out.count("speedup") == 3
@@ -0,0 +1,65 @@
+import os
+import simulator
+from checkpoint import read_checkpoint
+from result_store import read_manifest
+
+def test_final_checkpoint_covers_rounds_after_the_last_periodic_one(run_dir):
+    simulator.main(engine="numpy",seed=3,max_round=60,checkpoint_every=25)
+    checkpoint:dict = read_checkpoint("simulator_checkpoint.json")
+    assert checkpoint["last_round"] == 60
+    assert checkpoint["offsets"]["csv_bytes"] == {name: os.path.getsize(name) for name in ("State_Results.csv","National_Results.csv")}
+
+def test_store_checkpoints_do_not_split_chunks(run_dir):
+    simulator.main(engine="numpy",seed=3,max_round=60,checkpoint_every=25,output="compact")
+    chunks:list[dict] = read_manifest("results")["chunks"]
+    assert [chunk["rounds"] for chunk in chunks] == [60]
+    assert read_checkpoint("simulator_checkpoint.json")["offsets"] == {"store_chunks": 1}
+
+def test_resume_matches_an_uninterrupted_run(run_dir):
+    simulator.main(engine="numpy",seed=3,max_round=50,checkpoint_every=25)
+    simulator.main(engine="numpy",max_round=80,checkpoint_every=25,resume=True)
+    resumed:dict[str,bytes] = {name: open(name,'rb').read() for name in ("State_Results.csv","National_Results.csv")}
+    simulator.main(engine="numpy",seed=3,max_round=80,checkpoint_every=25)
+    for name,data in resumed.items():
+        assert open(name,'rb').read() == data
+
+def test_resume_continues_the_matching_running_totals(run_dir):
+    from online_aggregator import Online_Aggregator
+    os.makedirs("analysis")
+    simulator.main(engine="numpy",seed=3,max_round=80,checkpoint_every=25,aggregate=True)
+    uninterrupted:Online_Aggregator = Online_Aggregator.load("simulator_checkpoint_aggregate.npz")
+    simulator.main(engine="numpy",seed=3,max_round=50,checkpoint_every=25,aggregate=True)
+    saved_at_50:dict[str,bytes] = {name: open(name,'rb').read() for name in ("simulator_checkpoint.json","simulator_checkpoint_aggregate.npz")}
+    simulator.main(engine="numpy",max_round=75,checkpoint_every=25,resume=True,aggregate=True)
+    # The state a crash after saving the totals for round 75, but before writing that checkpoint, leaves behind
+    for name,path in (("simulator_checkpoint.json","simulator_checkpoint.json"),("simulator_checkpoint_aggregate.npz","simulator_checkpoint_aggregate_previous.npz")):
+        with open(path,'wb') as file:
+            file.write(saved_at_50[name])
+    simulator.main(engine="numpy",max_round=80,checkpoint_every=25,resume=True,aggregate=True)
+    resumed:Online_Aggregator = Online_Aggregator.load("simulator_checkpoint_aggregate.npz")
+    assert resumed.last_round == 80 and resumed.rounds == 80
+    assert (resumed.national.mean == uninterrupted.national.mean).all()
+    assert (resumed.winner_counts == uninterrupted.winner_counts).all()
+
+def test_resume_refuses_totals_that_do_not_match_the_checkpoint(run_dir):
+    os.makedirs("analysis")
+    simulator.main(engine="numpy",seed=3,max_round=50,checkpoint_every=25,aggregate=True)
+    os.remove("simulator_checkpoint_aggregate_previous.npz")
+    os.rename("simulator_checkpoint_aggregate.npz","stale_aggregate.npz")
+    simulator.main(engine="numpy",seed=3,max_round=30,checkpoint_every=25,aggregate=True)
+    os.replace("stale_aggregate.npz","simulator_checkpoint_aggregate.npz")
+    os.remove("simulator_checkpoint_aggregate_previous.npz")
+    simulator.main(engine="numpy",max_round=60,checkpoint_every=25,resume=True,aggregate=True)
+    assert read_checkpoint("simulator_checkpoint.json")["last_round"] == 30
+
+def test_batch_resume_after_a_run_that_ended_mid_block(run_dir):
+    from result_store import read_table
+    simulator.main(engine="batch",seed=3,max_round=15_000,output="compact")
+    assert read_checkpoint("simulator_checkpoint.json")["last_round"] == 15_000
+    simulator.main(engine="batch",max_round=25_000,resume=True)
+    assert read_checkpoint("simulator_checkpoint.json")["last_round"] == 25_000
+    simulator.main(engine="batch",seed=3,max_round=25_000,output="compact",store_dir="uninterrupted")
+    for table in ("state","national"):
+        resumed:dict = read_table("results",table)
+        uninterrupted:dict = read_table("uninterrupted",table)
+        assert all(resumed[name].tobytes() == column.tobytes() for name,column in uninterrupted.items())
@@ -0,0 +1,42 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+import simulator
+import cli
+from conftest import REPO_DIRECTORY
+
+def _run_cli(argv:list[str],cwd) -> dict:
+    # A fresh interpreter, so sys.modules shows only what this command imported
+    script:str = f"import sys,json,cli; cli.main({argv!r}); print(json.dumps(sorted(name for name in cli.HEAVY_MODULES if name in sys.modules)))"
+    environment:dict[str,str] = {**os.environ,"PYTHONPATH": os.pathsep.join([REPO_DIRECTORY,*sys.path])}
+    completed:subprocess.CompletedProcess = subprocess.run([sys.executable,"-c",script],cwd=cwd,env=environment,capture_output=True,text=True,check=True)
+    lines:list[str] = completed.stdout.strip().splitlines()
+    return {"loaded": json.loads(lines[-1]),"timings": [line for line in lines if ": import " in line or "heavy packages" in line]}
+
+def _options(parser:argparse.ArgumentParser) -> dict:
+    return {action.option_strings[0]: (action.dest,action.default,action.choices,action.type,action.nargs) for action in parser._actions if action.option_strings and action.dest != "help"}
+
+def test_simulate_subcommand_matches_the_simulator_options():
+    expected:argparse.ArgumentParser = argparse.ArgumentParser()
+    simulator.add_arguments(expected)
+    subparsers = next(action for action in cli.build_parser()._actions if isinstance(action,argparse._SubParsersAction))
+    assert _options(subparsers.choices["simulate"]) == _options(expected)
+
+def test_building_the_parser_imports_no_heavy_packages(tmp_path):
+    script:str = "import sys,cli; cli.build_parser().parse_args(['simulate']); print(sorted(name for name in cli.HEAVY_MODULES if name in sys.modules))"
+    environment:dict[str,str] = {**os.environ,"PYTHONPATH": os.pathsep.join([REPO_DIRECTORY,*sys.path])}
+    completed:subprocess.CompletedProcess = subprocess.run([sys.executable,"-c",script],cwd=tmp_path,env=environment,capture_output=True,text=True,check=True)
+    assert completed.stdout.strip() == "[]"
+
+def test_analyze_loads_only_what_it_needs_and_reports_timings(run_dir):
+    _run_cli(["simulate","--engine","batch","--rounds","200","--seed","5"],run_dir)
+    result:dict = _run_cli(["--timings","analyze","--workers","1"],run_dir)
+    # analysis needs numpy and pandas, but none of the scraping stack
+    assert result["loaded"] == ["numpy","pandas"]
+    assert len(result["timings"]) == 2
+    assert result["timings"][0].startswith("analyze: import analysis ")
+    assert result["timings"][1] == "analyze: heavy packages loaded: numpy, pandas"
+    assert os.path.exists(os.path.join("analysis","National_Results_Means.csv"))
+    assert os.path.exists(os.path.join("analysis","State_Results_Means.csv"))
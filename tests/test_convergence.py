@@ -0,0 +1,37 @@
+import pytest
+import numpy as np
+from pandas import DataFrame
+from online_aggregator import Running_Moments
+from convergence import Convergence_Monitor,wilson_half_width
+
+def test_batched_moments_match_a_pandas_reduction():
+    values:np.ndarray = np.random.default_rng(0).normal(300,40,size=(1_000,3))
+    moments:Running_Moments = Running_Moments((3,))
+    # Uneven batches, including a single row, exercise Chan et al.'s merge
+    for start,end in ((0,1),(1,250),(250,251),(251,900),(900,1_000)):
+        moments.update(values[start:end])
+    df:DataFrame = DataFrame(values)
+    assert moments.count == 1_000
+    assert moments.mean == pytest.approx(df.mean().to_numpy(),rel=1e-12)
+    assert moments.variance == pytest.approx(df.var().to_numpy(),rel=1e-12)
+
+def test_wilson_half_width_at_the_edges():
+    # At p = 0 or 1 the interval is z^2/(2(n+z^2)) wide rather than collapsing to zero
+    assert wilson_half_width(np.array([0,100]),100,1.96) == pytest.approx([1.96**2/(2*(100+1.96**2))]*2)
+    assert wilson_half_width(np.array([50]),100,1.96)[0] == pytest.approx(1.96/(1+1.96**2/100)*np.sqrt(0.25/100+1.96**2/(4*100**2)))
+    assert np.isinf(wilson_half_width(np.array([0]),0,1.96)).all()
+
+def test_stops_once_every_interval_is_within_tolerance():
+    monitor:Convergence_Monitor = Convergence_Monitor(np.array([3,3,3]),probability_tolerance=0.005,min_rounds=100)
+    # Republicans win every state every round, so only the Wilson width of a certain outcome remains; it drops to
+    # 0.005 between 380 and 381 rounds
+    party_electoral_votes:np.ndarray = np.array([[9,0,0]])
+    winner_codes:np.ndarray = np.zeros((1,3),dtype=np.int64)
+    stopped_at:int|None = None
+    for current_round in range(1,1_000):
+        monitor.update(party_electoral_votes,winner_codes)
+        if monitor.converged():
+            stopped_at = current_round
+            break
+    assert stopped_at == 381
+    assert monitor.report()["national_win_probability"]["Republican"] == 1.0
@@ -0,0 +1,27 @@
+import itertools
+import numpy as np
+import electoral_distribution
+from batch_simulation import simulate_rounds
+from input_cache import load_cached_state_model
+
+def test_convolution_matches_enumerating_every_outcome():
+    electoral:np.ndarray = np.array([3,5,5,9])
+    win_probabilities:np.ndarray = np.array([[0.2,0.5,0.9,0.35],[1.0,0.0,0.5,0.5]])
+    distribution:np.ndarray = electoral_distribution.convolve_electoral_votes(win_probabilities,electoral)
+    expected:np.ndarray = np.zeros_like(distribution)
+    for outcome in itertools.product((0,1),repeat=len(electoral)):
+        won:np.ndarray = np.array(outcome,dtype=bool)
+        expected[:,electoral[won].sum()] += np.prod(np.where(won,win_probabilities,1-win_probabilities),axis=1)
+    assert np.allclose(distribution,expected,rtol=0,atol=1e-15)
+
+def test_lattice_distribution_matches_monte_carlo(run_dir):
+    state_model = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root="cache")[0]
+    report:dict = electoral_distribution.electoral_distribution(state_model,resolution=0.004).report()
+    rounds:int = 40_000
+    batches:list = list(simulate_rounds(state_model.registered,state_model.baseline,state_model.electoral,rounds,np.random.default_rng(3)))
+    for party,attribute in (("Republican","rep_electoral_votes"),("Democrat","dem_electoral_votes")):
+        electoral_votes:np.ndarray = np.concatenate([getattr(batch,attribute) for batch in batches])
+        win_rate:float = float((electoral_votes >= report["majority"]).mean())
+        # Four Monte Carlo standard errors, plus a small allowance for the lattice and normal approximations
+        assert abs(report["national_win_probability"][party]-win_rate) <= 4*np.sqrt(win_rate*(1-win_rate)/rounds)+0.005
+        assert abs(report["expected_electoral_votes"][party]-electoral_votes.mean()) <= 4*electoral_votes.std()/np.sqrt(rounds)+0.5
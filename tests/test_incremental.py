@@ -0,0 +1,68 @@
+import os
+import pytest
+import incremental
+from xml_logging import XML_Logger
+from input_cache import load_cached_state_model
+from result_store import read_manifest,read_national_results,read_state_results
+
+def _load_model(party_file:str="data/Baseline_Popularity.csv"):
+    return load_cached_state_model("data/Combined_Data.csv",party_file,year=2028,cache_root="cache")[0]
+
+def _edited_party_file() -> str:
+    # Ohio and Texas move a few points toward the Democrats
+    with open("data/Baseline_Popularity.csv",'r') as file:
+        lines:list[str] = file.read().splitlines()
+    for index,line in enumerate(lines):
+        state,rep,dem,ind = line.split(",")
+        if state in ("Ohio","Texas"):
+            lines[index] = f"{state},{float(rep)-0.04},{float(dem)+0.04},{ind}"
+    with open("data/Edited_Popularity.csv",'w') as file:
+        file.write("\n".join(lines)+"\n")
+    return "data/Edited_Popularity.csv"
+
+def _results(store_dir:str) -> tuple:
+    return read_national_results(store_dir),read_state_results(store_dir)
+
+@pytest.fixture
+def logger(run_dir):
+    return XML_Logger("incremental_logger","archive",log_retention_days=7,base_dir=str(run_dir))
+
+@pytest.mark.parametrize("compact",[True,False])
+def test_update_matches_a_full_rerun(logger,compact):
+    incremental.run_crn(_load_model(),"before",250,seed=11,logger=logger,block_size=100,compact=compact)
+    edited = _load_model(_edited_party_file())
+    incremental.run_crn(edited,"rerun",250,seed=11,logger=logger,block_size=100,compact=compact)
+    assert incremental.update_crn(edited,"before",logger,output_dir="after") == ["Ohio","Texas"]
+    expected:tuple = _results("rerun")
+    national,state = _results("after")
+    assert national.equals(expected[0]) and state.equals(expected[1])
+    incremental.update_crn(edited,"before",logger)
+    national,state = _results("before")
+    assert national.equals(expected[0]) and state.equals(expected[1])
+    assert sorted(entry for entry in os.listdir("before") if entry.startswith("chunk_")) == ["chunk_000000_r0001","chunk_000001_r0001","chunk_000002_r0001"]
+
+def test_interrupted_update_leaves_the_store_unchanged(logger,monkeypatch):
+    incremental.run_crn(_load_model(),"before",250,seed=11,logger=logger,block_size=100)
+    original:tuple = _results("before")
+    manifest:dict = read_manifest("before")
+    edited = _load_model(_edited_party_file())
+    patch_chunk = incremental.patch_chunk
+    calls:list[int] = []
+    def crash_on_second_chunk(*args,**kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        patch_chunk(*args,**kwargs)
+    monkeypatch.setattr(incremental,"patch_chunk",crash_on_second_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        incremental.update_crn(edited,"before",logger)
+    assert read_manifest("before") == manifest
+    national,state = _results("before")
+    assert national.equals(original[0]) and state.equals(original[1])
+    monkeypatch.setattr(incremental,"patch_chunk",patch_chunk)
+    incremental.run_crn(edited,"rerun",250,seed=11,logger=logger,block_size=100)
+    incremental.update_crn(edited,"before",logger)
+    national,state = _results("before")
+    expected:tuple = _results("rerun")
+    assert national.equals(expected[0]) and state.equals(expected[1])
+    assert len([entry for entry in os.listdir("before") if entry.startswith("chunk_")]) == 3
@@ -0,0 +1,33 @@
+import os
+import time
+from input_cache import load_cached_state_model,prune_cache
+
+def test_entries_for_other_inputs_survive_a_miss(run_dir):
+    _,first = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root="cache")
+    _,second = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2024,cache_root="cache")
+    assert first != second
+    assert os.path.exists(os.path.join(first,"meta.json")) and os.path.exists(os.path.join(second,"meta.json"))
+
+def test_prune_keeps_recent_and_recently_used_entries(run_dir):
+    os.makedirs("cache")
+    day:float = 24*3600
+    for index in range(6):
+        os.makedirs(os.path.join("cache",f"entry_{index}"))
+        meta:str = os.path.join("cache",f"entry_{index}","meta.json")
+        open(meta,'w').close()
+        # entry_0 was used longest ago; entry_4 and entry_5 within the last day
+        used_at:float = time.time()-(6-index)*day+1.5*day
+        os.utime(meta,(used_at,used_at))
+    os.makedirs(os.path.join("cache","crashed.tmp123"))
+    os.utime(os.path.join("cache","crashed.tmp123"),(time.time()-2*day,time.time()-2*day))
+    # entry_4 is beyond the one entry kept, but too recently used to remove
+    removed:list[str] = prune_cache("cache",keep=1)
+    assert sorted(os.path.basename(path) for path in removed) == ["crashed.tmp123","entry_0","entry_1","entry_2","entry_3"]
+    assert prune_cache("cache",keep=0) == []
+
+def test_a_hit_counts_as_a_use(run_dir):
+    _,entry = load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root="cache")
+    meta:str = os.path.join(entry,"meta.json")
+    os.utime(meta,(0,0))
+    load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root="cache")
+    assert os.path.getmtime(meta) > time.time()-60
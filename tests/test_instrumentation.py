@@ -0,0 +1,41 @@
+import os
+import json
+import simulator
+
+CSV_FILES:tuple[str,...] = ("State_Results.csv","National_Results.csv")
+
+def _last_bytes_written(metrics_path:str) -> int:
+    with open(metrics_path,'r') as file:
+        return json.loads(file.readlines()[-1])["bytes_written"]
+
+def test_bytes_written_ignores_the_previous_run(run_dir):
+    simulator.main(engine="numpy",seed=1,max_round=40)
+    simulator.main(engine="numpy",seed=1,max_round=10,metrics_path="metrics.jsonl")
+    assert _last_bytes_written("metrics.jsonl") == sum(os.path.getsize(name) for name in CSV_FILES)
+
+def test_bytes_written_after_resume_counts_only_new_rounds(run_dir):
+    simulator.main(engine="numpy",seed=1,max_round=50,checkpoint_every=25)
+    checkpointed:int = sum(os.path.getsize(name) for name in CSV_FILES)
+    simulator.main(engine="numpy",max_round=70,checkpoint_every=25,resume=True,metrics_path="metrics.jsonl")
+    assert _last_bytes_written("metrics.jsonl") == sum(os.path.getsize(name) for name in CSV_FILES)-checkpointed
+
+def test_bytes_written_for_a_replaced_store(run_dir):
+    simulator.main(engine="batch",seed=1,max_round=400,output="store")
+    simulator.main(engine="batch",seed=1,max_round=100,output="store",metrics_path="metrics.jsonl")
+    store_bytes:int = sum(os.path.getsize(os.path.join(root,name)) for root,_,names in os.walk("results") for name in names)
+    assert _last_bytes_written("metrics.jsonl") == store_bytes
+
+def test_profile_window_inside_one_block(run_dir):
+    from instrumentation import Round_Profiler
+    profiler:Round_Profiler = Round_Profiler(12_000,13_000,"window.pstats")
+    profiler.before_round(1,10_000)
+    assert not profiler.active
+    profiler.after_round(10_000)
+    profiler.before_round(10_001,20_000)
+    assert profiler.active
+    profiler.after_round(20_000)
+    assert profiler.done and os.path.exists("window.pstats")
+    profiler.before_round(20_001,30_000)
+    assert not profiler.active
+    simulator.main(engine="batch",seed=1,max_round=15_000,output="compact",profile_rounds=(12_000,13_000),profile_path="run.pstats")
+    assert os.path.exists("run.pstats")
@@ -0,0 +1,12 @@
+import simulator
+
+CSV_FILES:tuple[str,...] = ("State_Results.csv","National_Results.csv")
+
+def test_batch_results_do_not_depend_on_workers(run_dir):
+    # Two blocks, the second one partial
+    simulator.main(engine="batch",seed=21,max_round=10_050,workers=1)
+    single:dict[str,bytes] = {name: open(name,'rb').read() for name in CSV_FILES}
+    assert single["National_Results.csv"].count(b"\n") == 10_051
+    simulator.main(engine="batch",seed=21,max_round=10_050,workers=2)
+    for name,data in single.items():
+        assert open(name,'rb').read() == data
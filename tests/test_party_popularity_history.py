@@ -0,0 +1,32 @@
+import os
+import csv
+import pytest
+import party_popularity_history
+FIXTURE_PAGES:str = os.path.join(os.path.dirname(os.path.abspath(__file__)),"fixtures","270towin")
+FIXTURE_STATES:tuple[str,...] = ("district-of-columbia","ohio","texas")
+
+@pytest.fixture
+def scrape_dir(tmp_path,monkeypatch):
+    monkeypatch.setattr(party_popularity_history,"CURRENT_DIRECTORY",str(tmp_path))
+    return tmp_path
+
+def read_rows(path) -> list[list[str]]:
+    with open(path,newline='') as file:
+        return list(csv.reader(file))
+
+def test_replay_rebuilds_the_baseline_from_cached_pages(scrape_dir):
+    party_popularity_history.main(replay=True,cache_dir=FIXTURE_PAGES,output_file=str(scrape_dir/"baseline.csv"),results_file=str(scrape_dir/"results.csv"),states=FIXTURE_STATES)
+    baseline:list[list[str]] = read_rows(scrape_dir/"baseline.csv")
+    assert baseline[0] == ["State","Republican","Democrat","Independent"]
+    assert [row[0] for row in baseline[1:]] == ["District of columbia","Ohio","Texas"]
+    ohio:list[float] = [float(value) for value in baseline[2][1:]]
+    assert ohio == pytest.approx([0.5091666667,0.4726666667,0.0181666667],abs=1e-9)
+    results:list[list[str]] = read_rows(scrape_dir/"results.csv")
+    assert results[0] == ["State","Year","Republican","Democrat"]
+    assert ["Texas","2020","0.521","0.465"] in results
+
+def test_replay_with_a_missing_page_writes_nothing(scrape_dir):
+    (scrape_dir/"baseline.csv").write_text("previous\n")
+    party_popularity_history.main(replay=True,cache_dir=FIXTURE_PAGES,output_file=str(scrape_dir/"baseline.csv"),results_file=str(scrape_dir/"results.csv"),states=(*FIXTURE_STATES,"iowa"))
+    assert (scrape_dir/"baseline.csv").read_text() == "previous\n"
+    assert not (scrape_dir/"results.csv").exists()
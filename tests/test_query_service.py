@@ -0,0 +1,50 @@
+import json
+import threading
+import urllib.request
+import urllib.error
+import pytest
+from http.server import ThreadingHTTPServer
+from xml_logging import XML_Logger
+from query_service import MAX_QUERY_ROUNDS,Query_Service,make_handler
+
+@pytest.fixture
+def service(run_dir):
+    service:Query_Service = Query_Service(rounds=200,block_size=100)
+    yield service
+    service.close()
+
+@pytest.mark.parametrize("parameters",[
+        [],
+        {"rounds": 0},
+        {"rounds": MAX_QUERY_ROUNDS+1},
+        {"rounds": "100"},
+        {"rounds": True},
+        {"seed": -1},
+        {"year": "2028"},
+        {"turnout_range": [0.5]},
+        {"turnout_range": 0.5},
+        {"swing_ranges": {"rep_to_dem": [0.1]}},
+        {"baseline_shifts": {"Ohio": 0.1}},
+        {"baseline_overrides": {"Ohio": {"Republican": "0.5"}}},
+        {"baseline_shifts": ["Ohio"]}
+    ])
+def test_malformed_queries_raise_value_error(service,parameters):
+    with pytest.raises(ValueError):
+        service.query(parameters)
+
+def test_malformed_query_is_answered_with_400(service):
+    logger:XML_Logger = XML_Logger("query_service_logger","archive",log_retention_days=7,base_dir=".")
+    server:ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1",0),make_handler(service,logger))
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    url:str = f"http://127.0.0.1:{server.server_address[1]}/query"
+    try:
+        for body,status in (({"baseline_shifts": {"Ohio": 0.1}},400),({"turnout_range": [0.5]},400),({"rounds": 100},200)):
+            request:urllib.request.Request = urllib.request.Request(url,data=json.dumps(body).encode(),method="POST")
+            try:
+                with urllib.request.urlopen(request) as response:
+                    assert response.status == status
+            except urllib.error.HTTPError as e:
+                assert e.code == status
+    finally:
+        server.shutdown()
+        server.server_close()
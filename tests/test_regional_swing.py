@@ -0,0 +1,28 @@
+import pytest
+import numpy as np
+from regional_swing import Regional_Swing
+
+STATES:np.ndarray = np.array(["Ohio","Michigan","Texas","Oklahoma"],dtype=object)
+REGIONS:dict[str,list[str]] = {"Midwest": ["Ohio","Michigan"],"South": ["Texas","Oklahoma"]}
+
+def test_draws_reproduce_the_covariance():
+    model:Regional_Swing = Regional_Swing.from_regions(STATES,REGIONS,national_sd=0.01,regional_sd=0.03,state_sd=0.02)
+    expected:np.ndarray = 0.01**2+0.03**2*np.kron(np.eye(2),np.ones((2,2)))+0.02**2*np.eye(4)
+    assert model.covariance == pytest.approx(expected)
+    shifts:np.ndarray = model.draw(np.random.default_rng(0),200_000)
+    assert shifts.shape == (200_000,4)
+    # Shifts stay far inside max_shift, so the clipping does not bias the sample covariance
+    assert np.cov(shifts,rowvar=False) == pytest.approx(expected,abs=2e-5)
+
+def test_covariance_rows_follow_the_listed_states():
+    covariance:np.ndarray = np.diag([1.0,2.0,3.0,4.0])*1e-4
+    model:Regional_Swing = Regional_Swing.from_spec(STATES,{"covariance": covariance.tolist(),"states": ["Oklahoma","Texas","Michigan","Ohio"]})
+    assert np.diag(model.covariance) == pytest.approx([4e-4,3e-4,2e-4,1e-4])
+
+@pytest.mark.parametrize("covariance",[
+        [[1e-4,2e-4,0,0],[2e-4,1e-4,0,0],[0,0,1e-4,0],[0,0,0,1e-4]],
+        [[1e-4,0,0,0],[0,0,0,0],[0,0,1e-4,0],[0,0,0,1e-4]]
+    ])
+def test_rejects_a_covariance_that_is_not_positive_definite(covariance):
+    with pytest.raises(ValueError):
+        Regional_Swing(STATES,np.array(covariance))
@@ -0,0 +1,16 @@
+import pytest
+import simulator
+from result_store import export_csv,read_manifest
+
+CSV_FILES:tuple[str,...] = ("State_Results.csv","National_Results.csv")
+
+@pytest.mark.parametrize("engine",["numpy","batch"])
+@pytest.mark.parametrize("output",["store","compact"])
+def test_store_exports_the_csvs_a_csv_run_writes(run_dir,engine,output):
+    simulator.main(engine=engine,seed=9,max_round=30)
+    written:dict[str,bytes] = {name: open(name,'rb').read() for name in CSV_FILES}
+    simulator.main(engine=engine,seed=9,max_round=30,output=output)
+    assert read_manifest("results")["format"] == ("compact" if output == "compact" else "columns")
+    export_csv("results",state_csv="Exported_State_Results.csv",national_csv="Exported_National_Results.csv")
+    for name,data in written.items():
+        assert open(f"Exported_{name}",'rb').read() == data
@@ -0,0 +1,32 @@
+import sys
+import pytest
+import numpy as np
+import samplers
+from state_model import State_Model
+from input_cache import load_cached_state_model
+
+ROUNDS:int = 20_480
+CHUNK_SIZE:int = 512
+
+@pytest.fixture
+def state_model(run_dir) -> State_Model:
+    return load_cached_state_model("data/Combined_Data.csv","data/Baseline_Popularity.csv",year=2028,cache_root="cache")[0]
+
+def test_latin_hypercube_reduces_variance(state_model):
+    plain:dict = samplers.run_sampler(state_model,"monte_carlo",ROUNDS,seed=1,chunk_size=CHUNK_SIZE).report()
+    stratified:dict = samplers.run_sampler(state_model,"latin_hypercube",ROUNDS,seed=1,chunk_size=CHUNK_SIZE).report()
+    # Both estimate the same probability, the stratified one with the precision of well over ROUNDS plain rounds
+    assert stratified["estimates"]["republican_win"] == pytest.approx(plain["estimates"]["republican_win"],abs=0.02)
+    assert stratified["effective_sample_size"]["republican_win"] > 1.5*ROUNDS
+    assert stratified["effective_sample_size"]["republican_win"] > plain["effective_sample_size"]["republican_win"]
+
+@pytest.mark.parametrize("sampler",["monte_carlo","antithetic","latin_hypercube","importance"])
+def test_a_seed_reproduces_the_estimates(state_model,sampler):
+    reports:list[dict] = [samplers.run_sampler(state_model,sampler,2_048,seed=seed,pilot_rounds=2_048,chunk_size=CHUNK_SIZE).report() for seed in (4,4,5)]
+    assert reports[0] == reports[1]
+    assert reports[0]["estimates"] != reports[2]["estimates"]
+
+def test_sobol_without_scipy_names_the_missing_package(monkeypatch):
+    monkeypatch.setitem(sys.modules,"scipy.stats",None)
+    with pytest.raises(ImportError,match="scipy"):
+        samplers.sample_unit_points("sobol",np.random.default_rng(0),8)
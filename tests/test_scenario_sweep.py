@@ -0,0 +1,27 @@
+import os
+import pytest
+from xml_logging import XML_Logger
+from result_store import read_manifest
+from scenario_sweep import Scenario,expand_scenarios,run_sweep
+
+@pytest.mark.parametrize("name",["..",".","","a/b","../results","a b"])
+def test_rejects_names_that_are_not_plain_directory_names(name):
+    with pytest.raises(ValueError):
+        expand_scenarios({"scenarios": [{"name": name}]})
+
+def test_accepts_plain_names():
+    scenarios = expand_scenarios({"scenarios": [{"name": "high-turnout_2028.v2"}],"grid": {"rounds": [10,20]}})
+    assert [scenario.name for scenario in scenarios] == ["high-turnout_2028.v2_0000","high-turnout_2028.v2_0001"]
+    assert Scenario(name="query").name == "query"
+
+@pytest.mark.parametrize("parameters",[{"swing_ranges": {"rep_to_dem": [0.05,0.01]}},{"swing_ranges": {"rep_to_dem": [0.05]}},{"rounds": 0},{"rounds": -10}])
+def test_rejects_inverted_ranges_and_empty_runs(parameters):
+    with pytest.raises(ValueError):
+        Scenario(name="invalid",**parameters)
+
+def test_store_sweep_closes_every_partition(run_dir):
+    logger:XML_Logger = XML_Logger("scenario_sweep_logger","archive",log_retention_days=7,base_dir=os.getcwd())
+    # Smaller than a sink flush, so the rounds only reach the store when the sink is closed
+    scenarios:list[Scenario] = expand_scenarios({"scenarios": [{"name": "low","rounds": 30},{"name": "high","rounds": 45,"turnout_range": [0.8,0.9]}]})
+    run_sweep(scenarios,"sweep",logger,seed=2,store=True)
+    assert [sum(chunk["rounds"] for chunk in read_manifest(os.path.join("sweep",name))["chunks"]) for name in ("low","high")] == [30,45]
@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import shutil
+import pytest
+import numpy as np
+import simulator
+import shard_queue
+from xml_logging import XML_Logger
+from result_store import read_table
+
+# Three shards, the last one shorter than the others
+MAX_ROUND:int = 25_000
+SHARD_ROUNDS:int = 10_000
+SEED:int = 17
+
+@pytest.fixture
+def queue_dir(run_dir,monkeypatch):
+    monkeypatch.setattr(shard_queue,"CURRENT_DIRECTORY",str(run_dir))
+    shard_queue.init_queue("queue",MAX_ROUND,SEED,shard_rounds=SHARD_ROUNDS)
+    return "queue"
+
+def _logger() -> XML_Logger:
+    return XML_Logger("shard_queue_logger","archive",log_retention_days=7,base_dir=os.getcwd())
+
+def test_local_hosts_merge_to_the_single_host_results(queue_dir):
+    finished:list[int] = shard_queue.run_local(queue_dir,hosts=3)
+    assert sum(finished) == 3
+    report:dict = shard_queue.merge(queue_dir,"merged",_logger(),export=False,analyze=False)
+    assert report["missing_rounds"] == [] and report["duplicate_rounds"] == []
+    # Compared column by column rather than through export_csv, which takes tens of seconds at this size; the
+    # single-host store flushes different chunk boundaries, so the chunk files themselves differ
+    simulator.main(engine="batch",seed=SEED,max_round=MAX_ROUND,output="compact",store_dir="single")
+    for table in ("state","national"):
+        merged:dict[str,np.ndarray] = read_table("merged",table)
+        single:dict[str,np.ndarray] = read_table("single",table)
+        assert merged.keys() == single.keys()
+        for name,column in single.items():
+            assert merged[name].dtype == column.dtype and merged[name].tobytes() == column.tobytes()
+
+def test_expired_lease_is_taken_over(queue_dir):
+    shard:dict = shard_queue.read_plan(queue_dir)["shards"][0]
+    path:str = os.path.join(queue_dir,"leases",f"{shard['name']}.json")
+    with open(path,'w') as file:
+        json.dump({"owner": "other-host:1","acquired_at": time.time()-300,"expires_at": time.time()+60},file)
+    assert not shard_queue.try_lease(queue_dir,shard,"this-host:2",lease_seconds=60)
+    with open(path,'w') as file:
+        json.dump({"owner": "other-host:1","acquired_at": time.time()-300,"expires_at": time.time()-60},file)
+    assert shard_queue.try_lease(queue_dir,shard,"this-host:2",lease_seconds=60)
+    with open(path,'r') as file:
+        assert json.load(file)["owner"] == "this-host:2"
+    assert os.listdir(os.path.join(queue_dir,"leases")) == [f"{shard['name']}.json"]
+
+def test_work_waits_for_a_dead_hosts_lease_and_finishes_every_shard(queue_dir):
+    plan:dict = shard_queue.read_plan(queue_dir)
+    # A host that died holding the middle shard; its lease runs out after the other two shards are done
+    expires_at:float = time.time()+3
+    with open(os.path.join(queue_dir,"leases",f"{plan['shards'][1]['name']}.json"),'w') as file:
+        json.dump({"owner": "dead-host:1","acquired_at": time.time(),"expires_at": expires_at},file)
+    assert shard_queue.work(queue_dir,_logger(),lease_seconds=60) == 3
+    assert time.time() >= expires_at
+    assert all(shard_queue.segment_done(queue_dir,shard) for shard in plan["shards"])
+    assert os.listdir(os.path.join(queue_dir,"leases")) == []
+
+def test_merge_reports_missing_and_duplicate_rounds(queue_dir):
+    assert shard_queue.work(queue_dir,_logger()) == 3
+    segments_dir:str = os.path.join(queue_dir,"segments")
+    shutil.rmtree(os.path.join(segments_dir,shard_queue.shard_name(1)))
+    # A stray second copy of the last finished shard under another name
+    shutil.copytree(os.path.join(segments_dir,shard_queue.shard_name(2)),os.path.join(segments_dir,"shard_000002_copy"))
+    with pytest.raises(ValueError):
+        shard_queue.merge(queue_dir,"merged",_logger(),export=False,analyze=False)
+    with open(os.path.join(queue_dir,"merge_report.json"),'r') as file:
+        report:dict = json.load(file)
+    assert report["missing_rounds"] == [[10_001,20_000]]
+    assert report["duplicate_rounds"] == [[20_001,25_000]]
+    assert report == shard_queue.check_segments(queue_dir)[1]
+    assert not os.path.exists("merged")
@@ -0,0 +1,30 @@
+import re
+import pytest
+import numpy as np
+from state_model import State_Model
+
+ELECTORAL_MAP:dict[str,int] = {"Ohio": 17,"New Hampshire": 4,"Texas": 40}
+
+def _voter_data(states:list[str]) -> np.ndarray:
+    return np.array([[state,1_000*(index+1),2028] for index,state in enumerate(states)],dtype=object)
+
+def _party_data(states:list[str]) -> np.ndarray:
+    return np.array([[state,0.4+0.01*index,0.5-0.01*index,0.1] for index,state in enumerate(states)],dtype=object)
+
+def test_rows_are_aligned_by_state_name():
+    # The popularity file spells states with str.capitalize and lists them in another order
+    model:State_Model = State_Model.from_data(_voter_data(["Ohio","New Hampshire","Texas"]),_party_data(["Texas","New hampshire","Ohio"]),ELECTORAL_MAP)
+    assert model.states.tolist() == ["Ohio","New Hampshire","Texas"]
+    assert model.registered.tolist() == [1_000,2_000,3_000]
+    assert model.electoral.tolist() == [17,4,40]
+    assert model.baseline[:,0].tolist() == pytest.approx([0.42,0.41,0.40])
+
+@pytest.mark.parametrize("voter_states,party_states,message",[
+        (["Ohio","New Hampshire"],["Ohio","New Hampshire","Texas"],"missing from voter data: ['texas']"),
+        (["Ohio","New Hampshire","Texas"],["Ohio","Texas"],"missing from popularity data: ['new hampshire']"),
+        (["Ohio","New Hampshire","Texas","Utah"],["Ohio","New Hampshire","Texas","Utah"],"missing from electoral_votes.py: ['utah']"),
+        (["Ohio","Ohio","New Hampshire","Texas"],["Ohio","New Hampshire","Texas"],"duplicate states in voter data: ['ohio']")
+    ])
+def test_rejects_inputs_that_do_not_line_up(voter_states,party_states,message):
+    with pytest.raises(ValueError,match=re.escape(message)):
+        State_Model.from_data(_voter_data(voter_states),_party_data(party_states),ELECTORAL_MAP)
@@ -0,0 +1,28 @@
+import os
+import pytest
+import numpy as np
+import voter_registration_kff_merge as kff_merge
+from xml_logging import XML_Logger
+
+def _logger() -> XML_Logger:
+    return XML_Logger("voter_registration_kff_merge","archive",log_retention_days=7,base_dir=os.getcwd())
+
+def test_reproduces_the_committed_combined_data(run_dir,monkeypatch):
+    monkeypatch.setattr(kff_merge,"CURRENT_DIRECTORY",str(run_dir))
+    kff_merge.main(data_folder="data",output_file="Combined_Data.csv")
+    assert open("Combined_Data.csv",'rb').read() == open(os.path.join("data","Combined_Data.csv"),'rb').read()
+
+def test_batched_projection_matches_a_fit_per_series():
+    # Two states observed in different years land in different design-matrix groups
+    states:dict[str,dict[str,list[float]]] = {
+            "Ohio": {"year": [2016,2018,2020],"num_registered_voters": [7_000.0,7_200.0,7_500.0],"pct_registered_voters": [0.70,0.71,0.73],"num_votes_cast": [5_000.0,4_100.0,5_900.0],"pct_votes_cast": [0.5,0.4,0.6]},
+            "Utah": {"year": [2014,2018],"num_registered_voters": [1_500.0,1_700.0],"pct_registered_voters": [0.6,0.65],"num_votes_cast": [900.0,1_100.0],"pct_votes_cast": [0.4,0.5]}
+        }
+    observed:dict[str,dict[str,list[float]]] = {state: {key: list(values) for key,values in series.items()} for state,series in states.items()}
+    future_years:np.ndarray = np.arange(2025,2029)
+    projected:dict = kff_merge.predict_future(states,future_years,_logger())
+    for state,series in observed.items():
+        assert projected[state]["year"] == series["year"]+list(future_years)
+        for key in kff_merge.METRICS:
+            slope,intercept = np.polyfit(series["year"],series[key],1)
+            assert projected[state][key][len(series["year"]):] == pytest.approx(slope*future_years+intercept,rel=1e-9)
@@ -1,47 +1,46 @@
+import io
 import os
 import re
 import traceback
 from time import time
-from numpy import array,ndarray,arange
+from numpy import array,ndarray,arange,column_stack,linalg
 from xml_logging import XML_Logger
 from pandas import DataFrame,read_csv,concat
-from sklearn.linear_model import LinearRegression
+from concurrent.futures import ThreadPoolExecutor
 CURRENT_DIRECTORY:str = os.getcwd()
+METRICS:tuple[str,...] = ('num_registered_voters', 'num_votes_cast', 'pct_registered_voters', 'pct_votes_cast')
 
 def get_csv(file_name:str,logger:XML_Logger) -> DataFrame|None:
     try:
-        df:DataFrame|None = None
-        lines_to_skip:int = 0
+        # One pass over the file: note the Timeframe year and hand read_csv everything from the "Location" header on
+        year:int|None = None
+        header_line:int|None = None
         with open(file_name,'r') as file:
             lines:list[str] = file.readlines()
-            for line in lines:
-                if("Timeframe:" in line):
-                    year:int = int(re.search(r"\d+",line).group())
-                    num_lines:int = len(lines)
-        while((df is None)and(lines_to_skip < num_lines)):
-            try:
-                df:DataFrame|None = read_csv(file_name,skiprows=lines_to_skip)
-                if("Location" in df.columns):
-                    df["Year"] = year
-                    return df
-                else:
-                    raise Exception
-            except Exception as e:
-                df:DataFrame|None = None
-                lines_to_skip += 1
-        return None
+        for line_number,line in enumerate(lines):
+            if("Timeframe:" in line):
+                year = int(re.search(r"\d+",line).group())
+            elif(line.lstrip('\ufeff').startswith('"Location"') or line.lstrip('\ufeff').startswith('Location,')):
+                header_line = line_number
+                break
+        if((year is None)or(header_line is None)):
+            return None
+        df:DataFrame = read_csv(io.StringIO(''.join(lines[header_line:])))
+        df["Year"] = year
+        return df
     except Exception as e:
         logger.log_to_xml(message=f"Failed to get data from {file_name}. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
         return None
 
 def get_all_csvs(data_folder:str,logger:XML_Logger) -> ndarray|None:
     try:
-        dfs:list[DataFrame] = []
-        for file in os.scandir(data_folder):
-            if file.is_file() and file.name.endswith('.csv') and not('Combine' in file.name):
-                df:DataFrame|None = get_csv(file_name=os.path.join(data_folder,file.name),logger=logger)
-                if df is not None:
-                    dfs.append(df.iloc[1:-6])
+        file_names:list[str] = sorted(
+                os.path.join(data_folder,file.name) for file in os.scandir(data_folder)
+                if file.is_file() and file.name.endswith('.csv') and file.name.startswith('raw_data')
+            )
+        with ThreadPoolExecutor(max_workers=max(len(file_names),1)) as executor:
+            frames:list[DataFrame|None] = list(executor.map(lambda file_name: get_csv(file_name=file_name,logger=logger),file_names))
+        dfs:list[DataFrame] = [df.iloc[1:-6] for df in frames if df is not None]
         return concat(dfs).to_numpy()
     except Exception as e:
         logger.log_to_xml(message=f"Error getting all CSV data in {data_folder}. Terminating program. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="CRITICAL")
@@ -66,14 +65,24 @@ def convert_data_to_dict(data:ndarray,logger:XML_Logger) -> dict[str,dict[str,li
 
 def predict_future(states:dict[str,dict[str,list[int|float]]], future_years:list[int]|ndarray, logger:XML_Logger) -> dict[str,dict[str,list[int|float]]]:
     try:
+        # States observed in the same years share a design matrix, so every state x metric series in such a group
+        # is fitted with one least-squares solve. The arithmetic follows LinearRegression (centered x and y, intercept
+        # recovered afterwards) so projections round to the same thousands as before.
+        groups:dict[tuple,list[str]] = {}
         for state in states:
-            years = array(states[state]['year']).reshape(-1, 1)
-            for key in ['num_registered_voters', 'num_votes_cast', 'pct_registered_voters', 'pct_votes_cast']:
-                values = array(states[state][key])
-                model = LinearRegression()
-                model.fit(years, values)
-                predictions = model.predict(array(future_years).reshape(-1, 1))
-                states[state][key].extend(predictions)
+            groups.setdefault(tuple(states[state]['year']),[]).append(state)
+        future:ndarray = array(future_years,dtype=float).reshape(-1, 1)
+        for years,group in groups.items():
+            observed:ndarray = array(years,dtype=float).reshape(-1, 1)
+            values:ndarray = column_stack([array(states[state][key],dtype=float) for state in group for key in METRICS])
+            observed_mean:ndarray = observed.mean(axis=0)
+            values_mean:ndarray = values.mean(axis=0)
+            slopes:ndarray = linalg.lstsq(observed-observed_mean,values-values_mean,rcond=None)[0]
+            intercepts:ndarray = values_mean-observed_mean@slopes
+            predictions:ndarray = future@slopes+intercepts
+            for state_index,state in enumerate(group):
+                for metric_index,key in enumerate(METRICS):
+                    states[state][key].extend(predictions[:,state_index*len(METRICS)+metric_index])
                 states[state]['year'].extend(future_years)
         return states
     except Exception as e:
@@ -116,10 +125,10 @@ def convert_dict_to_data(states:dict[str,dict[str,list[int|float]]], logger:XML_
         logger.log_to_xml(message=f"Failed to convert dictionary back to list. Official error: {traceback.format_exc()}",basepath=logger.base_dir,status="ERROR")
         return None
 
-def main():
+def main(data_folder:str=os.path.join(CURRENT_DIRECTORY,'data'),output_file:str="data/Combined_Data.csv",last_year:int=2032):
     logger:XML_Logger = XML_Logger("voter_registration_kff_merge","archive",log_retention_days=7,base_dir=CURRENT_DIRECTORY)
-    future_years:ndarray = arange(2025,2033)
-    data:ndarray|None = get_all_csvs(data_folder=os.path.join(CURRENT_DIRECTORY,'data'),logger=logger)
+    future_years:ndarray = arange(2025,last_year+1)
+    data:ndarray|None = get_all_csvs(data_folder=data_folder,logger=logger)
     if data is None:
         return
     data:dict[str,dict[str,list[int|float]]]|None = convert_data_to_dict(data=data,logger=logger)
@@ -133,7 +142,7 @@ def main():
         return
     df:DataFrame = DataFrame(data)
     df.columns = ['State','Number of Registered Voters','Percent of Voters to Total Population', 'Number of Votes Cast', 'Percent of Votes Cast to Total Population', 'Year']
-    df.to_csv("data/Combined_Data.csv",index=False)
+    df.to_csv(output_file,index=False)
     logger.save_variable_info(locals_dict=locals(),variable_save_path=os.path.join(CURRENT_DIRECTORY,'voter_registration_kff_merge_variables.json'))
 if __name__ == "__main__":
     main()